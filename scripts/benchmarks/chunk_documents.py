@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Benchmark chunking the knowledge documents of generate's seed examples.
+
+Builds --size-mb of synthetic markdown split into --document-sets sets, each
+shared by --seeds seed examples like the seed examples of a knowledge file.
+The original loop chunks the documents of every seed example, the new one
+chunks each set of documents once.
+
+    python scripts/benchmarks/chunk_documents.py --size-mb 100
+"""
+
+# Standard
+import argparse
+import random
+import time
+import tracemalloc
+
+# Third Party
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# First Party
+from instructlab.utils import (
+    DEFAULT_CHUNK_OVERLAP,
+    chunk_document,
+    num_chars_from_tokens,
+    num_tokens_from_words,
+)
+
+WORDS = (
+    "the a of to in is for with about between river mountain history science "
+    "poem story recipe number language country music planet animal city ocean"
+).split()
+
+
+def make_document(size, rng):
+    paragraphs = []
+    length = 0
+    while length < size:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(10, 300))]
+        paragraph = "# Section\n\n" if rng.random() < 0.05 else ""
+        paragraph += " ".join(words) + ("\n\n" if rng.random() < 0.8 else "\n")
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+    return "".join(paragraphs)
+
+
+def legacy_chunk_document(documents, chunk_word_count):
+    content = []
+    text_splitter = RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", " "],
+        chunk_size=num_chars_from_tokens(num_tokens_from_words(chunk_word_count)),
+        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+    )
+    for docs in documents:
+        temp = text_splitter.create_documents([docs])
+        content.extend([item.page_content for item in temp])
+    return content
+
+
+def legacy_chunk_seeds(seeds, chunk_word_count):
+    return [legacy_chunk_document(seed, chunk_word_count) for seed in seeds]
+
+
+def chunk_seeds(seeds, chunk_word_count, server_ctx_size):
+    chunked = {}
+    results = []
+    for documents in seeds:
+        key = tuple(documents)
+        if key not in chunked:
+            chunked[key] = chunk_document(documents, server_ctx_size, chunk_word_count)
+        results.append(chunked[key])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=100)
+    parser.add_argument("--document-sets", type=int, default=10)
+    parser.add_argument("--documents-per-set", type=int, default=2)
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--chunk-word-count", type=int, default=1000)
+    parser.add_argument("--server-ctx-size", type=int, default=4096)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Report peak Python allocations, which makes both runs slower.",
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    num_documents = args.document_sets * args.documents_per_set
+    document_size = int(args.size_mb * 2**20 / num_documents)
+    document_sets = [
+        [make_document(document_size, rng) for _ in range(args.documents_per_set)]
+        for _ in range(args.document_sets)
+    ]
+    seeds = [list(documents) for documents in document_sets for _ in range(args.seeds)]
+
+    print(f"{'':>8} {'time (s)':>9} {'peak (MB)':>10} {'chunks':>9}")
+    results = {}
+    for name, chunk_fn in (
+        ("legacy", lambda: legacy_chunk_seeds(seeds, args.chunk_word_count)),
+        (
+            "new",
+            lambda: chunk_seeds(seeds, args.chunk_word_count, args.server_ctx_size),
+        ),
+    ):
+        if args.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        chunks = chunk_fn()
+        duration = time.perf_counter() - start
+        peak = "-"
+        if args.trace_memory:
+            peak = f"{tracemalloc.get_traced_memory()[1] / 2**20:.0f}"
+            tracemalloc.stop()
+        results[name] = chunks
+        total = sum(len(c) for c in chunks)
+        print(f"{name:>8} {duration:>9.2f} {peak:>10} {total:>9}")
+        del chunks
+
+    print(f"same chunks: {results['new'] == results['legacy']}")
+
+
+if __name__ == "__main__":
+    main()
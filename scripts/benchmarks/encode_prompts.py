@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Benchmark prompt encoding for generate.
+
+Compares the original encode_prompt, which compiles the jinja2 template and
+normalizes the seed instructions for every prompt, with PromptEncoder and
+encode_prompt, which keeps a PromptEncoder per template. All must produce
+identical prompts.
+
+    python scripts/benchmarks/encode_prompts.py --prompts 10000
+"""
+
+# Standard
+import argparse
+import random
+import re
+import time
+
+# Third Party
+from jinja2 import Template
+
+# First Party
+from instructlab.generator.generate_data import (
+    DEFAULT_PROMPT_TEMPLATE_MERLINITE,
+    PromptEncoder,
+    encode_prompt,
+)
+
+
+def legacy_encode_prompt(prompt_instructions, prompt):
+    idx = 0
+    document = None
+    document_list = prompt_instructions[0].get("document")
+
+    if document_list:
+        document = random.choice(document_list)
+
+    prompt = Template(prompt).render(
+        taxonomy=prompt_instructions[0]["taxonomy_path"],
+        task_description=prompt_instructions[0]["task_description"],
+        document=document,
+    )
+
+    for idx, task_dict in enumerate(prompt_instructions):
+        instruction = re.sub(r"\s+", " ", task_dict["instruction"]).strip().rstrip(":")
+        prompt_input = task_dict["input"]
+        prompt_input = "<noinput>" if prompt_input.lower() == "" else prompt_input
+        prompt += f"* Task {idx + 1}\n"
+        prompt += f"** Instruction\n{instruction}\n"
+        prompt += f"** Input\n{prompt_input}\n"
+        prompt += f"** Output\n{task_dict['output']}\n"
+    prompt += f"* Task {idx + 2}\n"
+    return prompt
+
+
+def make_pool(num_taxonomies, seeds_per_taxonomy, num_documents):
+    pool = []
+    for t in range(num_taxonomies):
+        documents = [
+            f"Document {d} of taxonomy {t}. " * 200 for d in range(num_documents)
+        ]
+        for n in range(seeds_per_taxonomy):
+            pool.append(
+                {
+                    "instruction": f"Explain  the meaning of\n seed {n}   in {t}:",
+                    "input": "" if n % 2 else f"some input {n}",
+                    "output": f"The answer to seed {n} in taxonomy {t}. " * 10,
+                    "taxonomy_path": f"knowledge->topic_{t}",
+                    "task_description": f"Topic {t}",
+                    "document": documents if t % 2 else None,
+                }
+            )
+    return pool
+
+
+def encode(encode_fn, pool, num_prompts, num_prompt_instructions, seed):
+    rng = random.Random(seed)
+    random.seed(seed)
+    by_taxonomy = {}
+    for entry in pool:
+        by_taxonomy.setdefault(entry["taxonomy_path"], []).append(entry)
+    taxonomies = sorted(by_taxonomy)
+    prompts = []
+    start = time.perf_counter()
+    for i in range(num_prompts):
+        seeds = by_taxonomy[taxonomies[i % len(taxonomies)]]
+        prompts.append(encode_fn(rng.sample(seeds, num_prompt_instructions)))
+    return prompts, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=10000)
+    parser.add_argument("--taxonomies", type=int, default=20)
+    parser.add_argument("--seeds", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=3)
+    parser.add_argument("--num-prompt-instructions", type=int, default=2)
+    args = parser.parse_args()
+
+    template = DEFAULT_PROMPT_TEMPLATE_MERLINITE.strip() + "\n"
+    pool = make_pool(args.taxonomies, args.seeds, args.documents)
+    encoder = PromptEncoder(template)
+    results = {}
+    for name, encode_fn in (
+        ("legacy", lambda p: legacy_encode_prompt(p, template)),
+        ("encoder", encoder.encode),
+        ("wrapper", lambda p: encode_prompt(p, template)),
+    ):
+        results[name] = encode(
+            encode_fn, pool, args.prompts, args.num_prompt_instructions, seed=0
+        )
+    assert results["legacy"][0] == results["encoder"][0], "prompts differ"
+    assert results["legacy"][0] == results["wrapper"][0], "prompts differ"
+
+    for name, (_, duration) in results.items():
+        print(f"{name:>8}: {args.prompts / duration:>10.0f} prompts/s")
+    print(f" speedup: {results['legacy'][1] / results['encoder'][1]:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
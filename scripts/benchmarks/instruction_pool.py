@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Benchmark the instruction pool of generate for a long run.
+
+Accepts --instructions generated instructions, --per-round per round, into
+the pools of --taxonomies taxonomy paths, selecting the pool of a round and
+sampling its prompt instructions first. The original loop keeps dicts and
+filters seed_instruction_data + machine_instruction_data every round, the
+new one keeps InstructionRecords in a per-taxonomy index. Each runs in a
+fresh process so that its peak RSS is its own.
+
+    python scripts/benchmarks/instruction_pool.py --instructions 50000
+"""
+
+# Standard
+import argparse
+import random
+import resource
+import subprocess
+import sys
+import time
+
+# First Party
+from instructlab.generator.output import InstructionRecord
+
+
+def make_instruction(rng, taxonomy_path, n, document):
+    return {
+        "instruction": f"Question {n} about {taxonomy_path}? "
+        + " ".join(str(rng.random()) for _ in range(4)),
+        "input": "",
+        "output": f"Answer {n}. " + " ".join(str(rng.random()) for _ in range(12)),
+        "taxonomy_path": taxonomy_path,
+        "task_description": f"Teach the model about {taxonomy_path}",
+        "document": document,
+    }
+
+
+def legacy_run(seeds, generated, per_round, rng):
+    taxonomy_paths = sorted(set(e["taxonomy_path"] for e in seeds))
+    machine_instruction_data = []
+    for request_idx, start in enumerate(range(0, len(generated), per_round)):
+        selected_taxonomy = taxonomy_paths[request_idx % len(taxonomy_paths)]
+        instruction_data_pool = [
+            e
+            for e in seeds + machine_instruction_data
+            if e["taxonomy_path"] == selected_taxonomy
+        ]
+        rng.sample(instruction_data_pool, 2)
+        for instruction, prompt_input, output in generated[start : start + per_round]:
+            machine_instruction_data.append(
+                {
+                    "instruction": instruction,
+                    "input": prompt_input,
+                    "output": output,
+                    "taxonomy_path": selected_taxonomy,
+                    "task_description": instruction_data_pool[0]["task_description"],
+                    "document": instruction_data_pool[0]["document"],
+                }
+            )
+    return machine_instruction_data
+
+
+def run(seeds, generated, per_round, rng):
+    seeds = [InstructionRecord.from_dict(e) for e in seeds]
+    taxonomy_paths = sorted(set(e.taxonomy_path for e in seeds))
+    machine_instruction_data = []
+    pools = {}
+    for entry in seeds:
+        pools.setdefault(entry.taxonomy_path, []).append(entry)
+    for request_idx, start in enumerate(range(0, len(generated), per_round)):
+        selected_taxonomy = taxonomy_paths[request_idx % len(taxonomy_paths)]
+        pool = pools[selected_taxonomy]
+        rng.sample(pool, 2)
+        for instruction, prompt_input, output in generated[start : start + per_round]:
+            entry = InstructionRecord(
+                instruction,
+                prompt_input,
+                output,
+                selected_taxonomy,
+                pool[0].task_description,
+                pool[0].document,
+            )
+            machine_instruction_data.append(entry)
+            pool.append(entry)
+    return machine_instruction_data
+
+
+def measure(args):
+    rng = random.Random(0)
+    document = [f"{rng.getrandbits(64):016x}" for _ in range(8)]
+    taxonomy_paths = [f"knowledge->topic_{t}" for t in range(args.taxonomies)]
+    seeds = [
+        make_instruction(rng, path, n, document)
+        for path in taxonomy_paths
+        for n in range(5)
+    ]
+
+    # the fields parsed from the responses, shared by both runs' records
+    generated = []
+    for n in range(args.instructions):
+        entry = make_instruction(rng, "", n, document)
+        generated.append((entry["instruction"], entry["input"], entry["output"]))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    run_fn = legacy_run if args.mode == "legacy" else run
+    start = time.perf_counter()
+    kept = run_fn(seeds, generated, args.per_round, rng)
+    duration = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{duration} {baseline} {peak} {len(kept)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instructions", type=int, default=50000)
+    parser.add_argument("--per-round", type=int, default=10)
+    parser.add_argument("--taxonomies", type=int, default=20)
+    parser.add_argument("--mode", choices=["legacy", "new"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        measure(args)
+        return
+
+    # records (MB) is the peak RSS added by the run, over the strings of the
+    # instructions, which are the same for both
+    print(f"{'':>8} {'time (s)':>9} {'peak RSS (MB)':>14} {'records (MB)':>13}")
+    for mode in ("legacy", "new"):
+        result = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--mode",
+                mode,
+                "--instructions",
+                str(args.instructions),
+                "--per-round",
+                str(args.per_round),
+                "--taxonomies",
+                str(args.taxonomies),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        duration, baseline, peak, kept = result.stdout.split()
+        assert int(kept) == args.instructions
+        # ru_maxrss is in kilobytes on Linux
+        print(
+            f"{mode:>8} {float(duration):>9.2f} {int(peak) / 1024:>14.1f} "
+            f"{(int(peak) - int(baseline)) / 1024:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
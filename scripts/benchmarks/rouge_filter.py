@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Benchmark ROUGE-L filtering of one generate round against a growing corpus.
+
+Compares the original approach (a new process pool per candidate instruction)
+with RougeLScorer, which scores a whole round in one call, with and without
+its OverlapIndex prefilter.
+
+    python scripts/benchmarks/rouge_filter.py --sizes 100 1000 5000
+"""
+
+# Standard
+from functools import partial
+import argparse
+import multiprocessing
+import random
+import time
+
+# Third Party
+from rouge_score import rouge_scorer
+
+# First Party
+from instructlab.config import DEFAULT_MULTIPROCESSING_START_METHOD
+from instructlab.generator.similarity import RougeLScorer
+
+WORDS = (
+    "what how why explain describe list write summarize compare the a of to in "
+    "is for with about between river mountain history science poem story recipe "
+    "number language country music planet animal city ocean computer"
+).split()
+
+
+def make_instructions(count, rng):
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+        for _ in range(count)
+    ]
+
+
+def legacy_filter(corpus_tokens, candidates, threshold, num_cpus):
+    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
+    mpctx = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD)
+    decisions = []
+    for candidate in candidates:
+        tokens = scorer._tokenizer.tokenize(candidate)
+        with mpctx.Pool(num_cpus) as pool:
+            scores = pool.map(
+                partial(rouge_scorer._score_lcs, tokens),
+                corpus_tokens,
+            )
+        pool.join()
+        keep = max(score.fmeasure for score in scores) <= threshold
+        decisions.append(keep)
+        if keep:
+            corpus_tokens.append(tokens)
+    return decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--candidates", type=int, default=25)
+    parser.add_argument("--num-cpus", type=int, default=4)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    print(
+        f"{'corpus':>8} {'legacy (s)':>12} {'scorer (s)':>12} {'indexed (s)':>12} "
+        f"{'speedup':>8}"
+    )
+    for size in args.sizes:
+        rng = random.Random(size)
+        corpus = make_instructions(size, rng)
+        candidates = make_instructions(args.candidates, rng)
+
+        times = []
+        decisions = []
+        for use_index in (False, True):
+            with RougeLScorer(
+                corpus, num_cpus=args.num_cpus, use_index=use_index
+            ) as scorer:
+                legacy_corpus = scorer.instruction_tokens[:]
+                start = time.perf_counter()
+                kept = scorer.filter(candidates, args.threshold)
+                times.append(time.perf_counter() - start)
+            decisions.append([tokens is not None for tokens in kept])
+        scorer_time = times[0]
+        indexed_time = times[1]
+        assert decisions[0] == decisions[1], "indexed decisions differ"
+
+        if args.skip_legacy:
+            print(
+                f"{size:>8} {'-':>12} {scorer_time:>12.3f} {indexed_time:>12.3f} "
+                f"{'-':>8}"
+            )
+            continue
+        start = time.perf_counter()
+        legacy_decisions = legacy_filter(
+            legacy_corpus, candidates, args.threshold, args.num_cpus
+        )
+        legacy_time = time.perf_counter() - start
+        assert legacy_decisions == decisions[0], "decisions differ"
+        print(
+            f"{size:>8} {legacy_time:>12.3f} {scorer_time:>12.3f} "
+            f"{indexed_time:>12.3f} {legacy_time / indexed_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Benchmark the vectorized ROUGE-L LCS kernel against per-pair scoring.
+
+Scores one candidate instruction against a corpus, either with rouge_score's
+``_score_lcs`` mapped over every (candidate, entry) pair on a process pool, or
+with ``lcs_scores`` against the corpus's token-id matrix. Both must produce
+identical precision, recall and fmeasure.
+
+    python scripts/benchmarks/rouge_lcs.py --sizes 1000 10000 100000
+"""
+
+# Standard
+from functools import partial
+import argparse
+import multiprocessing
+import random
+import time
+
+# Third Party
+from rouge_score import rouge_scorer
+
+# First Party
+from instructlab.config import DEFAULT_MULTIPROCESSING_START_METHOD
+from instructlab.generator.similarity import TokenMatrix, lcs_scores
+
+WORDS = (
+    "what how why explain describe list write summarize compare the a of to in "
+    "is for with about between river mountain history science poem story recipe "
+    "number language country music planet animal city ocean computer"
+).split()
+
+
+def make_tokens(count, rng):
+    return [
+        [rng.choice(WORDS) for _ in range(rng.randint(6, 20))] for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--candidates", type=int, default=5)
+    parser.add_argument("--num-cpus", type=int, default=4)
+    args = parser.parse_args()
+
+    mpctx = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD)
+    print(f"{'corpus':>8} {'pool.map (s)':>14} {'kernel (s)':>12} {'speedup':>8}")
+    with mpctx.Pool(args.num_cpus) as pool:
+        for size in args.sizes:
+            rng = random.Random(size)
+            corpus = make_tokens(size, rng)
+            candidates = make_tokens(args.candidates, rng)
+            matrix = TokenMatrix()
+            for tokens in corpus:
+                matrix.add(tokens)
+
+            start = time.perf_counter()
+            expected = [
+                pool.map(partial(rouge_scorer._score_lcs, tokens), corpus)
+                for tokens in candidates
+            ]
+            pool_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scores = [
+                lcs_scores(matrix.encode(tokens), matrix.matrix, matrix.lengths)
+                for tokens in candidates
+            ]
+            kernel_time = time.perf_counter() - start
+
+            for pair_scores, (precision, recall, fmeasure) in zip(expected, scores):
+                assert [s.precision for s in pair_scores] == list(precision)
+                assert [s.recall for s in pair_scores] == list(recall)
+                assert [s.fmeasure for s in pair_scores] == list(fmeasure)
+            print(
+                f"{size:>8} {pool_time:>14.3f} {kernel_time:>12.3f} "
+                f"{pool_time / kernel_time:>7.1f}x"
+            )
+    pool.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Benchmark get_taxonomy_diff on a fork far ahead of its base branch.
+
+Builds a synthetic taxonomy repository where HEAD is --commits commits ahead
+of main, each commit adding a skill, and compares the original
+implementation, which runs `git branch -a --contains` for each commit from
+HEAD back to main, with get_taxonomy_diff. Both must find the same files.
+
+    python scripts/benchmarks/taxonomy_diff.py --commits 1000
+"""
+
+# Standard
+import argparse
+import re
+import subprocess
+import tempfile
+import time
+
+# Third Party
+import git
+
+# First Party
+from instructlab.utils import get_taxonomy_diff, istaxonomyfile
+
+
+def legacy_get_taxonomy_diff(repo, base):
+    repo = git.Repo(repo)
+    untracked_files = [u for u in repo.untracked_files if istaxonomyfile(u)]
+
+    if "/" in base:
+        re_git_branch = re.compile(f"remotes/{base}$", re.MULTILINE)
+    else:
+        re_git_branch = re.compile(f"{base}$", re.MULTILINE)
+
+    head_commit = None
+    current_commit = repo.commit("HEAD")
+    while not head_commit:
+        branches = repo.git.branch("-a", "--contains", current_commit.hexsha)
+        if re_git_branch.findall(branches):
+            head_commit = current_commit
+            break
+        current_commit = current_commit.parents[0]
+
+    modified_files = [
+        d.b_path
+        for d in head_commit.diff(None)
+        if not d.deleted_file and istaxonomyfile(d.b_path)
+    ]
+    return list(set(untracked_files + modified_files))
+
+
+def make_repo(path, base_commits, commits):
+    """Create a repository with main, origin/main and a fork ahead of them."""
+    stream = []
+    mark = 0
+
+    def commit(branch, files, parent=None):
+        nonlocal mark
+        mark += 1
+        message = f"commit {mark}"
+        stream.append(f"commit refs/heads/{branch}\nmark :{mark}\n")
+        stream.append(f"committer Bench <bench@example.com> {mark} +0000\n")
+        stream.append(f"data {len(message)}\n{message}\n")
+        if parent is not None:
+            stream.append(f"from :{parent}\n")
+        for file_path, contents in files:
+            stream.append(f"M 644 inline {file_path}\ndata {len(contents)}\n")
+            stream.append(f"{contents}\n")
+        return mark
+
+    skill = "version: 2\ntask_description: benchmark\n"
+    parent = None
+    for i in range(base_commits):
+        parent = commit(
+            "main", [(f"compositional_skills/base{i}/qna.yaml", skill)], parent
+        )
+    base = parent
+    for i in range(commits):
+        parent = commit(
+            "fork", [(f"compositional_skills/fork{i}/qna.yaml", skill)], parent
+        )
+    stream.append(f"reset refs/remotes/origin/main\nfrom :{base}\n\n")
+
+    subprocess.run(["git", "init", "-q", "-b", "main", path], check=True)
+    subprocess.run(
+        ["git", "-C", path, "fast-import", "--quiet"],
+        input="".join(stream).encode("utf-8"),
+        check=True,
+    )
+    subprocess.run(["git", "-C", path, "checkout", "-q", "fork"], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=1000)
+    parser.add_argument("--base-commits", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        make_repo(path, args.base_commits, args.commits)
+        print(f"{'base':>12} {'legacy (s)':>11} {'new (s)':>9} {'speedup':>8}")
+        for base in ("main", "origin/main"):
+            start = time.perf_counter()
+            expected = legacy_get_taxonomy_diff(path, base)
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            files = get_taxonomy_diff(path, base)
+            new_time = time.perf_counter() - start
+
+            assert sorted(files) == sorted(expected), "file lists differ"
+            assert len(files) == args.commits
+            print(
+                f"{base:>12} {legacy_time:>11.3f} {new_time:>9.3f} "
+                f"{legacy_time / new_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
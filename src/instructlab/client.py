@@ -4,7 +4,7 @@
 from typing import Optional
 
 # Third Party
-from openai import OpenAI, OpenAIError
+from openai import DEFAULT_MAX_RETRIES, OpenAI, OpenAIError
 import httpx
 
 # Local
@@ -22,6 +22,7 @@ def list_models(
     tls_client_cert: Optional[str] = None,
     tls_client_key: Optional[str] = None,
     tls_client_passwd: Optional[str] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
 ):
     """List models from OpenAI-compatible server"""
     try:
@@ -32,6 +33,7 @@ def list_models(
             base_url=api_base,
             api_key=api_key,
             timeout=DEFAULT_CONNECTION_TIMEOUT,
+            max_retries=max_retries,
             http_client=httpx.Client(cert=cert, verify=verify),
         )
         return client.models.list()
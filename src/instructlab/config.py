@@ -1,12 +1,13 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
-from typing import Optional
+from typing import List, Optional
 
 # Third Party
 from pydantic import (
     BaseModel,
     ConfigDict,
+    NonNegativeInt,
     PositiveInt,
     StrictStr,
     ValidationError,
@@ -108,6 +109,20 @@ class _generate(BaseModel):
     seed_file: Optional[StrictStr] = "seed_tasks.json"
 
 
+class _serve_model(BaseModel):
+    """Class describing a model served next to serve's model_path."""
+
+    # model configuration
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
+
+    # required fields
+    model_path: StrictStr
+
+    # optional fields
+    # defaults to the model family serve is given
+    model_family: Optional[StrictStr] = None
+
+
 class _serve(BaseModel):
     """Class describing configuration of the serve sub-command."""
 
@@ -121,6 +136,35 @@ class _serve(BaseModel):
     host_port: Optional[StrictStr] = "127.0.0.1:8000"
     gpu_layers: Optional[int] = -1
     max_ctx_size: Optional[PositiveInt] = 4096
+    # requests waiting for the model while it serves another, 0 serves a
+    # single client at a time and closes every connection. `ilab generate`
+    # sends up to max_queue_size + 1 requests at once to the local server, so
+    # the default queues what it sends with its default batch size and more
+    max_queue_size: Optional[NonNegativeInt] = 16
+    # seconds idle connections are kept open when max_queue_size is set
+    keep_alive_timeout: Optional[NonNegativeInt] = 5
+    # more models to serve, requests choose one with their model field
+    models: Optional[List[_serve_model]] = []
+    # models kept loaded, the least recently used is unloaded beyond them
+    max_loaded_models: Optional[PositiveInt] = 1
+    # total size of the files of the loaded models, in MiB
+    max_loaded_size_mb: Optional[PositiveInt] = None
+    # keep llama.cpp's state after each prompt in "ram" or on "disk", so
+    # that prompts sharing its prefix don't evaluate the prefix again
+    prompt_cache: Optional[StrictStr] = None
+    # size of the prompt cache of each model, in MiB
+    prompt_cache_size_mb: Optional[PositiveInt] = 2048
+    # chat and generate leave the server they start running for later
+    # invocations, until it served no request for daemon_idle_timeout seconds
+    daemon: Optional[bool] = False
+    daemon_idle_timeout: Optional[PositiveInt] = 600
+
+    @field_validator("prompt_cache")
+    @classmethod
+    def validate_prompt_cache(cls, v):
+        if v is not None and v not in ("ram", "disk"):
+            raise ValueError(f"'{v}' is not a prompt cache type: ram or disk")
+        return v
 
     def api_base(self):
         """Returns server API URL, based on the configured host and port"""
@@ -0,0 +1,227 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from pathlib import Path
+from typing import Any, Dict, Optional
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Local
+from .client import ClientException, list_models
+from .config import get_api_base
+from .server import (
+    STARTUP_PROGRESS_INTERVAL,
+    ServerException,
+    server,
+    temp_server_kwargs,
+)
+from .taxonomy_cache import cache_home
+
+
+def daemon_dir() -> Path:
+    """Return the directory daemons register in."""
+    return cache_home() / "daemon"
+
+
+def daemon_key(kwargs: Dict[str, Any]) -> str:
+    """Return a digest of the model file and the settings a daemon serves it with."""
+    model_path = Path(kwargs["model_path"]).resolve()
+    try:
+        stat = model_path.stat()
+        model_file = [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        model_file = None
+    settings = dict(kwargs, model_path=str(model_path), model_file=model_file)
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def read_pidfile(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_pidfile(path: Path, entry: Dict[str, Any]):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class DaemonRegistration:
+    """Stands in for the queue server() reports to, in a daemon.
+
+    server() puts the port it listens on once it loaded the model, which
+    registers the daemon in its pidfile along with its pid and key, or the
+    exception it failed with, which is written there for the invocation
+    starting the daemon. Closing it when the server exits unregisters the
+    daemon.
+    """
+
+    def __init__(self, pidfile: Path, key: str, host: str):
+        self.pidfile = pidfile
+        self.key = key
+        self.host = host
+        self.registered = False
+
+    def put(self, message):
+        entry: Dict[str, Any] = {"pid": os.getpid()}
+        if isinstance(message, BaseException):
+            entry["error"] = str(message)
+        else:
+            entry.update(host=self.host, port=message, model_hash=self.key)
+            self.registered = True
+        write_pidfile(self.pidfile, entry)
+
+    def close(self):
+        if not self.registered:
+            return
+        self.registered = False
+        entry = read_pidfile(self.pidfile)
+        # a daemon started since, if this one stopped answering, is kept
+        if entry and entry.get("pid") == os.getpid():
+            self.pidfile.unlink(missing_ok=True)
+
+    def join_thread(self):
+        pass
+
+
+def wait_for_daemon(logger, process, pidfile: Path, timeout) -> Dict[str, Any]:
+    """Wait for a daemon to load its model, return the entry it registered."""
+    start = time.monotonic()
+    reported = start
+    while True:
+        entry = read_pidfile(pidfile)
+        if entry and entry.get("pid") == process.pid:
+            if "error" in entry:
+                process.wait()
+                pidfile.unlink(missing_ok=True)
+                raise ServerException(entry["error"])
+            return entry
+        if process.poll() is not None:
+            raise ServerException(
+                f"server daemon exited with code {process.returncode}"
+            )
+        now = time.monotonic()
+        if now - start >= timeout:
+            process.terminate()
+            process.wait()
+            raise ServerException(f"server daemon not ready after {timeout} seconds")
+        if now - reported >= STARTUP_PROGRESS_INTERVAL:
+            reported = now
+            logger.info(
+                f"Waiting for the server to load the model ({now - start:.0f}s)..."
+            )
+        time.sleep(0.1)
+
+
+def ensure_daemon(
+    logger,
+    serve_config,
+    tls_insecure,
+    tls_client_cert,
+    tls_client_key,
+    tls_client_passwd,
+    model_family,
+    startup_timeout,
+) -> str:
+    """Return the URL of the daemon serving the model, starting one if needed.
+
+    A daemon is a server left running after the invocation that started it,
+    until it served no request for serve_config.daemon_idle_timeout seconds.
+    Daemons serving the same model file with the same settings are looked
+    up by their key, and starting one is locked so that concurrent
+    invocations share it.
+    """
+    kwargs = temp_server_kwargs(serve_config, model_family)
+    key = daemon_key(kwargs)
+    directory = daemon_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    pidfile = directory / f"{key}.json"
+
+    with open(directory / f"{key}.lock", "w", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        entry = read_pidfile(pidfile)
+        if entry and "port" in entry and is_running(entry["pid"]):
+            api_base = get_api_base(f"{entry['host']}:{entry['port']}")
+            try:
+                # pylint: disable=duplicate-code
+                list_models(
+                    api_base=api_base,
+                    tls_insecure=tls_insecure,
+                    tls_client_cert=tls_client_cert,
+                    tls_client_key=tls_client_key,
+                    tls_client_passwd=tls_client_passwd,
+                    max_retries=0,
+                )
+                # pylint: enable=duplicate-code
+                logger.debug(f"Using the server daemon at {api_base}.")
+                return api_base
+            except ClientException:
+                logger.debug(f"Server daemon at {api_base} is not answering.")
+        pidfile.unlink(missing_ok=True)
+
+        command = [
+            sys.executable,
+            "-m",
+            "instructlab.daemon",
+            key,
+            json.dumps(dict(kwargs, idle_timeout=serve_config.daemon_idle_timeout)),
+        ]
+        with open(directory / f"{key}.log", "ab") as log:
+            # a session of its own, so that it outlives this invocation
+            # pylint: disable=consider-using-with
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+            )
+        entry = wait_for_daemon(logger, process, pidfile, startup_timeout)
+
+    api_base = get_api_base(f"{entry['host']}:{entry['port']}")
+    logger.info(
+        f"Started a server at {api_base}, which keeps running until it serves no "
+        f"request for {serve_config.daemon_idle_timeout} seconds."
+    )
+    return api_base
+
+
+def main(argv=None):
+    """Run the daemon ensure_daemon started."""
+    key, kwargs = argv or sys.argv[1:]
+    kwargs = json.loads(kwargs)
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    logger = logging.getLogger("instructlab.daemon")
+    logger.setLevel(logging.INFO)
+    registration = DaemonRegistration(daemon_dir() / f"{key}.json", key, kwargs["host"])
+    server(logger, queue=registration, **kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,27 +2,37 @@
 
 # Standard
 from datetime import datetime
-from functools import partial
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+import dataclasses
+import hashlib
+import itertools
 import json
-import multiprocessing
 import os
 import random
 import re
 import string
+import threading
 import time
 
 # Third Party
 from jinja2 import Template
-from rouge_score import rouge_scorer
 import click
 import tqdm
 
 # Local
-from ..config import DEFAULT_MULTIPROCESSING_START_METHOD
-from ..utils import chunk_document, read_taxonomy
+from ..utils import chunk_document, model_token_counter, read_taxonomy
 from . import utils
+from .output import (
+    DiscardLog,
+    DocumentStore,
+    GeneratedDataWriter,
+    InstructionRecord,
+    count_discards,
+    to_train_entry,
+)
+from .similarity import RougeLScorer
 from .utils import GenerateException
 
 DEFAULT_PROMPT_TEMPLATE_MERLINITE = """\
@@ -110,6 +120,22 @@ _WORD_DENYLIST = [
     "diagram",
 ]
 
+_WORD_DENYLIST_PATTERN = re.compile(
+    r"\b({0})\b".format("|".join(re.escape(w) for w in _WORD_DENYLIST)),
+    flags=re.IGNORECASE,
+)
+# Reasons recorded in the discard log
+DISCARD_FORMAT = "format"
+DISCARD_WORD_COUNT = "word_count"
+DISCARD_DENYLIST = "denylist"
+DISCARD_WRITE_A_PROGRAM = "write_a_program"
+DISCARD_PUNCTUATION = "punctuation"
+DISCARD_NON_ASCII = "non_ascii"
+DISCARD_ROUGE = "rouge"
+
+_TASK_SPLIT_PATTERN = re.compile(r"\* Task \d+")
+_FIELD_SPLIT_PATTERN = re.compile(r"\*\*\s+(Instruction|Input|Output):?")
+
 
 def check_prompt_file(prompt_file_path, model_family):
     """Check for prompt file."""
@@ -130,91 +156,124 @@ def check_prompt_file(prompt_file_path, model_family):
     return prompt_template
 
 
-def encode_prompt(prompt_instructions, prompt):
-    """Encode multiple prompt instructions into a single string.
-    If documents exist, randomly select one."""
-    idx = 0
-    document = None
-    document_list = prompt_instructions[0].get("document")
-
-    if document_list:
-        document = random.choice(document_list)
-
-    prompt = Template(prompt).render(
-        taxonomy=prompt_instructions[0]["taxonomy_path"],
-        task_description=prompt_instructions[0]["task_description"],
-        document=document,
-    )
+class PromptEncoder:
+    """Encode prompts with a template compiled once per run.
+
+    The rendered header is cached per (taxonomy path, task description,
+    document), and the task block of each prompt instruction is normalized
+    and formatted once, so encoding a prompt is a join of cached strings.
+
+    If documents is given, the documents of the prompt instructions are
+    chunk ids of that store rather than the chunks themselves.
+    """
+
+    def __init__(self, prompt_template: str, documents: Optional[DocumentStore] = None):
+        self._template = Template(prompt_template)
+        self._documents = documents
+        self._headers: Dict[Tuple[str, str, Optional[str]], str] = {}
+        self._tasks: Dict[Tuple[str, str, str], str] = {}
+
+    def _header(self, taxonomy_path, task_description, document) -> str:
+        key = (taxonomy_path, task_description, document)
+        header = self._headers.get(key)
+        if header is None:
+            if document is not None and self._documents is not None:
+                document = self._documents[document]
+            header = self._headers[key] = self._template.render(
+                taxonomy=taxonomy_path,
+                task_description=task_description,
+                document=document,
+            )
+        return header
+
+    def _task(self, task_dict) -> str:
+        key = (task_dict["instruction"], task_dict["input"], task_dict["output"])
+        task = self._tasks.get(key)
+        if task is None:
+            instruction, prompt_input, prompt_output = key
+            instruction = re.sub(r"\s+", " ", instruction).strip().rstrip(":")
+            prompt_input = "<noinput>" if prompt_input.lower() == "" else prompt_input
+            task = self._tasks[key] = (
+                f"** Instruction\n{instruction}\n"
+                f"** Input\n{prompt_input}\n"
+                f"** Output\n{prompt_output}\n"
+            )
+        return task
+
+    def encode(self, prompt_instructions) -> str:
+        """Encode multiple prompt instructions into a single string.
+        If documents exist, randomly select one."""
+        document = None
+        document_list = prompt_instructions[0].get("document")
+
+        if document_list:
+            document = random.choice(document_list)
+
+        parts = [
+            self._header(
+                prompt_instructions[0]["taxonomy_path"],
+                prompt_instructions[0]["task_description"],
+                document,
+            )
+        ]
+        for idx, task_dict in enumerate(prompt_instructions):
+            parts.append(f"* Task {idx + 1}\n")
+            parts.append(self._task(task_dict))
+        parts.append(f"* Task {len(prompt_instructions) + 1}\n")
+        return "".join(parts)
+
+
+@lru_cache(maxsize=8)
+def _prompt_encoder(prompt: str) -> PromptEncoder:
+    return PromptEncoder(prompt)
 
-    # pylint: disable=unused-variable
-    for idx, task_dict in enumerate(prompt_instructions):
-        (
-            instruction,
-            prompt_input,
-            prompt_output,
-            taxonomy_path,
-        ) = (
-            task_dict["instruction"],
-            task_dict["input"],
-            task_dict["output"],
-            task_dict["taxonomy_path"],
-        )
-        instruction = re.sub(r"\s+", " ", instruction).strip().rstrip(":")
-        prompt_input = "<noinput>" if prompt_input.lower() == "" else prompt_input
-        prompt += f"* Task {idx + 1}\n"
-        prompt += f"** Instruction\n{instruction}\n"
-        prompt += f"** Input\n{prompt_input}\n"
-        prompt += f"** Output\n{prompt_output}\n"
-    prompt += f"* Task {idx + 2}\n"
-    return prompt
 
+def encode_prompt(prompt_instructions, prompt):
+    """Encode multiple prompt instructions into a single string.
+    If documents exist, randomly select one.
 
-def writeline2file(logfile, line):
-    t = datetime.now().replace(microsecond=0).isoformat()
-    with open(logfile, "a", encoding="utf-8") as fp:
-        fp.write(f"{t} - {line}\n")
+    The PromptEncoder of each template is kept, along with its caches."""
+    return _prompt_encoder(prompt).encode(prompt_instructions)
 
 
-def post_process_gpt3_response(num_prompt_instructions, response, discarded_file):
+def post_process_gpt3_response(
+    num_prompt_instructions, response, discard_log: DiscardLog
+):
     if response is None:
         return [], 0
     raw_instructions = (
         f"* Task {num_prompt_instructions + 1}\n" + response.message.content
     )
-    raw_instructions = re.split(r"\* Task \d+", raw_instructions)
+    raw_instructions = _TASK_SPLIT_PATTERN.split(raw_instructions)
     instructions = []
     discarded = 0
     for inst in raw_instructions:
         if not inst.strip():
             continue
 
-        splitted_data = re.split(r"\*\*\s+(Instruction|Input|Output):?", inst)
+        splitted_data = _FIELD_SPLIT_PATTERN.split(inst)
         if len(splitted_data) != 7:
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(didn't match expected format): " + repr(inst),
-            )
+            discard_log.add(DISCARD_FORMAT, inst)
             discarded += 1
             continue
         inst = splitted_data[2].strip()
         prompt_input = splitted_data[4].strip()
         prompt_input = "" if prompt_input.lower() == "<noinput>" else prompt_input
         prompt_output = splitted_data[6].strip()
+        instruction = {
+            "instruction": inst,
+            "input": prompt_input,
+            "output": prompt_output,
+        }
         # filter out too short or too long instructions
-        if len(inst.split()) <= 3 or len(inst.split()) > 150:
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(wrong number of words): " + repr(splitted_data),
-            )
+        num_words = len(inst.split())
+        if num_words <= 3 or num_words > 150:
+            discard_log.add(DISCARD_WORD_COUNT, instruction)
             discarded += 1
             continue
         # filter based on keywords that are not suitable for language models.
-        if any(find_word_in_string(word, inst) for word in _WORD_DENYLIST):
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(contained a word from the denylist): "
-                + repr(splitted_data),
-            )
+        if _WORD_DENYLIST_PATTERN.search(inst):
+            discard_log.add(DISCARD_DENYLIST, instruction)
             discarded += 1
             continue
         # We found that the model tends to add "write a program" to some existing instructions
@@ -222,57 +281,35 @@ def post_process_gpt3_response(num_prompt_instructions, response, discarded_file
         # to write a program or directly output the result, so here we filter them out.
         # NOTE: this is not a comprehensive filtering for all programming instructions.
         if inst.startswith("Write a program"):
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(began with 'Write a program'): "
-                + repr(splitted_data),
-            )
+            discard_log.add(DISCARD_WRITE_A_PROGRAM, instruction)
             discarded += 1
             continue
         # filter those starting with punctuation
         if inst[0] in string.punctuation:
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(began with punctuation): " + repr(splitted_data),
-            )
+            discard_log.add(DISCARD_PUNCTUATION, instruction)
             discarded += 1
             continue
         # filter those starting with non-english character
         if not inst[0].isascii():
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(began with non-ascii): " + repr(splitted_data),
-            )
+            discard_log.add(DISCARD_NON_ASCII, instruction)
             discarded += 1
             continue
-        instructions.append(
-            {"instruction": inst, "input": prompt_input, "output": prompt_output}
-        )
+        instructions.append(instruction)
     return instructions, discarded
 
 
-def find_word_in_string(w, s):
-    return re.compile(r"\b({0})\b".format(w), flags=re.IGNORECASE).search(s)
-
-
-def get_instructions_from_model(
-    logger,
-    request_idx,
+def encode_prompts(
     instruction_data_pool,
-    prompt_template,
-    api_base,
-    api_key,
-    model_name,
+    prompt_encoder: PromptEncoder,
     num_prompt_instructions,
     request_batch_size,
-    temperature,
-    top_p,
-    output_file_discarded,
-    tls_insecure,
-    tls_client_cert,
-    tls_client_key,
-    tls_client_passwd,
 ):
+    """Sample prompt instructions from the pool and encode a batch of prompts.
+
+    Returns:
+        Tuple[List[str], List[dict]]: The prompts and the prompt instructions
+        sampled for the last one.
+    """
     batch_inputs = []
     for _ in range(request_batch_size):
         # only sampling from the seed tasks
@@ -286,9 +323,13 @@ def get_instructions_from_model(
                 f"yaml is formatted correctly, and there is enough "
                 f"new data({num_prompt_instructions}+ Q&A))"
             ) from exc
-        prompt = encode_prompt(prompt_instructions, prompt_template)
+        prompt = prompt_encoder.encode(prompt_instructions)
         batch_inputs.append(prompt)
-    decoding_args = utils.OpenAIDecodingArguments(
+    return batch_inputs, prompt_instructions
+
+
+def get_decoding_args(temperature, top_p):
+    return utils.OpenAIDecodingArguments(
         temperature=temperature,
         n=1,
         # Hard-coded to maximize length.
@@ -297,6 +338,65 @@ def get_instructions_from_model(
         top_p=top_p,
         stop=["* Task 5"],
     )
+
+
+def post_process_results(
+    num_prompt_instructions, results, prompt_instructions, discard_log: DiscardLog
+):
+    """Post-process the responses to a batch of prompts.
+
+    Returns:
+        Tuple[List[InstructionRecord], int]: The new instructions and the
+        number discarded.
+    """
+    instruction_data = []
+    discarded = 0
+    for result in results:
+        new_instructions, result_discarded = post_process_gpt3_response(
+            num_prompt_instructions, result, discard_log
+        )
+        discarded += result_discarded
+        # make sure the generated instruction carried over extra fields
+        prompt_ins_0 = prompt_instructions[0]
+        instruction_data.extend(
+            InstructionRecord(
+                new_ins["instruction"],
+                new_ins["input"],
+                new_ins["output"],
+                prompt_ins_0["taxonomy_path"],
+                prompt_ins_0["task_description"],
+                prompt_ins_0["document"],
+            )
+            for new_ins in new_instructions
+        )
+    return instruction_data, discarded
+
+
+def get_instructions_from_model(
+    logger,
+    request_idx,
+    instruction_data_pool,
+    prompt_encoder,
+    api_base,
+    api_key,
+    model_name,
+    num_prompt_instructions,
+    request_batch_size,
+    temperature,
+    top_p,
+    discard_log,
+    tls_insecure,
+    tls_client_cert,
+    tls_client_key,
+    tls_client_passwd,
+    engine=None,
+):
+    batch_inputs, prompt_instructions = encode_prompts(
+        instruction_data_pool,
+        prompt_encoder,
+        num_prompt_instructions,
+        request_batch_size,
+    )
     request_start = time.time()
     results = utils.openai_completion(
         api_base=api_base,
@@ -308,24 +408,15 @@ def get_instructions_from_model(
         tls_client_key=tls_client_key,
         tls_client_passwd=tls_client_passwd,
         batch_size=request_batch_size,
-        decoding_args=decoding_args,
+        decoding_args=get_decoding_args(temperature, top_p),
+        engine=engine,
     )
     request_duration = time.time() - request_start
 
     post_process_start = time.time()
-    instruction_data = []
-    for result in results:
-        new_instructions, discarded = post_process_gpt3_response(
-            num_prompt_instructions, result, output_file_discarded
-        )
-        # make sure the generated instruction carried over extra fields
-        prompt_ins_0 = prompt_instructions[0]
-        for new_ins in new_instructions:
-            new_ins["taxonomy_path"] = prompt_ins_0["taxonomy_path"]
-            new_ins["task_description"] = prompt_ins_0["task_description"]
-            new_ins["document"] = prompt_ins_0["document"]
-        instruction_data += new_instructions
-
+    instruction_data, discarded = post_process_results(
+        num_prompt_instructions, results, prompt_instructions, discard_log
+    )
     post_process_duration = time.time() - post_process_start
     logger.debug(
         f"Request {request_idx} took {request_duration:.2f}s, "
@@ -335,6 +426,32 @@ def get_instructions_from_model(
     return instruction_data, discarded
 
 
+def taxonomy_digests(seed_instruction_data) -> Dict[str, str]:
+    """Return a digest of the seed examples read from each taxonomy path."""
+    digests: Dict[str, Any] = {}
+    for seed_example in seed_instruction_data:
+        digest = digests.setdefault(seed_example["taxonomy_path"], hashlib.sha256())
+        digest.update(
+            json.dumps(seed_example, sort_keys=True, default=str).encode("utf-8")
+        )
+    return {path: digest.hexdigest() for path, digest in sorted(digests.items())}
+
+
+def check_manifest(manifest, seed_hash, seed_digests):
+    """Raise GenerateException if the taxonomy changed since the manifest was written."""
+    if manifest["seed_hash"] == seed_hash:
+        return
+    old_digests = manifest["taxonomy_digests"]
+    changed = sorted(
+        path
+        for path in set(old_digests) | set(seed_digests)
+        if old_digests.get(path) != seed_digests.get(path)
+    )
+    raise GenerateException(
+        f"Cannot resume, the seed examples changed since the run started: {', '.join(changed)}"
+    )
+
+
 def generate_data(
     logger,
     api_base,
@@ -360,6 +477,14 @@ def generate_data(
     tls_client_cert: Optional[str] = None,
     tls_client_key: Optional[str] = None,
     tls_client_passwd: Optional[str] = None,
+    max_concurrent_requests: Optional[int] = None,
+    pipeline_depth: int = 1,
+    server_concurrency: Optional[int] = None,
+    resume: bool = False,
+    similarity_index: bool = True,
+    taxonomy_jobs: int = 1,
+    taxonomy_cache: bool = False,
+    chunk_tokenizer_model: Optional[str] = None,
 ):
     seed_instruction_data = []
     generate_start = time.time()
@@ -372,7 +497,12 @@ def generate_data(
     # pylint: disable=broad-exception-caught,raise-missing-from
     if taxonomy and os.path.exists(taxonomy):
         seed_instruction_data = read_taxonomy(
-            logger, taxonomy, taxonomy_base, yaml_rules
+            logger,
+            taxonomy,
+            taxonomy_base,
+            yaml_rules,
+            taxonomy_jobs,
+            use_cache=taxonomy_cache,
         )
     else:
         raise SystemExit(f"Error: taxonomy ({taxonomy}) does not exist.")
@@ -382,188 +512,349 @@ def generate_data(
     if not seeds:
         raise SystemExit("Nothing to generate. Exiting.")
 
-    def unescape(s):
-        return bytes(s, "utf-8").decode("utf-8")
+    # digest the seeds before their documents are chunked
+    seed_digests = taxonomy_digests(seed_instruction_data)
+    seed_hash = hashlib.sha256(
+        json.dumps(seed_digests, sort_keys=True).encode("utf-8")
+    ).hexdigest()
 
     test_data = []
+    # seed examples of the same knowledge file share its documents, chunk
+    # each set of documents once and refer to the chunks by id
+    documents_store = DocumentStore()
+    chunked_documents: Dict[Tuple[str, ...], List[str]] = {}
+    token_counter = None
+    seed_examples = []
     for seed_example in seed_instruction_data:
-        user = seed_example["instruction"]
-
-        documents = seed_example["document"]
+        seed_example = InstructionRecord.from_dict(seed_example)
+        documents = seed_example.document
         if documents:
-            seed_example["document"] = chunk_document(
-                documents=documents,
-                server_ctx_size=server_ctx_size,
-                chunk_word_count=chunk_word_count,
-            )
+            if chunk_tokenizer_model and token_counter is None:
+                token_counter = model_token_counter(chunk_tokenizer_model)
+            key = tuple(documents)
+            if key not in chunked_documents:
+                chunked_documents[key] = documents_store.add(
+                    chunk_document(
+                        documents=documents,
+                        server_ctx_size=server_ctx_size,
+                        chunk_word_count=chunk_word_count,
+                        token_counter=token_counter,
+                    )
+                )
+            seed_example.document = chunked_documents[key]
+        seed_examples.append(seed_example)
 
-        if len(seed_example["input"]) > 0:
-            user += "\n" + seed_example["input"]
         try:
-            test_data.append(
-                {
-                    "system": utils.get_sysprompt(),
-                    "user": unescape(user),
-                    "assistant": unescape(seed_example["output"]),
-                }
-            )
+            test_data.append(to_train_entry(seed_example))
         except TypeError as exc:
             click.secho(
                 f"Error reading seed examples: {exc}. Please make sure your answers are verbose enough.",
                 fg="red",
             )
             raise click.exceptions.Exit(1)
+    seed_instruction_data = seed_examples
 
     name = Path(model_name).stem  # Just in case it is a file path
-    date_suffix = datetime.now().replace(microsecond=0).isoformat().replace(":", "_")
-    output_file = f"generated_{name}_{date_suffix}.json"
-    output_file_train = f"train_{name}_{date_suffix}.jsonl"
-    output_file_test = f"test_{name}_{date_suffix}.jsonl"
-    output_file_discarded = os.path.join(
-        output_dir, f"discarded_{name}_{date_suffix}.log"
-    )
-    logger.debug(f"Generating to: {os.path.join(output_dir, output_file)}")
+    manifest = None
+    if resume:
+        manifest_path = GeneratedDataWriter.find_manifest(output_dir, name)
+        if manifest_path:
+            manifest = utils.jload(manifest_path)
+            check_manifest(manifest, seed_hash, seed_digests)
+            logger.info(f"Resuming generation from {manifest_path}")
+        else:
+            logger.info(
+                f"No unfinished generation for {name} in {output_dir}, starting a new one"
+            )
+    if manifest:
+        date_suffix = manifest["date_suffix"]
+    else:
+        date_suffix = (
+            datetime.now().replace(microsecond=0).isoformat().replace(":", "_")
+        )
+    writer = GeneratedDataWriter(output_dir, name, date_suffix, documents_store)
+    discard_log = DiscardLog(writer.discarded_path)
+    logger.debug(f"Generating to: {writer.output_path}")
 
-    request_idx = 0
     # load the LM-generated instructions
     machine_instruction_data = []
-    if os.path.exists(os.path.join(output_dir, "regen.json")):
-        machine_instruction_data = utils.jload(os.path.join(output_dir, "regen.json"))
+    machine_instruction_tokens = None
+    request_idx_start = 0
+    total_discarded = 0
+    total_rouged = 0
+    if manifest:
+        machine_instruction_data, machine_instruction_tokens = writer.read_checkpoint(
+            manifest["offsets"]["checkpoint"]
+        )
+        request_idx_start = manifest["request_idx"]
+        total_discarded = manifest["discarded"]
+        total_rouged = manifest["rouged"]
+        logger.debug(
+            f"Resumed {len(machine_instruction_data)} machine-generated instructions after request {request_idx_start}"
+        )
+    elif os.path.exists(os.path.join(output_dir, "regen.json")):
+        machine_instruction_data = [
+            InstructionRecord.from_dict(entry)
+            for entry in utils.jload(os.path.join(output_dir, "regen.json"))
+        ]
+        for entry in machine_instruction_data:
+            # instructions generated before documents were stored by id
+            # carry the chunks themselves
+            if entry.document and any(
+                chunk_id not in documents_store for chunk_id in entry.document
+            ):
+                entry.document = documents_store.add(entry.document)
         logger.debug(
             f"Loaded {len(machine_instruction_data)} machine-generated instructions"
         )
 
-    # similarities = {}
-    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
-
     # now let's generate new instructions!
     progress_bar = tqdm.tqdm(total=num_instructions_to_generate)
     if machine_instruction_data:
         progress_bar.update(len(machine_instruction_data))
 
-    # first we tokenize all the seed instructions and generated machine instructions
-    all_instructions = [d["instruction"] for d in seed_instruction_data] + [
-        d["instruction"] for d in machine_instruction_data
-    ]
-    all_instruction_tokens = [
-        scorer._tokenizer.tokenize(inst) for inst in all_instructions
-    ]
-
-    prompt_template = check_prompt_file(prompt_file_path, model_family)
+    prompt_encoder = PromptEncoder(
+        check_prompt_file(prompt_file_path, model_family), documents_store
+    )
     if console_output:
         print(
             "Synthesizing new instructions. If you aren't satisfied with the generated instructions, interrupt training (Ctrl-C) and try adjusting your YAML files. Adding more examples may help."
         )
 
-    mpctx = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD)
-
-    all_taxonomy_paths = list(set(e["taxonomy_path"] for e in seed_instruction_data))
-    total_discarded = 0
-    total_rouged = 0
-    while len(machine_instruction_data) < num_instructions_to_generate:
-        request_idx += 1
-
+    all_taxonomy_paths = list(set(e.taxonomy_path for e in seed_instruction_data))
+    # the pool of each taxonomy path: its seed examples, then the
+    # instructions accepted for it, appended as they are. The pipeline's
+    # producer samples prompts while new instructions are added, which is
+    # safe as the lists only grow.
+    pools: Dict[str, List[InstructionRecord]] = {}
+    for entry in itertools.chain(seed_instruction_data, machine_instruction_data):
+        pools.setdefault(entry.taxonomy_path, []).append(entry)
+    pool_lock = threading.Lock()
+
+    def select_pool(request_idx):
         # Pick taxonomy path
         selected_taxonomy = all_taxonomy_paths[request_idx % len(all_taxonomy_paths)]
         logger.info(f"Selected taxonomy path {selected_taxonomy}")
-        # Filter the pool
-        instruction_data_pool = [
-            e
-            for e in seed_instruction_data + machine_instruction_data
-            if e["taxonomy_path"] == selected_taxonomy
-        ]
-        instruction_data, discarded = get_instructions_from_model(
-            logger,
-            request_idx,
+        with pool_lock:
+            return selected_taxonomy, pools[selected_taxonomy]
+
+    def lockstep_rounds():
+        request_idx = request_idx_start
+        while len(machine_instruction_data) < num_instructions_to_generate:
+            request_idx += 1
+            selected_taxonomy, instruction_data_pool = select_pool(request_idx)
+            discard_log.set_round(request_idx, selected_taxonomy)
+            instruction_data, discarded = get_instructions_from_model(
+                logger,
+                request_idx,
+                instruction_data_pool,
+                prompt_encoder,
+                api_base,
+                api_key,
+                model_name,
+                num_prompt_instructions,
+                request_batch_size,
+                temperature,
+                top_p,
+                discard_log,
+                tls_insecure,
+                tls_client_cert,
+                tls_client_key,
+                tls_client_passwd,
+                engine,
+            )
+            yield (
+                request_idx,
+                selected_taxonomy,
+                instruction_data,
+                discarded,
+                random.getstate(),
+            )
+
+    def prepare_request(request_idx):
+        selected_taxonomy, instruction_data_pool = select_pool(request_idx)
+        prompts, prompt_instructions = encode_prompts(
             instruction_data_pool,
-            prompt_template,
-            api_base,
-            api_key,
-            model_name,
+            prompt_encoder,
             num_prompt_instructions,
             request_batch_size,
-            temperature,
-            top_p,
-            output_file_discarded,
+        )
+        # the producer samples the prompts of later requests before this one
+        # is committed, its checkpoint resumes from the state after its own
+        return prompts, (selected_taxonomy, prompt_instructions, random.getstate())
+
+    def pipelined_rounds():
+        if len(machine_instruction_data) >= num_instructions_to_generate:
+            return
+        pipeline = utils.RequestPipeline(
+            engine,
+            prepare_request,
+            depth=pipeline_depth,
+            start=request_idx_start,
+            model=model_name,
+            **dataclasses.asdict(get_decoding_args(temperature, top_p)),
+        )
+        try:
+            for request_idx, context, results in pipeline:
+                selected_taxonomy, prompt_instructions, rng_state = context
+                discard_log.set_round(request_idx, selected_taxonomy)
+                instruction_data, discarded = post_process_results(
+                    num_prompt_instructions,
+                    results,
+                    prompt_instructions,
+                    discard_log,
+                )
+                yield (
+                    request_idx,
+                    selected_taxonomy,
+                    instruction_data,
+                    discarded,
+                    rng_state,
+                )
+        finally:
+            pipeline.close()
+
+    # rng_state is the random state after sampling the prompts of request_idx
+    def checkpoint_state(request_idx, rng_state):
+        version, internal_state, gauss_next = rng_state
+        return {
+            "model_name": model_name,
+            "seed_hash": seed_hash,
+            "taxonomy_digests": seed_digests,
+            "request_idx": request_idx,
+            "accepted": len(machine_instruction_data),
+            "discarded": total_discarded,
+            "rouged": total_rouged,
+            "rng_state": [version, list(internal_state), gauss_next],
+        }
+
+    # first we tokenize all the seed instructions and generated machine instructions
+    if machine_instruction_tokens is None:
+        scorer = RougeLScorer(
+            [
+                d.instruction
+                for d in itertools.chain(
+                    seed_instruction_data, machine_instruction_data
+                )
+            ],
+            num_cpus=num_cpus,
+            use_index=similarity_index,
+        )
+        machine_instruction_tokens = scorer.instruction_tokens[seeds:]
+    else:
+        scorer = RougeLScorer(
+            [d.instruction for d in seed_instruction_data],
+            num_cpus=num_cpus,
+            use_index=similarity_index,
+        )
+        for tokens in machine_instruction_tokens:
+            scorer.add(tokens)
+
+    try:
+        if manifest:
+            version, internal_state, gauss_next = manifest["rng_state"]
+            random.setstate((version, tuple(internal_state), gauss_next))
+            writer.open(manifest["offsets"])
+        else:
+            writer.open()
+            for instruction_data_entry, tokens in zip(
+                machine_instruction_data, machine_instruction_tokens
+            ):
+                writer.add(instruction_data_entry, tokens)
+            writer.commit(checkpoint_state(request_idx_start, random.getstate()))
+        writer.write_test(test_data)
+        # pylint: disable=duplicate-code
+        engine = utils.completion_engine(
+            api_base,
             tls_insecure,
             tls_client_cert,
             tls_client_key,
             tls_client_passwd,
+            api_key,
+            max_concurrent_requests=max_concurrent_requests,
+            request_batch_size=request_batch_size,
+            pipeline_depth=pipeline_depth,
+            server_concurrency=server_concurrency,
         )
-        total_discarded += discarded
-        total = len(instruction_data)
-        keep = 0
-        assess_start = time.time()
-        for instruction_data_entry in instruction_data:
+        # pylint: enable=duplicate-code
+    except BaseException:
+        # nothing was generated yet, the scorer's workers must not outlive it
+        scorer.close()
+        raise
+
+    if pipeline_depth > 1:
+        rounds = pipelined_rounds()
+    else:
+        rounds = lockstep_rounds()
+    completed = False
+    try:
+        for (
+            request_idx,
+            selected_taxonomy,
+            instruction_data,
+            discarded,
+            rng_state,
+        ) in rounds:
+            total_discarded += discarded
+            total = len(instruction_data)
+            keep = 0
+            assess_start = time.time()
             # computing similarity with the pre-tokenized instructions
-            new_instruction_tokens = scorer._tokenizer.tokenize(
-                instruction_data_entry["instruction"]
+            kept_tokens = scorer.filter(
+                [entry.instruction for entry in instruction_data], rouge_threshold
             )
-            with mpctx.Pool(num_cpus) as pool:
-                rouge_scores = pool.map(
-                    partial(rouge_scorer._score_lcs, new_instruction_tokens),
-                    all_instruction_tokens,
-                )
-            pool.join()
-            instruction_data_entry["taxonomy_path"] = selected_taxonomy
-            rouge_scores = [score.fmeasure for score in rouge_scores]
-            # Comment out extra info not currently being used:
-            # most_similar_instructions = {
-            #    all_instructions[i]: rouge_scores[i] for i in np.argsort(rouge_scores)[-10:][::-1]
-            # }
-            if max(rouge_scores) > rouge_threshold:
-                total_rouged += 1
-                continue
-            keep += 1
-            # Comment out extra info not currently being used:
-            # instruction_data_entry["most_similar_instructions"] = most_similar_instructions
-            # instruction_data_entry["avg_similarity_score"] = float(np.mean(rouge_scores))
-            machine_instruction_data.append(instruction_data_entry)
-            all_instructions.append(instruction_data_entry["instruction"])
-            all_instruction_tokens.append(new_instruction_tokens)
-            if console_output:
-                print(
-                    f"Q> {instruction_data_entry['instruction']}\nI> {instruction_data_entry['input']}\nA> {instruction_data_entry['output']}\n"
-                )
-        progress_bar.update(keep)
-        assess_duration = time.time() - assess_start
-        logger.debug(f"Assessing generated samples took {assess_duration:.2f}s")
-        logger.debug(
-            f"Generated {total} instructions(discarded {discarded}), rouged {total - keep}, kept {keep} instructions"
-        )
-        utils.jdump(machine_instruction_data, os.path.join(output_dir, output_file))
-        train_data = []
-        for synth_example in machine_instruction_data:
-            user = synth_example["instruction"]
-            if len(synth_example["input"]) > 0:
-                user += "\n" + synth_example["input"]
-            train_data.append(
-                {
-                    "system": utils.get_sysprompt(),
-                    "user": unescape(user),
-                    "assistant": unescape(synth_example["output"]),
-                }
+            for instruction_data_entry, tokens in zip(instruction_data, kept_tokens):
+                instruction_data_entry.taxonomy_path = selected_taxonomy
+                if tokens is None:
+                    total_rouged += 1
+                    discard_log.add(DISCARD_ROUGE, instruction_data_entry.to_dict())
+                    continue
+                keep += 1
+                with pool_lock:
+                    machine_instruction_data.append(instruction_data_entry)
+                    pools[selected_taxonomy].append(instruction_data_entry)
+                writer.add(instruction_data_entry, tokens)
+                if console_output:
+                    print(
+                        f"Q> {instruction_data_entry.instruction}\nI> {instruction_data_entry.input}\nA> {instruction_data_entry.output}\n"
+                    )
+            progress_bar.update(keep)
+            assess_duration = time.time() - assess_start
+            logger.debug(f"Assessing generated samples took {assess_duration:.2f}s")
+            logger.debug(
+                f"Request {request_idx}: generated {total} instructions(discarded {discarded}), rouged {total - keep}, kept {keep} instructions"
+            )
+            discard_log.flush()
+            writer.commit(checkpoint_state(request_idx, rng_state))
+            if len(machine_instruction_data) >= num_instructions_to_generate:
+                break
+        completed = len(machine_instruction_data) >= num_instructions_to_generate
+    finally:
+        rounds.close()
+        scorer.close()
+        engine.close()
+        discard_log.flush()
+        if completed:
+            writer.finalize()
+        else:
+            # keep the checkpoint and manifest around for --resume
+            writer.write_generated()
+            writer.close()
+            logger.info(
+                f"Generation stopped after {len(machine_instruction_data)} instructions, use --resume to continue it"
             )
-        # utils.jdump(train_data, os.path.join(output_dir, output_file_train))
-        with open(
-            os.path.join(output_dir, output_file_train), "w", encoding="utf-8"
-        ) as outfile:
-            for entry in train_data:
-                json.dump(entry, outfile, ensure_ascii=False)
-                outfile.write("\n")
-        # utils.jdump(test_data, os.path.join(output_dir, output_file_test))
-        with open(
-            os.path.join(output_dir, output_file_test), "w", encoding="utf-8"
-        ) as outfile:
-            for entry in test_data:
-                json.dump(entry, outfile, ensure_ascii=False)
-                outfile.write("\n")
 
     progress_bar.close()
 
     if total_discarded or total_rouged:
+        discards = count_discards(discard_log.path)
+        total_generated = len(machine_instruction_data) + sum(discards.values())
         logger.info(
-            f"{len(machine_instruction_data)} instructions generated, {total_discarded} discarded due to format (see {output_file_discarded}), {total_rouged} discarded due to rouge score"
+            f"{len(machine_instruction_data)} instructions generated, {total_discarded} discarded due to format, {total_rouged} discarded due to rouge score (see {discard_log.path})"
         )
+        for reason, count in discards.most_common():
+            logger.info(
+                f"  {reason}: {count} discarded ({count / total_generated:.1%} of generated instructions)"
+            )
     generate_duration = time.time() - generate_start
     logger.info(f"Generation took {generate_duration:.2f}s")
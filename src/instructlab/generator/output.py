@@ -0,0 +1,397 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, TextIO, Tuple
+import dataclasses
+import hashlib
+import json
+import os
+import re
+
+# Local
+from ..utils import get_sysprompt
+from .utils import GenerateException, jdump
+
+
+def unescape(s):
+    return bytes(s, "utf-8").decode("utf-8")
+
+
+@dataclasses.dataclass
+class InstructionRecord:
+    """A seed example or generated instruction.
+
+    Generation keeps tens of thousands of them in memory, so the fields are
+    slots rather than a dict per record. They can also be read like the dicts
+    read_taxonomy() returns, so code handling either reads them the same way.
+    """
+
+    __slots__ = (
+        "instruction",
+        "input",
+        "output",
+        "taxonomy_path",
+        "task_description",
+        "document",
+    )
+
+    instruction: str
+    input: str
+    output: str
+    taxonomy_path: str
+    task_description: str
+    # chunk ids of a DocumentStore, see GeneratedDataWriter
+    document: Optional[List[str]]
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "InstructionRecord":
+        return cls(
+            d["instruction"],
+            d["input"],
+            d["output"],
+            d["taxonomy_path"],
+            d["task_description"],
+            d.get("document"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+
+def to_train_entry(instruction: Dict[str, Any]) -> Dict[str, str]:
+    """Convert an instruction record into a system/user/assistant entry."""
+    user = instruction["instruction"]
+    if len(instruction["input"]) > 0:
+        user += "\n" + instruction["input"]
+    return {
+        "system": get_sysprompt(),
+        "user": unescape(user),
+        "assistant": unescape(instruction["output"]),
+    }
+
+
+def read_jsonl(path) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_jsonl(path, entries: Iterable[Dict[str, Any]]):
+    with open(path, "w", encoding="utf-8") as outfile:
+        for entry in entries:
+            json.dump(entry, outfile, ensure_ascii=False)
+            outfile.write("\n")
+
+
+class DiscardLog:
+    """Collect the instructions discarded in a round for the discard log.
+
+    The log is JSONL: each record holds the reason code, the request index and
+    taxonomy path set by ``set_round()``, and the discarded data. ``flush()``
+    appends the round's records with a single write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lines: List[str] = []
+        self._request_idx: Optional[int] = None
+        self._taxonomy_path: Optional[str] = None
+
+    def set_round(self, request_idx: int, taxonomy_path: str):
+        self._request_idx = request_idx
+        self._taxonomy_path = taxonomy_path
+
+    def add(self, reason: str, data: Any):
+        record = {
+            "timestamp": datetime.now().replace(microsecond=0).isoformat(),
+            "request_idx": self._request_idx,
+            "taxonomy_path": self._taxonomy_path,
+            "reason": reason,
+            "data": data,
+        }
+        self._lines.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def flush(self):
+        if not self._lines:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(self._lines))
+        self._lines = []
+
+
+def count_discards(path) -> Counter:
+    """Count the records of a discard log by reason."""
+    if not os.path.exists(path):
+        return Counter()
+    return Counter(record["reason"] for record in read_jsonl(path))
+
+
+def write_json_atomic(path, obj):
+    """Write a json file so that readers see either the old or the new content."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class DocumentStore:
+    """Knowledge document chunks keyed by a digest of their content.
+
+    Seed examples, and the instructions generated from them, refer to the
+    chunks of their documents by id, so each chunk is held once however many
+    records use it. The ids are the first 16 hex digits of the chunk's
+    sha256, so the same chunk gets the same id in every run.
+    """
+
+    def __init__(self):
+        self._chunks: Dict[str, str] = {}
+
+    @staticmethod
+    def chunk_id(chunk: str) -> str:
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+
+    def add(self, chunks: Iterable[str]) -> List[str]:
+        """Store chunks, returning their ids."""
+        ids = []
+        for chunk in chunks:
+            chunk_id = self.chunk_id(chunk)
+            self._chunks.setdefault(chunk_id, chunk)
+            ids.append(chunk_id)
+        return ids
+
+    def __getitem__(self, chunk_id: str) -> str:
+        return self._chunks[chunk_id]
+
+    def __contains__(self, chunk_id) -> bool:
+        return chunk_id in self._chunks
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+
+# pylint: disable=too-many-instance-attributes
+class GeneratedDataWriter:
+    """Stream accepted instructions to the output files of a generate run.
+
+    Instructions added during a round are buffered and appended to the
+    ``train_*.jsonl`` file and to a ``generated_*.jsonl`` checkpoint by
+    ``commit()``, which also flushes and fsyncs both files. The checkpoint
+    keeps each instruction's rougeL tokens next to it, so a resumed run
+    doesn't tokenize the corpus again. ``commit()`` then atomically replaces
+    the ``manifest_*.json``, which records the caller's state along with the
+    size of each file at the end of the round. Bytes past those sizes belong
+    to a round that didn't finish and are truncated when a run is resumed.
+
+    The ``document`` of an instruction is a list of chunk ids of a
+    DocumentStore. ``commit()`` appends the chunks the round's instructions
+    refer to, which no earlier round did, to ``documents_*.jsonl`` first,
+    one ``{"id", "text"}`` line per chunk, so every chunk is written once.
+
+    The pretty printed ``generated_*.json`` is only written by
+    ``write_generated()``.
+    """
+
+    def __init__(
+        self, output_dir, name, date_suffix, documents: Optional[DocumentStore] = None
+    ):
+        self.date_suffix = date_suffix
+        self.documents = documents if documents is not None else DocumentStore()
+        self.output_path = os.path.join(
+            output_dir, f"generated_{name}_{date_suffix}.json"
+        )
+        self.train_path = os.path.join(output_dir, f"train_{name}_{date_suffix}.jsonl")
+        self.test_path = os.path.join(output_dir, f"test_{name}_{date_suffix}.jsonl")
+        self.discarded_path = os.path.join(
+            output_dir, f"discarded_{name}_{date_suffix}.jsonl"
+        )
+        self.documents_path = os.path.join(
+            output_dir, f"documents_{name}_{date_suffix}.jsonl"
+        )
+        self.checkpoint_path = os.path.splitext(self.output_path)[0] + ".jsonl"
+        self.manifest_path = os.path.join(
+            output_dir, f"manifest_{name}_{date_suffix}.json"
+        )
+        self._pending: List[Tuple[InstructionRecord, List[str]]] = []
+        self._checkpoint: Optional[TextIO] = None
+        self._train: Optional[TextIO] = None
+        self._written_chunks: Set[str] = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def find_manifest(output_dir, name) -> Optional[str]:
+        """Return the manifest of the latest unfinished run for a model, if any."""
+        pattern = re.compile(
+            rf"manifest_{re.escape(name)}_\d{{4}}-\d\d-\d\dT[\d_]+\.json"
+        )
+        manifests = [
+            os.path.join(output_dir, f)
+            for f in os.listdir(output_dir)
+            if pattern.fullmatch(f)
+        ]
+        # the date suffixes are ISO formatted, so they sort chronologically
+        return max(manifests, default=None)
+
+    def read_checkpoint(
+        self, size: int
+    ) -> Tuple[List[InstructionRecord], List[List[str]]]:
+        """Read the instructions, and their tokens, of the committed rounds."""
+        with open(self.checkpoint_path, "rb") as f:
+            data = f.read(size)
+        if len(data) < size:
+            raise GenerateException(
+                f"Checkpoint {self.checkpoint_path} is shorter than recorded in the manifest."
+            )
+        records = []
+        tokens = []
+        for line in data.decode("utf-8").splitlines():
+            entry = json.loads(line)
+            records.append(InstructionRecord.from_dict(entry["record"]))
+            tokens.append(entry["tokens"])
+        return records, tokens
+
+    def open(self, offsets: Optional[Dict[str, int]] = None):
+        """Open the output files, truncating them to offsets when resuming."""
+        if offsets is not None:
+            for path, key in (
+                (self.checkpoint_path, "checkpoint"),
+                (self.train_path, "train"),
+            ):
+                if os.path.getsize(path) < offsets[key]:
+                    raise GenerateException(
+                        f"{path} is shorter than recorded in the manifest."
+                    )
+                os.truncate(path, offsets[key])
+            # the discard log is informational, tolerate it being removed
+            if os.path.exists(self.discarded_path):
+                os.truncate(
+                    self.discarded_path,
+                    min(offsets["discarded"], os.path.getsize(self.discarded_path)),
+                )
+            if os.path.exists(self.documents_path):
+                if os.path.getsize(self.documents_path) < offsets["documents"]:
+                    raise GenerateException(
+                        f"{self.documents_path} is shorter than recorded in the manifest."
+                    )
+                os.truncate(self.documents_path, offsets["documents"])
+                # the checkpoint may refer to chunks the seeds no longer have,
+                # e.g. when resuming with another chunk size
+                for entry in read_jsonl(self.documents_path):
+                    self.documents.add([entry["text"]])
+                    self._written_chunks.add(entry["id"])
+            elif offsets["documents"]:
+                raise GenerateException(
+                    f"{self.documents_path} is shorter than recorded in the manifest."
+                )
+        # pylint: disable=consider-using-with
+        self._checkpoint = open(self.checkpoint_path, "a", encoding="utf-8")
+        self._train = open(self.train_path, "a", encoding="utf-8")
+
+    def write_test(self, test_data: Iterable[Dict[str, Any]]):
+        """Write the test file, which doesn't change during a run."""
+        write_jsonl(self.test_path, test_data)
+
+    def add(self, instruction: InstructionRecord, tokens: List[str]):
+        """Buffer an accepted instruction until the end of the round."""
+        self._pending.append((instruction, tokens))
+
+    def offsets(self) -> Dict[str, int]:
+        sizes = {
+            "checkpoint": os.fstat(self._checkpoint.fileno()).st_size,
+            "train": os.fstat(self._train.fileno()).st_size,
+            "discarded": 0,
+            "documents": 0,
+        }
+        for key, path in (
+            ("discarded", self.discarded_path),
+            ("documents", self.documents_path),
+        ):
+            if os.path.exists(path):
+                sizes[key] = os.path.getsize(path)
+        return sizes
+
+    def commit(self, state: Optional[Dict[str, Any]] = None):
+        """Append the round's instructions and make them durable.
+
+        If state is given, the manifest is then replaced with it.
+        """
+        document_lines = []
+        checkpoint_lines = []
+        train_lines = []
+        for instruction, tokens in self._pending:
+            for chunk_id in instruction.document or ():
+                if chunk_id not in self._written_chunks:
+                    self._written_chunks.add(chunk_id)
+                    document_lines.append(
+                        json.dumps(
+                            {"id": chunk_id, "text": self.documents[chunk_id]},
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    )
+            checkpoint_lines.append(
+                json.dumps(
+                    {"record": instruction.to_dict(), "tokens": tokens},
+                    ensure_ascii=False,
+                    default=str,
+                )
+                + "\n"
+            )
+            train_lines.append(
+                json.dumps(to_train_entry(instruction), ensure_ascii=False) + "\n"
+            )
+        self._pending = []
+        if document_lines:
+            # written before the records referring to them
+            with open(self.documents_path, "a", encoding="utf-8") as f:
+                f.write("".join(document_lines))
+                f.flush()
+                os.fsync(f.fileno())
+        if checkpoint_lines:
+            for f, lines in (
+                (self._checkpoint, checkpoint_lines),
+                (self._train, train_lines),
+            ):
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+        if state is not None:
+            manifest = dict(state, date_suffix=self.date_suffix, offsets=self.offsets())
+            write_json_atomic(self.manifest_path, manifest)
+
+    def write_generated(self):
+        """Write the pretty printed generated_*.json from the checkpoint.
+
+        Its instructions refer to the chunks in documents_*.jsonl by id.
+        """
+        self.commit()
+        records, _ = self.read_checkpoint(os.path.getsize(self.checkpoint_path))
+        jdump([record.to_dict() for record in records], self.output_path)
+
+    def close(self):
+        for f in (self._checkpoint, self._train):
+            if f is not None:
+                f.close()
+
+    def finalize(self):
+        """Write generated_*.json and remove the checkpoint at the end of a run."""
+        self.write_generated()
+        self.close()
+        os.remove(self.checkpoint_path)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
@@ -0,0 +1,349 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections import Counter
+from functools import partial
+from typing import Dict, List, Optional, Sequence, Tuple
+import multiprocessing
+import os
+
+# Third Party
+from rouge_score import rouge_scorer
+import numpy as np
+
+# Local
+from ..config import DEFAULT_MULTIPROCESSING_START_METHOD
+
+# Below this many corpus entries per worker, shipping the corpus to the pool
+# costs more than scoring it in-process.
+MIN_INSTRUCTIONS_PER_WORKER = 20000
+
+# Margin below the threshold under which the index's upper bound is trusted
+# to rule an entry out, it absorbs any rounding in the bound's computation.
+BOUND_TOLERANCE = 1e-9
+
+# Token id filling the token matrix past the end of each entry
+PADDING_ID = -1
+# Token id of candidate tokens that aren't in the corpus vocabulary
+UNKNOWN_ID = -2
+
+
+def lcs_lengths(candidate_ids: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Return the LCS length of a candidate against each row of a token matrix.
+
+    This is the usual dynamic program, one candidate token at a time, for all
+    rows at once. With ``prev`` the LCS lengths against each prefix of the
+    rows, the next table is the running maximum of ``prev[j - 1] + 1`` where
+    the token matches column ``j`` and ``prev[j]`` elsewhere. Padding never
+    matches, so the last column holds the LCS against the whole row.
+    """
+    rows, width = matrix.shape
+    prev = np.zeros((rows, width + 1), dtype=np.int32)
+    curr = np.zeros_like(prev)
+    for token_id in candidate_ids:
+        np.maximum.accumulate(
+            np.where(matrix == token_id, prev[:, :-1] + 1, prev[:, 1:]),
+            axis=1,
+            out=curr[:, 1:],
+        )
+        prev, curr = curr, prev
+    return prev[:, -1]
+
+
+def lcs_scores(
+    candidate_ids: np.ndarray, matrix: np.ndarray, lengths: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return rougeL precision, recall and fmeasure of a candidate against each row.
+
+    The candidate is the target and the rows are the predictions, as in
+    ``rouge_scorer._score_lcs(candidate, row)``, and the floating point
+    operations are the same, so the scores are identical to rouge_score's.
+    """
+    if candidate_ids.size == 0:
+        zeros = np.zeros(len(matrix))
+        return zeros, zeros, zeros
+    lcs = lcs_lengths(candidate_ids, matrix).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(lengths > 0, lcs / lengths, 0.0)
+        recall = lcs / len(candidate_ids)
+        total = precision + recall
+        fmeasure = np.where(total > 0, 2 * precision * recall / total, 0.0)
+    return precision, recall, fmeasure
+
+
+def _max_fmeasures(candidates_ids, matrix, lengths) -> List[float]:
+    """Return the highest rougeL fmeasure of each candidate against a token matrix."""
+    return [
+        float(np.max(lcs_scores(candidate_ids, matrix, lengths)[2], initial=0.0))
+        for candidate_ids in candidates_ids
+    ]
+
+
+class _GrowableArray:
+    """An integer array with amortized O(1) appends."""
+
+    def __init__(self, capacity: int = 8):
+        self._data = np.empty(capacity, dtype=np.int32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value: int):
+        if self._size == len(self._data):
+            self._data = np.resize(self._data, 2 * len(self._data))
+        self._data[self._size] = value
+        self._size += 1
+
+    def view(self) -> np.ndarray:
+        return self._data[: self._size]
+
+
+class TokenMatrix:
+    """A corpus of token lists stored as interned token ids.
+
+    Entries are the rows of a matrix padded with PADDING_ID, next to an array
+    of their lengths. Both grow geometrically as entries are added.
+    """
+
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._rows = np.full((8, 8), PADDING_ID, dtype=np.int32)
+        self._lengths = _GrowableArray()
+        self._width = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def encode(self, tokens: Sequence[str]) -> np.ndarray:
+        """Return the token ids of tokens, UNKNOWN_ID for tokens not in the corpus."""
+        return np.fromiter(
+            (self._vocab.get(token, UNKNOWN_ID) for token in tokens),
+            dtype=np.int32,
+            count=len(tokens),
+        )
+
+    def add(self, tokens: Sequence[str]) -> np.ndarray:
+        """Add an entry, returning its token ids."""
+        token_ids = np.fromiter(
+            (self._vocab.setdefault(token, len(self._vocab)) for token in tokens),
+            dtype=np.int32,
+            count=len(tokens),
+        )
+        entry = len(self)
+        capacity, width = self._rows.shape
+        if entry == capacity or len(token_ids) > width:
+            rows = np.full(
+                (
+                    2 * capacity if entry == capacity else capacity,
+                    max(width, 2 * len(token_ids)),
+                ),
+                PADDING_ID,
+                dtype=np.int32,
+            )
+            rows[:entry, :width] = self._rows[:entry]
+            self._rows = rows
+        self._rows[entry, : len(token_ids)] = token_ids
+        self._lengths.append(len(token_ids))
+        self._width = max(self._width, len(token_ids))
+        return token_ids
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._rows[: len(self), : self._width]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self._lengths.view()
+
+
+class OverlapIndex:
+    """Inverted index from token ids to the corpus entries containing them.
+
+    An LCS can't be longer than the number of tokens two instructions share,
+    counted with multiplicity, so rougeL fmeasure is at most
+    ``2 * overlap / (len(a) + len(b))``. The index computes that bound for a
+    candidate against the whole corpus at once, which rules out nearly every
+    entry without running the LCS dynamic program on it. Negative token ids,
+    such as UNKNOWN_ID, never match.
+    """
+
+    def __init__(self):
+        self._docs: List[_GrowableArray] = []
+        self._counts: List[_GrowableArray] = []
+        self._lengths = _GrowableArray()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, token_ids: Sequence[int]):
+        doc = len(self)
+        for token_id, count in Counter(token_ids).items():
+            while token_id >= len(self._docs):
+                self._docs.append(_GrowableArray(capacity=1))
+                self._counts.append(_GrowableArray(capacity=1))
+            self._docs[token_id].append(doc)
+            self._counts[token_id].append(count)
+        self._lengths.append(len(token_ids))
+
+    def upper_bounds(self, token_ids: Sequence[int]) -> np.ndarray:
+        """Return an upper bound of the rougeL fmeasure against each entry."""
+        overlap = np.zeros(len(self), dtype=np.int32)
+        for token_id, count in Counter(token_ids).items():
+            if not 0 <= token_id < len(self._docs):
+                continue
+            # each entry appears at most once in a token's postings
+            overlap[self._docs[token_id].view()] += np.minimum(
+                self._counts[token_id].view(), count
+            )
+        lengths = len(token_ids) + self._lengths.view()
+        return 2 * overlap / np.maximum(lengths, 1)
+
+    def candidates(self, token_ids: Sequence[int], threshold: float) -> np.ndarray:
+        """Return the entries whose rougeL fmeasure may be above threshold."""
+        return np.flatnonzero(
+            self.upper_bounds(token_ids) > threshold - BOUND_TOLERANCE
+        )
+
+
+class RougeLScorer:
+    """Scores candidate instructions against the instructions accepted so far.
+
+    The scorer keeps the corpus as a TokenMatrix and a worker pool alive for a
+    whole generation run, so each round's candidates are scored in a single
+    call instead of starting a new pool for every candidate. LCS lengths are
+    computed against all entries at once by ``lcs_scores()``, and match
+    ``rougeL`` fmeasure exactly.
+
+    With ``use_index``, ``filter()`` only scores the corpus entries an
+    OverlapIndex can't rule out for the threshold in use. Its decisions are
+    the same either way.
+    """
+
+    def __init__(
+        self,
+        instructions: Sequence[str] = (),
+        num_cpus: Optional[int] = None,
+        start_method: str = DEFAULT_MULTIPROCESSING_START_METHOD,
+        use_index: bool = True,
+    ):
+        self._scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
+        self._num_cpus = num_cpus or os.cpu_count() or 1
+        self._mpctx = multiprocessing.get_context(start_method)
+        self._pool = None
+        self._matrix = TokenMatrix()
+        self._index = OverlapIndex() if use_index else None
+        self.instruction_tokens: List[List[str]] = []
+        for inst in instructions:
+            self.add(self.tokenize(inst))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.instruction_tokens)
+
+    def close(self):
+        """Shut down the worker pool, if one was started."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def tokenize(self, instruction: str) -> List[str]:
+        return self._scorer._tokenizer.tokenize(instruction)
+
+    def add(self, instruction_tokens: List[str]):
+        """Add an accepted instruction to the corpus."""
+        self.instruction_tokens.append(instruction_tokens)
+        token_ids = self._matrix.add(instruction_tokens)
+        if self._index is not None:
+            self._index.add(token_ids)
+
+    def _num_workers(self) -> int:
+        return max(
+            1,
+            min(
+                self._num_cpus,
+                len(self.instruction_tokens) // MIN_INSTRUCTIONS_PER_WORKER,
+            ),
+        )
+
+    def max_scores(self, candidates_tokens: Sequence[List[str]]) -> List[float]:
+        """Return the highest rougeL fmeasure of each candidate against the corpus."""
+        candidates_ids = [self._matrix.encode(tokens) for tokens in candidates_tokens]
+        matrix = self._matrix.matrix
+        lengths = self._matrix.lengths
+        num_workers = self._num_workers()
+        if num_workers == 1 or not candidates_tokens:
+            return _max_fmeasures(candidates_ids, matrix, lengths)
+
+        if self._pool is None:
+            # pylint: disable=consider-using-with
+            self._pool = self._mpctx.Pool(self._num_cpus)
+        chunk_size = -(-len(matrix) // num_workers)
+        chunk_scores = self._pool.starmap(
+            partial(_max_fmeasures, candidates_ids),
+            [
+                (matrix[i : i + chunk_size], lengths[i : i + chunk_size])
+                for i in range(0, len(matrix), chunk_size)
+            ],
+        )
+        return [max(scores) for scores in zip(*chunk_scores)]
+
+    def _indexed_max_scores(
+        self, candidates_tokens: Sequence[List[str]], threshold: float
+    ) -> List[float]:
+        """Like max_scores, but scores at or below threshold may be lower."""
+        scores = []
+        for tokens in candidates_tokens:
+            candidate_ids = self._matrix.encode(tokens)
+            entries = self._index.candidates(candidate_ids, threshold)
+            scores.append(
+                _max_fmeasures(
+                    [candidate_ids],
+                    self._matrix.matrix[entries],
+                    self._matrix.lengths[entries],
+                )[0]
+            )
+        return scores
+
+    def filter(
+        self, instructions: Sequence[str], threshold: float
+    ) -> List[Optional[List[str]]]:
+        """Decide which of a round's instructions to keep.
+
+        Instructions are assessed in order: an instruction is rejected if its
+        rougeL fmeasure against the corpus, or against an instruction kept
+        earlier in the same round, is above threshold. Kept instructions are
+        added to the corpus.
+
+        Returns:
+            List[Optional[List[str]]]: The tokens of each kept instruction,
+            None for each rejected one.
+        """
+        candidates_tokens = [self.tokenize(inst) for inst in instructions]
+        if self._index is not None:
+            corpus_scores = self._indexed_max_scores(candidates_tokens, threshold)
+        else:
+            corpus_scores = self.max_scores(candidates_tokens)
+        kept_tokens: List[List[str]] = []
+        decisions: List[Optional[List[str]]] = []
+        for tokens, score in zip(candidates_tokens, corpus_scores):
+            score = max(
+                [score]
+                + [
+                    rouge_scorer._score_lcs(tokens, kept).fmeasure
+                    for kept in kept_tokens
+                ]
+            )
+            if score > threshold:
+                decisions.append(None)
+                continue
+            decisions.append(tokens)
+            kept_tokens.append(tokens)
+            self.add(tokens)
+        return decisions
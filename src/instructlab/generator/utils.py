@@ -1,18 +1,21 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
-from typing import Optional, Sequence, Union
+from typing import Any, Callable, Optional, Sequence, Tuple, Union
+import asyncio
+import concurrent.futures
 import copy
 import dataclasses
 import io
 import json
 import logging
-import math
 import os
+import queue
 import sys
+import threading
 
 # Third Party
-from openai import OpenAI, OpenAIError
+from openai import AsyncOpenAI, OpenAIError
 import httpx
 
 # Local
@@ -21,6 +24,8 @@ from ..utils import get_sysprompt
 
 StrOrOpenAIObject = Union[str, object]
 
+DEFAULT_MAX_CONCURRENT_REQUESTS = 5
+
 
 class GenerateException(Exception):
     """An exception raised during generate step."""
@@ -40,6 +45,228 @@ class OpenAIDecodingArguments:
     logprobs: Optional[int] = None
 
 
+class AsyncCompletionEngine:
+    """Send chat completion requests concurrently over a pooled connection.
+
+    The engine owns an event loop running in a background thread and a
+    single AsyncOpenAI client, so it can be created once and reused for every
+    request of a generate run. At most ``max_concurrency`` requests are in
+    flight at a time.
+    """
+
+    def __init__(
+        self,
+        api_base,
+        tls_insecure=False,
+        tls_client_cert=None,
+        tls_client_key=None,
+        tls_client_passwd=None,
+        api_key=DEFAULT_API_KEY,
+        max_concurrency=DEFAULT_MAX_CONCURRENT_REQUESTS,
+    ):
+        if not api_key:
+            # we need to explicitly set non-empty api-key, to ensure generate
+            # connects to our local server
+            api_key = "no_api_key"
+        self.max_concurrency = max_concurrency
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="completion-engine", daemon=True
+        )
+        self._thread.start()
+
+        # pylint: disable=R0801
+        orig_cert = (tls_client_cert, tls_client_key, tls_client_passwd)
+        cert = tuple(item for item in orig_cert if item)
+        verify = not tls_insecure
+
+        async def setup():
+            # the semaphore must be created on the engine's event loop
+            semaphore = asyncio.Semaphore(max_concurrency)
+            # do not pass a lower timeout to this client since generating a dataset takes some time
+            return semaphore, AsyncOpenAI(
+                base_url=api_base,
+                api_key=api_key,
+                http_client=httpx.AsyncClient(
+                    cert=cert,
+                    verify=verify,
+                    limits=httpx.Limits(
+                        max_connections=max_concurrency,
+                        max_keepalive_connections=max_concurrency,
+                    ),
+                ),
+            )
+
+        self._semaphore, self._client = self._run(setup()).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close(self):
+        """Close the connection pool and stop the event loop."""
+        if self._loop.is_closed():
+            return
+        self._run(self._client.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _complete_one(self, prompt, request_kwargs):
+        messages = [
+            {"role": "system", "content": get_sysprompt()},
+            {"role": "user", "content": prompt},
+        ]
+        async with self._semaphore:
+            # Inference the model
+            try:
+                response = await self._client.chat.completions.create(
+                    messages=messages,
+                    **request_kwargs,
+                )
+            except OpenAIError as exc:
+                raise GenerateException(
+                    f"There was a problem connecting to the server {exc}"
+                ) from exc
+        return response.choices
+
+    async def _complete(self, prompts, request_kwargs):
+        tasks = [
+            asyncio.ensure_future(self._complete_one(prompt, request_kwargs))
+            for prompt in prompts
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [choice for choices in results for choice in choices]
+
+    def submit(
+        self, prompts: Sequence[str], **request_kwargs
+    ) -> concurrent.futures.Future:
+        """Send all prompts concurrently without waiting for the responses.
+
+        Returns:
+            Future: Resolves to the completion choices, in prompt order.
+        """
+        return self._run(self._complete(list(prompts), request_kwargs))
+
+    def complete(self, prompts: Sequence[str], **request_kwargs) -> list:
+        """Send all prompts concurrently and return the choices in prompt order."""
+        return self.submit(prompts, **request_kwargs).result()
+
+
+class RequestPipeline:
+    """Keep several prompt batches in flight while earlier results are consumed.
+
+    A producer thread calls ``prepare(request_idx)`` to build each batch of
+    prompts and submits it to the engine, so the server always has up to
+    ``depth`` batches to work on. Iterating the pipeline yields
+    ``(request_idx, context, results)`` in request order; a slot for the next
+    batch is freed once the consumer is done with a result.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncCompletionEngine,
+        prepare: Callable[[int], Tuple[Sequence[str], Any]],
+        depth: int,
+        start: int = 0,
+        **request_kwargs,
+    ):
+        self._engine = engine
+        self._start = start
+        self._prepare = prepare
+        self._request_kwargs = request_kwargs
+        self._slots = threading.BoundedSemaphore(depth)
+        # at most depth batches hold a slot, so the producer never blocks on put
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._producer = threading.Thread(
+            target=self._produce, name="request-pipeline", daemon=True
+        )
+
+    def _produce(self):
+        request_idx = self._start
+        while not self._stop.is_set():
+            # pylint: disable=consider-using-with
+            if not self._slots.acquire(timeout=0.1):
+                continue
+            request_idx += 1
+            # pylint: disable=broad-exception-caught
+            try:
+                prompts, context = self._prepare(request_idx)
+                future = self._engine.submit(prompts, **self._request_kwargs)
+            except Exception as exc:
+                self._queue.put((request_idx, None, exc))
+                return
+            self._queue.put((request_idx, context, future))
+
+    def __iter__(self):
+        self._producer.start()
+        while True:
+            request_idx, context, future = self._queue.get()
+            if isinstance(future, Exception):
+                raise future
+            results = future.result()
+            yield request_idx, context, results
+            self._slots.release()
+
+    def close(self):
+        """Stop the producer and cancel the requests still in flight."""
+        self._stop.set()
+        if self._producer.is_alive():
+            self._producer.join()
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if isinstance(future, concurrent.futures.Future):
+                future.cancel()
+
+
+def completion_engine(
+    api_base,
+    tls_insecure=False,
+    tls_client_cert=None,
+    tls_client_key=None,
+    tls_client_passwd=None,
+    api_key=DEFAULT_API_KEY,
+    max_concurrent_requests: Optional[int] = None,
+    request_batch_size: int = 1,
+    pipeline_depth: int = 1,
+    server_concurrency: Optional[int] = None,
+) -> AsyncCompletionEngine:
+    """Return an engine sending the requests of generate to a server.
+
+    Up to max_concurrent_requests requests are in flight, by default the
+    prompts of pipeline_depth batches of request_batch_size, but no more
+    than server_concurrency, the requests the server accepts at once if
+    known: a server rejects the requests beyond it.
+    """
+    max_concurrency = max_concurrent_requests or request_batch_size * max(
+        pipeline_depth, 1
+    )
+    if server_concurrency:
+        max_concurrency = min(max_concurrency, server_concurrency)
+    # pylint: disable=duplicate-code
+    return AsyncCompletionEngine(
+        api_base=api_base,
+        tls_insecure=tls_insecure,
+        tls_client_cert=tls_client_cert,
+        tls_client_key=tls_client_key,
+        tls_client_passwd=tls_client_passwd,
+        api_key=api_key,
+        max_concurrency=max_concurrency,
+    )
+    # pylint: enable=duplicate-code
+
+
 def openai_completion(
     api_base,
     tls_insecure,
@@ -54,6 +281,7 @@ def openai_completion(
     max_batches=sys.maxsize,
     return_text=False,
     api_key=DEFAULT_API_KEY,
+    engine: Optional[AsyncCompletionEngine] = None,
     **decoding_kwargs,
 ) -> Union[
     Union[StrOrOpenAIObject],
@@ -75,11 +303,12 @@ def openai_completion(
             https://github.com/openai/openai-cookbook/blob/main/examples/How_to_format_inputs_to_ChatGPT_models.ipynb
         decoding_args: Decoding arguments.
         model_name: Model name. Can be either in the format of "org/model" or just "model".
-        batch_size: Number of prompts to send in a single request. Only for non chat model.
+        batch_size: Number of prompts to send concurrently when no engine is given.
         max_instances: Maximum number of prompts to decode.
         max_batches: Maximum number of batches to decode. This will be deprecated in the future.
         return_text: If True, return text instead of full completion object (e.g. includes logprob).
         api_key: API key API key for API endpoint where model is hosted
+        engine: Engine to send the requests with. A temporary engine is created if not given.
         decoding_kwargs: Extra decoding arguments. Pass in `best_of` and `logit_bias` if needed.
 
     Returns:
@@ -101,55 +330,26 @@ def openai_completion(
         max_instances = max_batches * batch_size
 
     prompts = prompts[:max_instances]
-    num_prompts = len(prompts)
-    prompt_batches = [
-        prompts[batch_id * batch_size : (batch_id + 1) * batch_size]
-        for batch_id in range(int(math.ceil(num_prompts / batch_size)))
-    ]
-
-    completions = []
-    for batch_id, prompt_batch in enumerate(prompt_batches):
-        batch_decoding_args = copy.deepcopy(decoding_args)  # cloning the decoding_args
-
-        shared_kwargs = {
-            "model": model_name,
-            **batch_decoding_args.__dict__,
-            **decoding_kwargs,
-        }
-
-        if not api_key:
-            # we need to explicitly set non-empty api-key, to ensure generate
-            # connects to our local server
-            api_key = "no_api_key"
-
-        # do not pass a lower timeout to this client since generating a dataset takes some time
-        # pylint: disable=R0801
-        orig_cert = (tls_client_cert, tls_client_key, tls_client_passwd)
-        cert = tuple(item for item in orig_cert if item)
-        verify = not tls_insecure
-        client = OpenAI(
-            base_url=api_base,
-            api_key=api_key,
-            http_client=httpx.Client(cert=cert, verify=verify),
-        )
-
-        messages = [
-            {"role": "system", "content": get_sysprompt()},
-            {"role": "user", "content": prompt_batch[batch_id]},
-        ]
 
-        # Inference the model
-        try:
-            response = client.chat.completions.create(
-                messages=messages,
-                **shared_kwargs,
-            )
-        except OpenAIError as exc:
-            raise GenerateException(
-                f"There was a problem connecting to the server {exc}"
-            ) from exc
+    shared_kwargs = {
+        "model": model_name,
+        **copy.deepcopy(decoding_args).__dict__,
+        **decoding_kwargs,
+    }
 
-        completions.extend(response.choices)
+    if engine is None:
+        with completion_engine(
+            api_base,
+            tls_insecure,
+            tls_client_cert,
+            tls_client_key,
+            tls_client_passwd,
+            api_key,
+            request_batch_size=batch_size,
+        ) as temp_engine:
+            completions = temp_engine.complete(prompts, **shared_kwargs)
+    else:
+        completions = engine.complete(prompts, **shared_kwargs)
 
     if return_text:
         completions = [completion.text for completion in completions]
@@ -231,8 +231,21 @@ def init(
     is_flag=True,
     help="Suppress all output. Call returns 0 if check passes, 1 otherwise.",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes reading and validating taxonomy files in parallel.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Read and validate every taxonomy file, ignoring results cached by earlier runs.",
+)
 @click.pass_context
-def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet):
+def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet, jobs, no_cache):
     """
     Lists taxonomy files that have changed since <taxonomy-base>
     and checks that taxonomy is valid. Similar to 'git diff <ref>'.
@@ -266,7 +279,14 @@ def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet):
             for f in updated_taxonomy_files:
                 click.echo(f)
     try:
-        read_taxonomy(logger, taxonomy_path, taxonomy_base, yaml_rules)
+        read_taxonomy(
+            logger,
+            taxonomy_path,
+            taxonomy_base,
+            yaml_rules,
+            jobs,
+            use_cache=not no_cache,
+        )
     except (SystemExit, yaml.YAMLError) as exc:
         if not quiet:
             click.secho(
@@ -309,8 +329,59 @@ utils.make_lab_diff_aliases(cli, diff)
     default="merlinite",
     help="Model family is used to specify which chat template to serve with",
 )
+@click.option(
+    "--max-queue-size",
+    type=click.IntRange(min=0),
+    help="Serve concurrent clients, queueing up to this many requests for the model while it serves one. Further requests are answered 429. 0 serves a single client at a time, rejecting concurrent requests with 503. `ilab generate` sends no more than this plus one requests at once to the local server. Defaults to 16.",
+)
+@click.option(
+    "--keep-alive-timeout",
+    type=click.IntRange(min=0),
+    help="Seconds idle client connections are kept open when serving concurrent clients. Defaults to 5.",
+)
+@click.option(
+    "--model",
+    "extra_models",
+    multiple=True,
+    type=click.Path(),
+    help="Another model to serve, of the same family, which requests choose by its path or file name in their model field. Repeat to serve more. Defaults to serve.models.",
+)
+@click.option(
+    "--max-loaded-models",
+    type=click.IntRange(min=1),
+    help="The number of models kept loaded, the least recently used is unloaded beyond it. Defaults to 1.",
+)
+@click.option(
+    "--max-loaded-size-mb",
+    type=click.IntRange(min=1),
+    help="The total size, in MiB, of the files of the models kept loaded.",
+)
+@click.option(
+    "--prompt-cache",
+    type=click.Choice(["ram", "disk"]),
+    help="Keep llama.cpp states in RAM or on disk, so that prompts sharing a prefix with an earlier one only evaluate the rest of it. Metrics are served at /prompt-cache.",
+)
+@click.option(
+    "--prompt-cache-size-mb",
+    type=click.IntRange(min=1),
+    help="The size, in MiB, of the prompt cache of each model. Defaults to 2048.",
+)
 @click.pass_context
-def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
+def serve(
+    ctx,
+    model_path,
+    gpu_layers,
+    num_threads,
+    max_ctx_size,
+    model_family,
+    max_queue_size,
+    keep_alive_timeout,
+    extra_models,
+    max_loaded_models,
+    max_loaded_size_mb,
+    prompt_cache,
+    prompt_cache_size_mb,
+):
     """Start a local server"""
     # pylint: disable=C0415
     # Local
@@ -320,6 +391,16 @@ def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
         f"Using model '{model_path}' with {gpu_layers} gpu-layers and {max_ctx_size} max context size."
     )
 
+    if extra_models:
+        models = [(path, None) for path in extra_models]
+    else:
+        models = [
+            (model.model_path, model.model_family)
+            for model in ctx.obj.config.serve.models or []
+        ]
+    for path, _ in models:
+        ctx.obj.logger.info(f"Also serving model '{path}'.")
+
     try:
         host = ctx.obj.config.serve.host_port.split(":")[0]
         port = int(ctx.obj.config.serve.host_port.split(":")[1])
@@ -332,6 +413,13 @@ def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
             num_threads,
             host,
             port,
+            max_queue_size=max_queue_size,
+            keep_alive_timeout=keep_alive_timeout,
+            models=models,
+            max_loaded_models=max_loaded_models,
+            max_loaded_size_mb=max_loaded_size_mb,
+            prompt_cache=prompt_cache,
+            prompt_cache_size_mb=prompt_cache_size_mb,
         )
     except ServerException as exc:
         click.secho(f"Error creating server: {exc}", fg="red")
@@ -451,6 +539,48 @@ def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
     default="merlinite",
     help="model family to use when picking a generation template",
 )
+@click.option(
+    "--max-concurrent-requests",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of requests in flight to the model endpoint. Defaults to the request batch size times the pipeline depth. Without --endpoint-url, no more than the local server accepts at once: serve.max_queue_size + 1.",
+)
+@click.option(
+    "--pipeline-depth",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of prompt batches to keep in flight while earlier responses are filtered. 1 sends the next batch only after the previous one is processed.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the latest unfinished generate run for this model in the output directory.",
+)
+@click.option(
+    "--similarity-index/--no-similarity-index",
+    default=True,
+    show_default=True,
+    help="Only compute ROUGE-L scores against instructions that share enough tokens to exceed the rouge threshold. Accepted instructions are the same either way.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes reading and validating taxonomy files in parallel.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Read and validate every taxonomy file, ignoring results cached by earlier runs.",
+)
+@click.option(
+    "--chunk-tokenizer",
+    is_flag=True,
+    help="Size knowledge document chunks with the tokenizer of the served model (serve.model_path) rather than estimating tokens from words.",
+)
 @click.pass_context
 def generate(
     ctx,
@@ -472,6 +602,13 @@ def generate(
     tls_client_key,
     tls_client_passwd,
     model_family,
+    max_concurrent_requests,
+    pipeline_depth,
+    resume,
+    similarity_index,
+    jobs,
+    no_cache,
+    chunk_tokenizer,
 ):
     """Generates synthetic data to enhance your example data"""
     # pylint: disable=C0415
@@ -487,6 +624,16 @@ def generate(
         logger = ctx.obj.logger
         prompt_file_path = ctx.obj.config.generate.prompt_file
 
+    chunk_tokenizer_model = None
+    if chunk_tokenizer:
+        chunk_tokenizer_model = ctx.obj.config.serve.model_path
+        if not os.path.isfile(chunk_tokenizer_model):
+            click.secho(
+                f"Cannot load the tokenizer of {chunk_tokenizer_model}, the model file does not exist.",
+                fg="red",
+            )
+            raise click.exceptions.Exit(1)
+
     if endpoint_url:
         api_base = endpoint_url
     else:
@@ -542,6 +689,17 @@ def generate(
             tls_client_cert=tls_client_cert,
             tls_client_key=tls_client_key,
             tls_client_passwd=tls_client_passwd,
+            max_concurrent_requests=max_concurrent_requests,
+            pipeline_depth=pipeline_depth,
+            # the local server serves a request, and queues max_queue_size
+            server_concurrency=None
+            if endpoint_url
+            else ctx.obj.config.serve.max_queue_size + 1,
+            resume=resume,
+            similarity_index=similarity_index,
+            taxonomy_jobs=jobs,
+            taxonomy_cache=not no_cache,
+            chunk_tokenizer_model=chunk_tokenizer_model,
         )
     except GenerateException as exc:
         click.secho(
@@ -1,19 +1,28 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
+from collections import OrderedDict, deque
 from contextlib import redirect_stderr, redirect_stdout
-from time import sleep
+from pathlib import Path
+from queue import Empty
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
 import logging
+import math
 import multiprocessing
 import os
-import random
 import signal
 import socket
+import time
 
 # Third Party
-from llama_cpp import llama_chat_format
+from llama_cpp import Llama, llama_chat_format
+from llama_cpp.llama_cache import BaseLlamaCache, LlamaDiskCache, LlamaRAMCache
 from llama_cpp.server.app import create_app
-from llama_cpp.server.settings import Settings
+from llama_cpp.server.model import LlamaProxy
+from llama_cpp.server.settings import ModelSettings, Settings
+from starlette.responses import JSONResponse
 from uvicorn import Config
 import llama_cpp.server.app as llama_app
 import uvicorn
@@ -21,6 +30,7 @@ import uvicorn
 # Local
 from .client import ClientException, list_models
 from .config import get_api_base
+from .taxonomy_cache import cache_home
 
 templates = [
     {
@@ -39,7 +49,27 @@ class ServerException(Exception):
 
 
 class Server(uvicorn.Server):
-    """Override uvicorn.Server to handle SIGINT."""
+    """Override uvicorn.Server to handle SIGINT.
+
+    With idle_timeout, it exits once it had no connection and served no
+    request for that many seconds.
+    """
+
+    def __init__(self, config, idle_timeout=None):
+        super().__init__(config)
+        self.idle_timeout = idle_timeout
+        self._requests = 0
+        self._idle_since = time.monotonic()
+
+    async def on_tick(self, counter):
+        if self.idle_timeout:
+            state = self.server_state
+            if state.connections or state.total_requests != self._requests:
+                self._requests = state.total_requests
+                self._idle_since = time.monotonic()
+            elif time.monotonic() - self._idle_since > self.idle_timeout:
+                return True
+        return await super().on_tick(counter)
 
     def handle_exit(self, sig, frame):
         # type: (int, Optional[FrameType]) -> None
@@ -47,6 +77,380 @@ class Server(uvicorn.Server):
             super().handle_exit(sig=sig, frame=frame)
 
 
+def chat_handler(model_family):
+    """Return a llama.cpp chat handler applying the template of a model family."""
+    template = ""
+    eos_token = "<|endoftext|>"
+    bos_token = ""
+    for template_dict in templates:
+        if template_dict["model"] == model_family:
+            template = template_dict["template"]
+            if template_dict["model"] == "mixtral":
+                eos_token = "</s>"
+                bos_token = "<s>"
+    return llama_chat_format.Jinja2ChatFormatter(
+        template=template,
+        eos_token=eos_token,
+        bos_token=bos_token,
+    ).to_chat_handler()
+
+
+# Loading a cached state copies all of it into the model, it's only worth it
+# for prompts sharing at least this many leading tokens with the state
+MIN_PROMPT_CACHE_PREFIX = 32
+
+
+class PromptCache(BaseLlamaCache):
+    """llama.cpp's prompt cache of a model, counting its hits and misses.
+
+    llama.cpp saves the state of the model after each completion in the
+    cache, keyed by the prompt and completion tokens. A completion looks up
+    the state sharing the longest prefix with its prompt and, if that is
+    longer than what the model evaluated last, loads it to only evaluate
+    the rest of the prompt. The states are kept by backend, a RAM or disk
+    cache of llama_cpp.
+
+    States sharing fewer than MIN_PROMPT_CACHE_PREFIX tokens with a prompt
+    are misses. Hits count the prompt tokens the state found holds.
+    """
+
+    def __init__(self, backend: BaseLlamaCache):
+        super().__init__(backend.capacity_bytes)
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        # updated as states are saved, the disk cache may have some already
+        self.size = backend.cache_size
+        self.entries = self._entries()
+
+    def _entries(self) -> int:
+        if isinstance(self.backend, LlamaRAMCache):
+            return len(self.backend.cache_state)
+        if isinstance(self.backend, LlamaDiskCache):
+            return len(self.backend.cache)
+        return 0
+
+    @property
+    def cache_size(self) -> int:
+        return self.backend.cache_size
+
+    def __getitem__(self, key: Sequence[int]):
+        try:
+            state = self.backend[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        prefix = Llama.longest_token_prefix(state.input_ids.tolist(), key)
+        if prefix < MIN_PROMPT_CACHE_PREFIX:
+            if isinstance(self.backend, LlamaDiskCache):
+                # the disk cache hands states out, to be saved again after
+                # the completion, so keep the one this prompt won't use
+                self[state.input_ids.tolist()] = state
+            self.misses += 1
+            raise KeyError("No cached prefix")
+        if isinstance(self.backend, LlamaDiskCache):
+            self.size = self.backend.cache_size
+            self.entries = self._entries()
+        self.hits += 1
+        self.reused_tokens += prefix
+        return state
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        return key in self.backend
+
+    def __setitem__(self, key: Sequence[int], value):
+        self.backend[key] = value
+        self.size = self.backend.cache_size
+        self.entries = self._entries()
+
+    def clear(self):
+        """Drop the states kept in RAM, when the model is unloaded."""
+        if isinstance(self.backend, LlamaRAMCache):
+            self.backend.cache_state.clear()
+            self.size = self.entries = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "type": "disk" if isinstance(self.backend, LlamaDiskCache) else "ram",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "reused_tokens": self.reused_tokens,
+            "entries": self.entries,
+            "size_bytes": self.size,
+            "capacity_bytes": self.capacity_bytes,
+        }
+
+
+def prompt_cache_dir(model_path) -> Path:
+    """Return the directory of the disk prompt cache of a model."""
+    digest = hashlib.sha256(str(Path(model_path).resolve()).encode("utf-8"))
+    return cache_home() / "prompt_cache" / digest.hexdigest()[:16]
+
+
+class ModelPool:  # pylint: disable=too-many-instance-attributes
+    """The models served by ilab serve, loaded when requests use them.
+
+    It stands in for llama_cpp.server's LlamaProxy, which keeps a single
+    model loaded. A request picks a model by the path it was given or the
+    file name without .gguf, in its model field. Requests naming no served
+    model get the first one, like with LlamaProxy.
+
+    Each model gets the chat handler of its family. Up to max_loaded models
+    stay loaded, and with max_loaded_size, the sizes of their files add up
+    to at most that many bytes. Loading another model unloads the least
+    recently used ones beyond those limits.
+
+    With prompt_cache, "ram" or "disk", each model gets a PromptCache of
+    prompt_cache_size bytes. The caches, and their metrics, outlive the
+    models being unloaded, but RAM caches drop their states then.
+    """
+
+    def __init__(
+        self,
+        models: List[Tuple[ModelSettings, str]],
+        max_loaded: int = 1,
+        max_loaded_size: Optional[int] = None,
+        prompt_cache: Optional[str] = None,
+        prompt_cache_size: int = 2 << 30,
+    ):
+        self.max_loaded = max_loaded
+        self.max_loaded_size = max_loaded_size
+        self.prompt_cache = prompt_cache
+        self.prompt_cache_size = prompt_cache_size
+        self.prompt_caches: Dict[str, PromptCache] = {}
+        self._models: Dict[str, Tuple[ModelSettings, str]] = {}
+        self._names: Dict[str, str] = {}
+        for settings, model_family in models:
+            alias = settings.model_alias or settings.model
+            self._models[alias] = (settings, model_family)
+            self._names.setdefault(Path(settings.model).stem, alias)
+        self._names.update((alias, alias) for alias in self._models)
+        self._default_alias = next(iter(self._models))
+        self._loaded: "OrderedDict[str, Llama]" = OrderedDict()
+        self._chat_handlers: Dict[
+            str, llama_chat_format.LlamaChatCompletionHandler
+        ] = {}
+
+    def _model_size(self, alias: str) -> int:
+        return os.path.getsize(self._models[alias][0].model)
+
+    def _chat_handler(self, model_family):
+        handler = self._chat_handlers.get(model_family)
+        if handler is None:
+            handler = self._chat_handlers[model_family] = chat_handler(model_family)
+        return handler
+
+    def _prompt_cache(self, alias: str) -> PromptCache:
+        cache = self.prompt_caches.get(alias)
+        if cache is None:
+            if self.prompt_cache == "disk":
+                backend: BaseLlamaCache = LlamaDiskCache(
+                    cache_dir=str(prompt_cache_dir(self._models[alias][0].model)),
+                    capacity_bytes=self.prompt_cache_size,
+                )
+            else:
+                backend = LlamaRAMCache(capacity_bytes=self.prompt_cache_size)
+            cache = self.prompt_caches[alias] = PromptCache(backend)
+        return cache
+
+    def _add(self, alias: str, llama: Llama):
+        llama.chat_handler = self._chat_handler(self._models[alias][1])
+        if self.prompt_cache:
+            llama.set_cache(self._prompt_cache(alias))
+        self._loaded[alias] = llama
+
+    def adopt(self, llama: Llama):
+        """Add the first model, loaded elsewhere."""
+        self._add(self._default_alias, llama)
+
+    def _unload_for(self, alias: str):
+        """Unload the least recently used models to make room for alias."""
+        size = self._model_size(alias) if self.max_loaded_size else 0
+        loaded_size = sum(self._model_size(a) for a in self._loaded) if size else 0
+        while self._loaded and (
+            len(self._loaded) >= self.max_loaded
+            or (size and loaded_size + size > self.max_loaded_size)
+        ):
+            evicted, _ = self._loaded.popitem(last=False)
+            if evicted in self.prompt_caches:
+                self.prompt_caches[evicted].clear()
+            if size:
+                loaded_size -= self._model_size(evicted)
+
+    def __call__(self, model: Optional[str] = None) -> Llama:
+        alias = self._names.get(model, self._default_alias)
+        llama = self._loaded.get(alias)
+        if llama is not None:
+            self._loaded.move_to_end(alias)
+            return llama
+        self._unload_for(alias)
+        llama = LlamaProxy.load_llama_from_model_settings(self._models[alias][0])
+        self._add(alias, llama)
+        return llama
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._models)
+
+    def free(self):
+        self._loaded.clear()
+
+    def prompt_cache_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {alias: cache.metrics() for alias, cache in self.prompt_caches.items()}
+
+
+class RequestQueue:
+    """ASGI middleware serving the model's requests one at a time, in order.
+
+    llama.cpp runs a single model, which the API requests under /v1/ take
+    turns on. The request being served holds the model while up to
+    max_queue_size others wait for it in a FIFO queue. Requests arriving
+    when the queue is full are answered 429, with a Retry-After header
+    estimated from how long recent requests held the model.
+    """
+
+    # weight of the last request in the average time requests hold the model
+    SERVICE_TIME_WEIGHT = 0.2
+
+    def __init__(self, app, max_queue_size: int):
+        self.app = app
+        self.max_queue_size = max_queue_size
+        self._busy = False
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_time = 1.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/v1/"):
+            await self.app(scope, receive, send)
+            return
+        if self._busy:
+            if len(self._waiters) >= self.max_queue_size:
+                await self._reject(scope, receive, send)
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.cancelled():
+                    self._waiters.remove(waiter)
+                else:
+                    # the model was handed over as the request was cancelled
+                    self._release()
+                raise
+        else:
+            self._busy = True
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._service_time += self.SERVICE_TIME_WEIGHT * (
+                time.monotonic() - start - self._service_time
+            )
+            self._release()
+
+    def _release(self):
+        """Hand the model over to the longest waiting request, if any."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._busy = False
+
+    async def _reject(self, scope, receive, send):
+        retry_after = math.ceil(self._service_time * (len(self._waiters) + 1))
+        response = JSONResponse(
+            {
+                "error": {
+                    "message": f"The server is busy, {len(self._waiters)} requests are queued. Retry after {retry_after} seconds.",
+                    "type": "server_busy",
+                }
+            },
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+        )
+        await response(scope, receive, send)
+
+
+def server_config(app, host, port, max_queue_size=0, keep_alive_timeout=5):
+    """Return the uvicorn configuration to serve app with.
+
+    Without a request queue, a single client is served at a time and
+    connections are closed after each request. With one, the RequestQueue
+    middleware the app was given schedules the requests of any number of
+    clients, which can keep their connections open.
+    """
+    if not max_queue_size:
+        return Config(
+            app,
+            host=host,
+            port=port,
+            log_level=logging.ERROR,
+            limit_concurrency=2,  # Make sure we only serve a single client at a time
+            timeout_keep_alive=0,  # prevent clients holding connections open (we only have 1)
+        )
+    return Config(
+        app,
+        host=host,
+        port=port,
+        log_level=logging.ERROR,
+        timeout_keep_alive=keep_alive_timeout,
+    )
+
+
+# Seconds a temporary server gets to load its model, and between reports
+# that it's still loading
+TEMP_SERVER_STARTUP_TIMEOUT = 600
+STARTUP_PROGRESS_INTERVAL = 5
+
+
+def wait_for_server(logger, server_process, queue, timeout):
+    """Wait for a temporary server to load its model, return the port it listens on.
+
+    The server process puts the port on the queue once it's ready, or the
+    exception it failed with.
+    """
+    start = time.monotonic()
+    while True:
+        try:
+            message = queue.get(timeout=STARTUP_PROGRESS_INTERVAL)
+        except Empty:
+            elapsed = time.monotonic() - start
+            if not server_process.is_alive():
+                raise ServerException(
+                    f"temporary server exited with code {server_process.exitcode}"
+                ) from None
+            if elapsed >= timeout:
+                raise ServerException(
+                    f"temporary server not ready after {timeout} seconds"
+                ) from None
+            logger.info(f"Waiting for the server to load the model ({elapsed:.0f}s)...")
+            continue
+        if isinstance(message, BaseException):
+            raise message
+        return message
+
+
+def temp_server_kwargs(serve_config, model_family):
+    """Return the server() arguments of a server started for chat or generate."""
+    return {
+        "model_path": serve_config.model_path,
+        "gpu_layers": serve_config.gpu_layers,
+        "max_ctx_size": serve_config.max_ctx_size,
+        "model_family": model_family,
+        "max_queue_size": serve_config.max_queue_size,
+        "keep_alive_timeout": serve_config.keep_alive_timeout,
+        "prompt_cache": serve_config.prompt_cache,
+        "prompt_cache_size_mb": serve_config.prompt_cache_size_mb,
+        # the server binds a port the system picks and reports it
+        "port": 0,
+        "host": serve_config.host_port.rsplit(":", 1)[0],
+    }
+
+
 def ensure_server(
     logger,
     serve_config,
@@ -55,9 +459,13 @@ def ensure_server(
     tls_client_key,
     tls_client_passwd,
     model_family,
+    startup_timeout=TEMP_SERVER_STARTUP_TIMEOUT,
 ):
     """Checks if server is running, if not starts one as a subprocess. Returns the server process
-    and the URL where it's available."""
+    and the URL where it's available, once it loaded its model.
+
+    With serve_config.daemon, the server is started as a daemon, or one
+    started earlier is used, and no server process is returned."""
     try:
         api_base = serve_config.api_base()
         logger.debug(f"Trying to connect to {api_base}...")
@@ -68,74 +476,62 @@ def ensure_server(
             tls_client_cert=tls_client_cert,
             tls_client_key=tls_client_key,
             tls_client_passwd=tls_client_passwd,
+            # a refused connection won't be accepted on a retry
+            max_retries=0,
         )
         return (None, None, None)
         # pylint: enable=duplicate-code
     except ClientException:
-        tried_ports = set()
+        if serve_config.daemon:
+            # pylint: disable=C0415
+            # Local
+            from .daemon import ensure_daemon
+
+            logger.debug(f"Connection to {api_base} failed. Looking for a daemon...")
+            # pylint: disable=duplicate-code
+            daemon_api_base = ensure_daemon(
+                logger,
+                serve_config,
+                tls_insecure,
+                tls_client_cert,
+                tls_client_key,
+                tls_client_passwd,
+                model_family,
+                startup_timeout,
+            )
+            # pylint: enable=duplicate-code
+            return (None, daemon_api_base, None)
+
         mpctx = multiprocessing.get_context(None)
         # use a queue to communicate between the main process and the server process
         queue = mpctx.Queue()
-        port = random.randint(1024, 65535)
         host = serve_config.host_port.rsplit(":", 1)[0]
-        logger.debug(f"Trying port {port}...")
-
-        # extract address provided in the config
-        while not can_bind_to_port(host, port):
-            logger.debug(f"Port {port} is not available.")
-            # add the port to the map so that we can avoid using the same one
-            tried_ports.add(port)
-            port = random.randint(1024, 65535)
-            while True:
-                # if all the ports have been tried, exit
-                if len(tried_ports) == 65535 - 1024:
-                    # pylint: disable=raise-missing-from
-                    raise SystemExit(
-                        "No available ports to start the temporary server."
-                    )
-                if port in tried_ports:
-                    logger.debug(f"Port {port} has already been tried.")
-                    port = random.randint(1024, 65535)
-                else:
-                    break
-        logger.debug(f"Port {port} is available.")
-
-        host_port = f"{host}:{port}"
-        temp_api_base = get_api_base(host_port)
         logger.debug(
-            f"Connection to {api_base} failed. Starting a temporary server at {temp_api_base}..."
+            f"Connection to {api_base} failed. Starting a temporary server on {host}..."
         )
         # create a temporary, throw-away logger
-        logger = logging.getLogger(host_port)
-        logger.setLevel(logging.FATAL)
+        server_logger = logging.getLogger(f"{host}:0")
+        server_logger.setLevel(logging.FATAL)
         server_process = mpctx.Process(
             target=server,
             kwargs={
-                "logger": logger,
-                "model_path": serve_config.model_path,
-                "gpu_layers": serve_config.gpu_layers,
-                "max_ctx_size": serve_config.max_ctx_size,
-                "model_family": model_family,
-                "port": port,
-                "host": host,
+                "logger": server_logger,
                 "queue": queue,
+                **temp_server_kwargs(serve_config, model_family),
             },
         )
         server_process.start()
+        try:
+            port = wait_for_server(logger, server_process, queue, startup_timeout)
+        except BaseException:
+            server_process.terminate()
+            server_process.join(timeout=30)
+            queue.close()
+            queue.join_thread()
+            raise
 
-        # in case the server takes some time to fail we wait a bit
-        count = 0
-        while server_process.is_alive():
-            sleep(0.1)
-            if count > 10:
-                break
-            count += 1
-
-        # if the queue is not empty it means the server failed to start
-        if not queue.empty():
-            # pylint: disable=raise-missing-from
-            raise queue.get()
-
+        temp_api_base = get_api_base(f"{host}:{port}")
+        logger.debug(f"Temporary server is ready at {temp_api_base}.")
         return (server_process, temp_api_base, queue)
 
 
@@ -149,8 +545,24 @@ def server(
     host="localhost",
     port=8000,
     queue=None,
+    max_queue_size=0,
+    keep_alive_timeout=5,
+    models=None,
+    max_loaded_models=1,
+    max_loaded_size_mb=None,
+    prompt_cache=None,
+    prompt_cache_size_mb=2048,
+    idle_timeout=None,
 ):
-    """Start OpenAI-compatible server"""
+    """Start OpenAI-compatible server
+
+    models lists the (path, family) of more models to serve than model_path,
+    of which max_loaded_models, taking up to max_loaded_size_mb, are kept
+    loaded. prompt_cache, "ram" or "disk", keeps up to prompt_cache_size_mb
+    of llama.cpp states for each model, whose metrics are served at
+    /prompt-cache. With idle_timeout, the server exits after that many
+    seconds without requests.
+    """
     settings = Settings(
         host=host,
         port=port,
@@ -177,23 +589,27 @@ def server(
             return
         raise ServerException(f"failed creating the server application: {exc}") from exc
 
-    template = ""
-    eos_token = "<|endoftext|>"
-    bos_token = ""
-    for template_dict in templates:
-        if template_dict["model"] == model_family:
-            template = template_dict["template"]
-            if template_dict["model"] == "mixtral":
-                eos_token = "</s>"
-                bos_token = "<s>"
     try:
-        llama_app._llama_proxy._current_model.chat_handler = (
-            llama_chat_format.Jinja2ChatFormatter(
-                template=template,
-                eos_token=eos_token,
-                bos_token=bos_token,
-            ).to_chat_handler()
+        model_fields = settings.model_dump(include=set(ModelSettings.model_fields))
+        model_settings = [
+            (ModelSettings(**dict(model_fields, model=path)), family or model_family)
+            for path, family in [(model_path, model_family), *(models or [])]
+        ]
+        pool = ModelPool(
+            model_settings,
+            max_loaded=max_loaded_models or 1,
+            max_loaded_size=max_loaded_size_mb * 2**20 if max_loaded_size_mb else None,
+            prompt_cache=prompt_cache,
+            prompt_cache_size=(prompt_cache_size_mb or 2048) * 2**20,
         )
+        # create_app loaded the first model already
+        pool.adopt(llama_app._llama_proxy._current_model)
+        llama_app._llama_proxy = pool
+
+        @app.get("/prompt-cache")
+        def read_prompt_cache():
+            return pool.prompt_cache_metrics()
+
     # pylint: disable=broad-exception-caught
     except Exception as exc:
         if queue:
@@ -203,20 +619,38 @@ def server(
             return
         raise ServerException(f"failed creating the server application: {exc}") from exc
 
+    sockets = None
+    if queue:
+        # bind here, so that the port is known, and connections wait in the
+        # backlog instead of being refused until uvicorn accepts them
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+            sock.listen(2048)
+        except OSError as exc:
+            queue.put(ServerException(f"failed binding to {host}:{port}: {exc}"))
+            queue.close()
+            queue.join_thread()
+            return
+        sockets = [sock]
+        port = sock.getsockname()[1]
+
     logger.info("Starting server process, press CTRL+C to shutdown server...")
     logger.info(
         f"After application startup complete see http://{host}:{port}/docs for API."
     )
 
-    config = Config(
-        app,
-        host=host,
-        port=port,
-        log_level=logging.ERROR,
-        limit_concurrency=2,  # Make sure we only serve a single client at a time
-        timeout_keep_alive=0,  # prevent clients holding connections open (we only have 1)
-    )
-    s = Server(config)
+    if max_queue_size:
+        logger.info(
+            f"Serving concurrent clients, queueing up to {max_queue_size} requests."
+        )
+        app.add_middleware(RequestQueue, max_queue_size=max_queue_size)
+    config = server_config(app, host, port, max_queue_size, keep_alive_timeout)
+    s = Server(config, idle_timeout=idle_timeout)
+    if queue:
+        # the model is loaded, tell ensure_server where to find it
+        queue.put(port)
 
     # If this is not the main process, this is the temp server process that ran in the background
     # after `ilab chat` was executed.
@@ -229,24 +663,15 @@ def server(
             redirect_stdout(f),
             redirect_stderr(f),
         ):
-            s.run()
+            s.run(sockets=sockets)
     else:
-        s.run()
+        s.run(sockets=sockets)
 
     if queue:
         queue.close()
         queue.join_thread()
 
 
-def can_bind_to_port(host, port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        try:
-            s.bind((host, port))
-            return True
-        except socket.error:
-            return False
-
-
 def is_temp_server_running():
     """Check if the temp server is running."""
     return multiprocessing.current_process().name != "MainProcess"
@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from functools import cache
+from importlib import resources
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+# Bump when a change to reading taxonomy files changes what would be cached
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_MAX_ENTRIES = 10000
+
+# LogRecord attributes kept to replay the messages of a cached file
+_RECORD_FIELDS = (
+    "name",
+    "msg",
+    "levelname",
+    "levelno",
+    "pathname",
+    "filename",
+    "module",
+    "lineno",
+    "funcName",
+    "exc_text",
+)
+
+
+def cache_home() -> Path:
+    """Return the directory instructlab keeps its caches in."""
+    cache_root = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache_root, "instructlab")
+
+
+def default_cache_dir() -> Path:
+    return cache_home() / "taxonomy"
+
+
+@cache
+def schema_digest() -> str:
+    """Return a digest of the taxonomy schema files shipped with instructlab."""
+    digest = hashlib.sha256()
+
+    def update(path, name):
+        if path.is_dir():
+            for child in sorted(path.iterdir(), key=lambda child: child.name):
+                update(child, f"{name}/{child.name}")
+        elif name.endswith(".json"):
+            digest.update(name.encode("utf-8") + b"\0")
+            digest.update(path.read_bytes())
+
+    update(resources.files("instructlab").joinpath("schema"), "schema")
+    return digest.hexdigest()
+
+
+class TaxonomyCache:
+    """An on-disk cache of the results of reading taxonomy files.
+
+    An entry holds the (data, warnings, errors) read_taxonomy_file() returned
+    for a file, along with the log records it emitted, so that a cache hit
+    reports exactly what reading the file did. Its key is a digest of the
+    file's path and content, the schema files, the yamllint rules and
+    CACHE_FORMAT_VERSION: changing any of them misses the cache. The commit
+    knowledge documents are read from isn't part of it, so only files whose
+    documents are pinned to a full commit hash are cached.
+
+    Entries are json files in cache_dir. Reading one marks it as recently
+    used, and prune() removes the least recently used beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        yaml_rules: str,
+        cache_dir: Optional[Path] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_entries = max_entries
+        self._prefix = hashlib.sha256(
+            json.dumps([CACHE_FORMAT_VERSION, schema_digest(), yaml_rules]).encode(
+                "utf-8"
+            )
+        ).digest()
+        self._added = False
+
+    def key(self, file_path) -> Optional[str]:
+        """Return the key of a taxonomy file, None if it can't be read."""
+        file_path = Path(file_path).resolve()
+        try:
+            contents = file_path.read_bytes()
+        except OSError:
+            return None
+        digest = hashlib.sha256(self._prefix)
+        digest.update(str(file_path).encode("utf-8") + b"\0")
+        digest.update(contents)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Tuple[Any, List[logging.LogRecord]]]:
+        """Return the result and log records cached for key, if any."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        records = [logging.makeLogRecord(fields) for fields in entry["records"]]
+        return tuple(entry["result"]), records
+
+    def put(self, key: str, result, records: List[logging.LogRecord]):
+        """Cache the result and log records of reading a file."""
+        entry = {
+            "result": result,
+            "records": [
+                {field: getattr(record, field, None) for field in _RECORD_FIELDS}
+                for record in records
+            ],
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._added = True
+
+    def prune(self):
+        """Remove the least recently used entries beyond max_entries."""
+        if not self._added:
+            return
+        self._added = False
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries :]:
+            path.unlink(missing_ok=True)
@@ -1,19 +1,26 @@
 # SPDX-License-Identifier: Apache-2.0
 
+# pylint: disable=too-many-lines
+
 # Standard
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import cache, wraps
 from logging import Logger
 from pathlib import Path
-from typing import Any, Dict, List, Mapping, Optional, Union
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple, Union
 import copy
-import glob
+import fcntl
+import fnmatch
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import platform
 import re
+import shutil
 import subprocess
-import tempfile
+import time
 
 # Third Party
 from git import Repo, exc
@@ -25,6 +32,8 @@ import yaml
 
 # Local
 from . import common
+from .config import DEFAULT_MULTIPROCESSING_START_METHOD
+from .taxonomy_cache import TaxonomyCache, cache_home
 
 DEFAULT_YAML_RULES = """\
 extends: relaxed
@@ -36,6 +45,12 @@ rules:
 
 DEFAULT_CHUNK_OVERLAP = 100
 
+# Number of files linted by a single yamllint process
+YAMLLINT_BATCH_SIZE = 500
+
+# Number of knowledge document sources fetched concurrently
+DOCUMENT_FETCH_WORKERS = 8
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(levelname)s %(asctime)s %(filename)s:%(lineno)d %(message)s",
@@ -116,7 +131,7 @@ def make_lab_diff_aliases(cli, diff):
     lab_check.help = "Check that taxonomy is valid"
     lab_check.deprecated = True
     # use `--quiet` for current `lab check` behavior
-    lab_check.params = lab_check.params[:3]
+    lab_check.params = [param for param in lab_check.params if param.name != "quiet"]
 
     def lab_check_callback(*args, **kwargs):
         click.secho(
@@ -141,6 +156,43 @@ def istaxonomyfile(fn):
     return False
 
 
+def _first_parent_in_branches(repo, re_git_branch, base):
+    """Return the first commit of HEAD's first-parent history that is contained
+    in a branch whose `git branch -a` line matches re_git_branch.
+
+    A single rev-list lists the first parents of HEAD that none of those
+    branches contain, the commit we want is the parent of the last one.
+    """
+    branches = []
+    for line in repo.git.for_each_ref(
+        "--format=%(refname)%09%(symref)", "refs/heads", "refs/remotes"
+    ).splitlines():
+        refname, symref = line.split("\t")
+        if refname.startswith("refs/heads/"):
+            name = refname[len("refs/heads/") :]
+        else:
+            name = "remotes/" + refname[len("refs/remotes/") :]
+            if symref:
+                name += " -> " + symref[len("refs/remotes/") :]
+        # same as matching the output of `git branch -a --contains`
+        if re_git_branch.findall(name):
+            branches.append(refname)
+    if branches:
+        not_in_branches = repo.git.rev_list(
+            "--first-parent", "HEAD", "--not", *branches, "--"
+        ).split()
+        if not not_in_branches:
+            return repo.commit("HEAD")
+        parents = repo.commit(not_in_branches[-1]).parents
+        if parents:
+            return parents[0]
+    raise SystemExit(
+        yaml.YAMLError(
+            f'Couldn\'t find the taxonomy base branch "{base}" from the current HEAD'
+        )
+    )
+
+
 def get_taxonomy_diff(repo="taxonomy", base="origin/main"):
     repo = git.Repo(repo)
     untracked_files = [u for u in repo.untracked_files if istaxonomyfile(u)]
@@ -162,27 +214,21 @@ def get_taxonomy_diff(repo="taxonomy", base="origin/main"):
                 )
             ) from e
 
-    # Move backwards from HEAD until we find the first commit that is part of base
-    # then we can take our diff from there
-    current_commit = repo.commit("HEAD")
-    while not head_commit:
-        branches = repo.git.branch("-a", "--contains", current_commit.hexsha)
-        if re_git_branch.findall(branches):
-            head_commit = current_commit
-            break
-        try:
-            current_commit = current_commit.parents[0]
-        except IndexError as e:
-            raise SystemExit(
-                yaml.YAMLError(
-                    f'Couldn\'t find the taxonomy base branch "{base}" from the current HEAD'
-                )
-            ) from e
+    if not head_commit:
+        head_commit = _first_parent_in_branches(repo, re_git_branch, base)
 
     modified_files = [
-        d.b_path
-        for d in head_commit.diff(None)
-        if not d.deleted_file and istaxonomyfile(d.b_path)
+        path
+        for path in repo.git.diff(
+            head_commit.hexsha,
+            "--name-only",
+            "--diff-filter=d",
+            "-M",
+            "-z",
+            "--",
+            *TAXONOMY_FOLDERS,
+        ).split("\0")
+        if path and istaxonomyfile(path)
     ]
 
     updated_taxonomy_files = list(set(untracked_files + modified_files))
@@ -192,11 +238,14 @@ def get_taxonomy_diff(repo="taxonomy", base="origin/main"):
 def get_documents(
     logger,
     source: Dict[str, Union[str, List[str]]],
-    skip_checkout: bool = False,
 ) -> List[str]:
     """
     Retrieve the content of files from a Git repository.
 
+    Repositories are fetched into a mirror kept in the instructlab cache
+    directory, and files are read from the commit's tree without a checkout.
+    Mirrors no commit was read from for MIRROR_MAX_AGE are removed.
+
     Args:
         source (dict): Source info containing repository URL, commit hash, and list of file patterns.
 
@@ -206,37 +255,127 @@ def get_documents(
     repo_url = source.get("repo")
     commit_hash = source.get("commit")
     file_patterns = source.get("patterns")
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            repo = git_clone_checkout(
-                repo_url=repo_url,
-                commit_hash=commit_hash,
-                temp_dir=temp_dir,
-                skip_checkout=skip_checkout,
-            )
-            file_contents = []
+    logger.debug("Processing files...")
+    file_contents = _read_documents(repo_url, commit_hash, tuple(file_patterns))
+    if file_contents:
+        return list(file_contents)
+    raise SystemExit("Couldn't find knowledge documents")
 
-            logger.debug("Processing files...")
-            for pattern in file_patterns:
-                for file_path in glob.glob(os.path.join(repo.working_dir, pattern)):
-                    if os.path.isfile(file_path) and file_path.endswith(".md"):
-                        with open(file_path, "r", encoding="utf-8") as file:
-                            file_contents.append(file.read())
 
-            if file_contents:
-                return file_contents
-            raise SystemExit("Couldn't find knowledge documents")
-        except (OSError, exc.GitCommandError, FileNotFoundError) as e:
-            raise e
+# Mirrors no commit was read from for this many seconds are removed when
+# another repository is fetched
+MIRROR_MAX_AGE = 30 * 24 * 3600
 
 
-def git_clone_checkout(
-    repo_url: str, temp_dir: str, commit_hash: str, skip_checkout: bool
-) -> Repo:
-    repo = Repo.clone_from(repo_url, temp_dir)
-    if not skip_checkout:
-        repo.git.checkout(commit_hash)
-    return repo
+def _mirror_path(repo_url: str) -> Path:
+    digest = hashlib.sha256(repo_url.encode("utf-8")).hexdigest()
+    return cache_home() / "repos" / f"{digest}.git"
+
+
+def _fetch_commit(repo_url: str, commit_hash: str) -> git.Commit:
+    """Return a commit of a repository from its mirror, fetching it if needed.
+
+    A full commit hash names the same commit forever, so one the mirror has
+    is read from it, and others are fetched on their own, with their history
+    so that the mirror isn't shallow. Branch and tag names, abbreviated
+    hashes, and commits the server won't send that way, are resolved after
+    fetching the repository's branches and tags, so that they don't resolve
+    to what an earlier fetch found.
+    """
+    mirror_path = _mirror_path(repo_url)
+    mirror_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = Path(f"{mirror_path}.lock")
+    # other processes may be fetching into the same mirror
+    with open(lock_path, "w", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # the lock's mtime is when the mirror was last used
+        os.utime(lock_path)
+        repo = Repo.init(mirror_path, bare=True)
+        if re.fullmatch("[0-9a-f]{40}", commit_hash):
+            try:
+                return repo.commit(commit_hash)
+            except (gitdb.exc.BadName, ValueError):
+                pass
+            _prune_mirrors(mirror_path)
+            try:
+                repo.git.fetch(repo_url, commit_hash)
+                return repo.commit(commit_hash)
+            except (exc.GitCommandError, gitdb.exc.BadName, ValueError):
+                pass
+        else:
+            _prune_mirrors(mirror_path)
+        # commits behind a mirror shallow-fetched by earlier versions are missing
+        unshallow = ["--unshallow"] if Path(repo.git_dir, "shallow").exists() else []
+        repo.git.fetch(
+            *unshallow,
+            repo_url,
+            "+refs/heads/*:refs/heads/*",
+            "+refs/tags/*:refs/tags/*",
+        )
+        return repo.commit(commit_hash)
+
+
+def _prune_mirrors(in_use: Path):
+    """Remove the mirrors no commit was read from for MIRROR_MAX_AGE seconds."""
+    now = time.time()
+    for lock_path in in_use.parent.glob("*.git.lock"):
+        mirror_path = lock_path.with_suffix("")
+        if mirror_path == in_use or not mirror_path.exists():
+            continue
+        try:
+            if now - lock_path.stat().st_mtime < MIRROR_MAX_AGE:
+                continue
+        except FileNotFoundError:
+            continue
+        # the lock file is kept, other processes may be waiting on it
+        with open(lock_path, "a", encoding="utf-8") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            shutil.rmtree(mirror_path, ignore_errors=True)
+
+
+def _glob_match(name: str, pattern: str) -> bool:
+    """Match a path component like glob.glob() does."""
+    if not re.search("[*?[]", pattern):
+        return name == pattern
+    # glob's wildcards don't match hidden files
+    if name.startswith(".") and not pattern.startswith("."):
+        return False
+    return fnmatch.fnmatchcase(name, pattern)
+
+
+@cache
+def _read_documents(
+    repo_url: str, commit_hash: str, file_patterns: Tuple[str, ...]
+) -> Tuple[str, ...]:
+    """Read the markdown files matching glob patterns in a commit.
+
+    Reading the same files of the same commit again doesn't fetch or read
+    anything.
+    """
+    commit = _fetch_commit(repo_url, commit_hash)
+    blobs = [
+        item
+        for item in commit.tree.traverse()
+        # regular files only
+        if item.type == "blob" and item.mode & 0o170000 == 0o100000
+    ]
+    file_contents = []
+    for pattern in file_patterns:
+        parts = [part for part in pattern.split("/") if part not in ("", ".")]
+        for blob in blobs:
+            names = blob.path.split("/")
+            if (
+                blob.path.endswith(".md")
+                and len(names) == len(parts)
+                and all(map(_glob_match, names, parts))
+            ):
+                contents = blob.data_stream.read().decode("utf-8")
+                # like reading the file in text mode
+                file_contents.append(contents.replace("\r\n", "\n").replace("\r", "\n"))
+    return tuple(file_contents)
 
 
 def num_tokens_from_words(num_words) -> int:
@@ -247,13 +386,34 @@ def num_chars_from_tokens(num_tokens) -> int:
     return int(num_tokens * 4)  # 1 token ~ 4 English character
 
 
-def chunk_document(documents: List, server_ctx_size, chunk_word_count) -> List[str]:
+def model_token_counter(model_path: str) -> Callable[[str], int]:
+    """Return a function counting the tokens of a text with a GGUF model's tokenizer."""
+    # pylint: disable=C0415
+    # Third Party
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=model_path, vocab_only=True, verbose=False)
+
+    def count_tokens(text: str) -> int:
+        return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    return count_tokens
+
+
+def chunk_document(
+    documents: List,
+    server_ctx_size,
+    chunk_word_count,
+    token_counter: Optional[Callable[[str], int]] = None,
+) -> List[str]:
     """
     Iterates over the documents and splits them into chunks based on the word count provided by the user.
     Args:
         documents (dict): List of documents retrieved from git (can also consist of a single document).
         server_ctx_size (int): Context window size of server.
         chunk_word_count (int): Maximum number of words to chunk a document.
+        token_counter (Callable): Counts the tokens of a text, see model_token_counter().
+            If given, chunks are sized in tokens of the model rather than estimated from characters.
     Returns:
          List[str]: List of chunked documents.
     """
@@ -267,15 +427,22 @@ def chunk_document(documents: List, server_ctx_size, chunk_word_count) -> List[s
             )
         )
     content = []
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["\n\n", "\n", " "],
-        chunk_size=num_chars_from_tokens(no_tokens_per_doc),
-        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
-    )
+    if token_counter is None:
+        text_splitter = RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", " "],
+            chunk_size=num_chars_from_tokens(no_tokens_per_doc),
+            chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+        )
+    else:
+        text_splitter = RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", " "],
+            chunk_size=no_tokens_per_doc,
+            chunk_overlap=DEFAULT_CHUNK_OVERLAP // num_chars_from_tokens(1),
+            length_function=token_counter,
+        )
 
     for docs in documents:
-        temp = text_splitter.create_documents([docs])
-        content.extend([item.page_content for item in temp])
+        content.extend(text_splitter.split_text(docs))
 
     return content
 
@@ -321,12 +488,132 @@ def _load_schema(path: "importlib.resources.abc.Traversable") -> "referencing.Re
     return resource
 
 
+# Keywords of the taxonomy schemas that fastjsonschema checks the same way as
+# jsonschema's draft 2020-12 validator
+_FAST_SCHEMA_KEYWORDS = frozenset(
+    [
+        "const",
+        "items",
+        "minItems",
+        "minLength",
+        "properties",
+        "required",
+        "type",
+        "uniqueItems",
+    ]
+)
+# Keywords that don't affect validation
+_ANNOTATION_KEYWORDS = frozenset(["$comment", "description", "examples", "title"])
+
+
+# pylint: disable-next=too-many-return-statements
+def _fast_schema(schema, retrieve) -> Optional[Dict[str, Any]]:
+    """Translate a draft 2020-12 schema to one fastjsonschema supports.
+
+    fastjsonschema supports neither unevaluatedProperties nor relative $refs.
+    A $ref is merged into the schema referencing it, after which the only
+    evaluated properties are those of "properties", and unevaluatedProperties
+    is exactly additionalProperties. Returns None if the schema uses anything
+    else.
+    """
+    if not isinstance(schema, dict):
+        return None
+    fast: Dict[str, Any] = {}
+    for key, value in schema.items():
+        if key in _ANNOTATION_KEYWORDS:
+            continue
+        if key == "properties":
+            value = {name: _fast_schema(prop, retrieve) for name, prop in value.items()}
+            if None in value.values():
+                return None
+        elif key == "items":
+            value = _fast_schema(value, retrieve)
+            if value is None:
+                return None
+        elif key == "unevaluatedProperties":
+            if not isinstance(value, bool):
+                return None
+            key = "additionalProperties"
+        elif key not in _FAST_SCHEMA_KEYWORDS and key != "$ref":
+            return None
+        fast[key] = value
+
+    ref = fast.pop("$ref", None)
+    if ref is not None:
+        target = _fast_schema(retrieve(ref).contents, retrieve)
+        if target is None or "additionalProperties" in target:
+            return None
+        for key, value in target.items():
+            if key == "properties":
+                if fast.get("properties", {}).keys() & value.keys():
+                    return None
+                fast["properties"] = {**fast.get("properties", {}), **value}
+            elif key == "required":
+                required = fast.get("required", [])
+                fast["required"] = required + [r for r in value if r not in required]
+            elif key not in fast:
+                fast[key] = value
+            elif fast[key] != value:
+                return None
+    return fast
+
+
+def _fast_validator(schema, retrieve) -> Optional[Callable[[Any], Any]]:
+    """Compile a schema with fastjsonschema, if it is installed and supports it."""
+    # pylint: disable=C0415
+    try:
+        # Third Party
+        import fastjsonschema
+    except ImportError:
+        return None
+
+    fast_schema = _fast_schema(schema, retrieve)
+    if fast_schema is None:
+        return None
+    return fastjsonschema.compile(fast_schema)
+
+
+@cache
+def _schema_validators(
+    version: int, schema_name: str
+) -> Tuple["jsonschema.protocols.Validator", Optional[Callable[[Any], Any]]]:
+    """Return the validator of a schema, and its fastjsonschema validator if any.
+
+    The validators are built once per process.
+
+    Raises:
+        NoSuchResource: If the schema, or a schema it references, cannot be loaded.
+    """
+    # pylint: disable=C0415
+    # Standard
+    from importlib import resources
+
+    # Third Party
+    from jsonschema.validators import validator_for
+    from referencing import Registry, Resource
+    from referencing.typing import URI
+
+    schemas_path = resources.files("instructlab").joinpath(f"schema/v{version}")
+
+    def retrieve(uri: URI) -> Resource:
+        path = schemas_path.joinpath(uri)
+        return _load_schema(path)
+
+    schema = retrieve(f"{schema_name}.json").contents
+    validator_cls = validator_for(schema)
+    validator = validator_cls(schema, registry=Registry(retrieve=retrieve))
+    return validator, _fast_validator(schema, retrieve)
+
+
 def validate_yaml(
     logger: Logger, contents: Mapping[str, Any], taxonomy_path: Path
 ) -> int:
     """Validate the parsed yaml document using the taxonomy path to
     determine the proper schema.
 
+    When fastjsonschema is installed, documents it accepts are valid. Others
+    are validated again with jsonschema, which reports every error.
+
     Args:
         logger (Logger): The logger for errors/warnings.
         contents (Mapping): The parsed yaml document to validate against the schema.
@@ -338,23 +625,11 @@ def validate_yaml(
         Messages for each error have been logged.
     """
     # pylint: disable=C0415
-    # Standard
-    from importlib import resources
-
     # Third Party
-    from jsonschema.protocols import Validator
-    from jsonschema.validators import validator_for
-    from referencing import Registry, Resource
     from referencing.exceptions import NoSuchResource
-    from referencing.typing import URI
 
     errors = 0
     version = get_version(contents)
-    schemas_path = resources.files("instructlab").joinpath(f"schema/v{version}")
-
-    def retrieve(uri: URI) -> Resource:
-        path = schemas_path.joinpath(uri)
-        return _load_schema(path)
 
     schema_name = taxonomy_path.parts[0]
     if schema_name not in TAXONOMY_FOLDERS:
@@ -364,12 +639,13 @@ def validate_yaml(
         )
 
     try:
-        schema_resource = retrieve(f"{schema_name}.json")
-        schema = schema_resource.contents
-        validator_cls = validator_for(schema)
-        validator: Validator = validator_cls(
-            schema, registry=Registry(retrieve=retrieve)
-        )
+        validator, fast_validator = _schema_validators(version, schema_name)
+        if fast_validator is not None:
+            try:
+                fast_validator(contents)
+                return errors
+            except Exception:  # pylint: disable=broad-exception-caught
+                pass  # let jsonschema find and report the errors
 
         for validation_error in validator.iter_errors(contents):
             errors += 1
@@ -405,10 +681,84 @@ def get_version(contents: Mapping) -> int:
     return version
 
 
+def _yamllint_config_args(logger: Logger, yaml_rules: Optional[str]) -> List[str]:
+    if yaml_rules is not None:
+        if os.path.isfile(yaml_rules):
+            logger.debug(f"Using YAML rules from {yaml_rules}")
+            return ["-c", yaml_rules]
+        logger.debug(f"Cannot find {yaml_rules}. Using default rules.")
+    return ["-d", DEFAULT_YAML_RULES]
+
+
+def lint_yaml_files(
+    logger: Logger,
+    file_paths: List[Path],
+    yaml_rules: Optional[str] = None,
+    jobs: int = 1,
+) -> Dict[Path, List[str]]:
+    """Lint YAML files with the yamllint CLI.
+
+    Files are linted in batches of up to YAMLLINT_BATCH_SIZE per yamllint
+    process, so the interpreter startup and rules parsing are paid once per
+    batch rather than once per file. Up to jobs batches run at once.
+
+    Returns:
+        Dict[Path, List[str]]: The parsable problems found in each file, with
+        the file name prefix removed.
+    """
+    config_args = _yamllint_config_args(logger, yaml_rules)
+    problems: Dict[Path, List[str]] = {Path(p): [] for p in file_paths}
+    paths = list(problems)
+    batch_size = max(1, min(YAMLLINT_BATCH_SIZE, -(-len(paths) // max(jobs, 1))))
+
+    def lint_batch(batch: List[Path]):
+        yamllint_cmd = ["yamllint", "-f", "parsable", *config_args, "-s"]
+        try:
+            subprocess.check_output(
+                yamllint_cmd + [str(p) for p in batch],
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except subprocess.CalledProcessError as e:
+            found = False
+            for line in e.output.splitlines():
+                for path in batch:
+                    delim = str(path) + ":"
+                    if line.startswith(delim):
+                        problems[path].append(line.split(delim)[1])
+                        found = True
+                        break
+            # yamllint exits with 1 when it found problems, anything else
+            # without problems reported means it couldn't lint the files
+            if e.returncode != 1 and not found:
+                message = (e.stderr or e.output).strip() or f"exit code {e.returncode}"
+                logger.error(f"yamllint failed: {message}")
+                for path in batch:
+                    problems[path].append(f"yamllint failed: {message}")
+
+    batches = [paths[i : i + batch_size] for i in range(0, len(paths), batch_size)]
+    if jobs <= 1 or len(batches) <= 1:
+        for batch in batches:
+            lint_batch(batch)
+    else:
+        # the batches run in yamllint processes, threads are enough to wait on them
+        with ThreadPoolExecutor(max_workers=min(jobs, len(batches))) as executor:
+            list(executor.map(lint_batch, batches))
+    return problems
+
+
 # pylint: disable=broad-exception-caught
 def read_taxonomy_file(
-    logger: Logger, file_path: str, yaml_rules: Optional[str] = None
+    logger: Logger,
+    file_path: str,
+    yaml_rules: Optional[str] = None,
+    lint_problems: Optional[Mapping[Path, List[str]]] = None,
 ):
+    """Read the seed examples of a taxonomy file.
+
+    lint_problems are the results of lint_yaml_files() for a set of files that
+    includes this one. If it isn't given, the file is linted on its own.
+    """
     seed_instruction_data = []
     warnings = 0
     errors = 0
@@ -436,50 +786,12 @@ def read_taxonomy_file(
         # do general YAML linting if specified
         version = get_version(contents)
         if version > 1:  # no linting for version 1 yaml
-            if yaml_rules is not None:
-                is_file = os.path.isfile(yaml_rules)
-                if is_file:
-                    logger.debug(f"Using YAML rules from {yaml_rules}")
-                    yamllint_cmd = [
-                        "yamllint",
-                        "-f",
-                        "parsable",
-                        "-c",
-                        yaml_rules,
-                        file_path,
-                        "-s",
-                    ]
-                else:
-                    logger.debug(f"Cannot find {yaml_rules}. Using default rules.")
-                    yamllint_cmd = [
-                        "yamllint",
-                        "-f",
-                        "parsable",
-                        "-d",
-                        DEFAULT_YAML_RULES,
-                        file_path,
-                        "-s",
-                    ]
-            else:
-                yamllint_cmd = [
-                    "yamllint",
-                    "-f",
-                    "parsable",
-                    "-d",
-                    DEFAULT_YAML_RULES,
-                    file_path,
-                    "-s",
-                ]
-            try:
-                subprocess.check_output(yamllint_cmd, text=True)
-            except subprocess.SubprocessError as e:
-                lint_messages = [f"Problems found in file {file_path}"]
-                parsed_output = e.output.splitlines()
-                for p in parsed_output:
-                    errors += 1
-                    delim = str(file_path) + ":"
-                    parsed_p = p.split(delim)[1]
-                    lint_messages.append(parsed_p)
+            if lint_problems is None:
+                lint_problems = lint_yaml_files(logger, [file_path], yaml_rules)
+            problems = lint_problems.get(file_path, [])
+            if problems:
+                errors += len(problems)
+                lint_messages = [f"Problems found in file {file_path}"] + problems
                 logger.error("\n".join(lint_messages))
                 return None, warnings, errors
 
@@ -517,12 +829,221 @@ def read_taxonomy_file(
     return seed_instruction_data, warnings, errors
 
 
-def read_taxonomy(logger, taxonomy, taxonomy_base, yaml_rules):
+class _CapturingHandler(logging.Handler):
+    """Collect log records so that they can be replayed in another process."""
+
+    def __init__(self):
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record):
+        # make the record picklable, like logging.handlers.QueueHandler does
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _read_taxonomy_file_captured(file_path, yaml_rules, lint_problems):
+    """Run read_taxonomy_file, returning its log records too.
+
+    Every record is captured, whatever the level, so that the records can be
+    cached and replayed at any log level.
+    """
+    # not registered with logging, so records only go to the handler
+    logger = logging.Logger(f"{__name__}.read_taxonomy_file", logging.DEBUG)
+    handler = _CapturingHandler()
+    logger.addHandler(handler)
+    try:
+        result = read_taxonomy_file(logger, file_path, yaml_rules, lint_problems)
+        return result, None, handler.records
+    except TaxonomyReadingException as e:
+        return None, e, handler.records
+
+
+def _replay(logger, records):
+    for record in records:
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+def _read_uncached_files(file_paths, yaml_rules, lint_problems, jobs):
+    """Yield the result, exception and log records of each file, in order."""
+    tasks = []
+    for file_path in file_paths:
+        resolved = Path(file_path).resolve()
+        tasks.append(
+            (file_path, yaml_rules, {resolved: lint_problems.get(resolved, [])})
+        )
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _read_taxonomy_file_captured(*task)
+        return
+
+    workers = min(jobs, len(tasks))
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD),
+    )
+    try:
+        yield from executor.map(
+            _read_taxonomy_file_captured,
+            *zip(*tasks),
+            chunksize=max(1, len(tasks) // (4 * workers)),
+        )
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _document_source(file_path) -> Optional[Tuple[str, str]]:
+    """Return the (repo, commit) of a knowledge file's documents, if any."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            contents = yaml.safe_load(f)
+        document = contents.get("document")
+        repo_url, commit_hash = document.get("repo"), document.get("commit")
+    except Exception:  # pylint: disable=broad-exception-caught
+        return None  # reading the file reports its problems
+    if isinstance(repo_url, str) and isinstance(commit_hash, str):
+        return repo_url, commit_hash
+    return None
+
+
+def _prefetch_documents(logger, file_paths) -> Set[str]:
+    """Fetch the knowledge documents of taxonomy files concurrently.
+
+    Each (repo, commit) is fetched once, however many files use it, by up to
+    DOCUMENT_FETCH_WORKERS threads. Failures are logged for each source.
+
+    Returns:
+        Set[str]: The files whose documents couldn't be fetched.
+    """
+    sources: Dict[Tuple[str, str], List[str]] = {}
+    for file_path in file_paths:
+        if str(file_path).endswith(".yaml"):
+            source = _document_source(file_path)
+            if source is not None:
+                sources.setdefault(source, []).append(file_path)
+    if not sources:
+        return set()
+
+    def fetch(source):
+        try:
+            _fetch_commit(*source)
+            return None
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return e
+
+    logger.debug(f"Fetching the documents of {len(sources)} knowledge sources")
+    unfetched = set()
+    with ThreadPoolExecutor(
+        max_workers=min(DOCUMENT_FETCH_WORKERS, len(sources))
+    ) as executor:
+        for (source, files), e in zip(sources.items(), executor.map(fetch, sources)):
+            if e is not None:
+                repo_url, commit_hash = source
+                logger.error(
+                    f"Cannot fetch the documents of {repo_url} at {commit_hash} "
+                    f"for {', '.join(map(str, files))}: {e}"
+                )
+                unfetched.update(files)
+    return unfetched
+
+
+def _documents_pinned(file_path) -> bool:
+    """Return whether a taxonomy file has no documents, or has them at a full hash."""
+    source = _document_source(file_path) if str(file_path).endswith(".yaml") else None
+    return source is None or re.fullmatch("[0-9a-f]{40}", source[1]) is not None
+
+
+def _read_taxonomy_files(logger, file_paths, yaml_rules, jobs, taxonomy_cache=None):
+    """Yield the (data, warnings, errors) of each file, in order.
+
+    Files found in taxonomy_cache aren't read again. Files whose documents
+    are at a branch, tag or abbreviated hash aren't cached, as the commit
+    it resolves to may change without the file changing. The knowledge documents
+    of the others are fetched up front, and files whose documents can't be
+    fetched count as one error. The rest are linted together, then read by a
+    process pool if jobs is more than one. The log records of each file are
+    replayed together once it has been read.
+    """
+    keys = [
+        None if taxonomy_cache is None else taxonomy_cache.key(f) for f in file_paths
+    ]
+    entries = [None if key is None else taxonomy_cache.get(key) for key in keys]
+    uncached = [f for f, entry in zip(file_paths, entries) if entry is None]
+    if taxonomy_cache is not None:
+        logger.debug(
+            f"{len(file_paths) - len(uncached)} of {len(file_paths)} taxonomy files found in {taxonomy_cache.cache_dir}"
+        )
+    unfetched = _prefetch_documents(logger, uncached)
+    to_read = [f for f in uncached if f not in unfetched]
+    # lint all the files up front, version 1 files' problems are ignored
+    lint_problems = lint_yaml_files(
+        logger,
+        [
+            p
+            for p in (Path(f).resolve() for f in to_read)
+            if p.suffix == ".yaml" and p.is_file()
+        ],
+        yaml_rules,
+        jobs,
+    )
+    results = _read_uncached_files(to_read, yaml_rules, lint_problems, jobs)
+    try:
+        for file_path, key, entry in zip(file_paths, keys, entries):
+            if file_path in unfetched:
+                result = None, 0, 1
+            elif entry is None:
+                # results has an item for each file to read
+                # pylint: disable-next=stop-iteration-return
+                result, exception, records = next(results)
+                _replay(logger, records)
+                if exception is not None:
+                    raise exception
+                if key is not None and _documents_pinned(file_path):
+                    taxonomy_cache.put(key, result, records)
+            else:
+                result, records = entry
+                _replay(logger, records)
+            yield result
+    finally:
+        results.close()
+        if taxonomy_cache is not None:
+            taxonomy_cache.prune()
+
+
+def _yaml_rules_text(yaml_rules: Optional[str]) -> str:
+    """Return the yamllint configuration lint_yaml_files() uses."""
+    if yaml_rules is not None and os.path.isfile(yaml_rules):
+        with open(yaml_rules, "r", encoding="utf-8") as f:
+            return f.read()
+    return DEFAULT_YAML_RULES
+
+
+def read_taxonomy(
+    logger,
+    taxonomy,
+    taxonomy_base,
+    yaml_rules,
+    jobs: int = 1,
+    use_cache: bool = False,
+):
+    """Read the seed examples of a taxonomy file, or of the files of a taxonomy
+    changed since taxonomy_base, using up to jobs processes.
+
+    With use_cache, the results of reading files are kept in a TaxonomyCache,
+    and files whose content, schema and YAML rules haven't changed since they
+    were cached aren't read again.
+    """
+    taxonomy_cache = TaxonomyCache(_yaml_rules_text(yaml_rules)) if use_cache else None
     seed_instruction_data = []
     is_file = os.path.isfile(taxonomy)
     if is_file:  # taxonomy is file
-        seed_instruction_data, warnings, errors = read_taxonomy_file(
-            logger, taxonomy, yaml_rules
+        ((seed_instruction_data, warnings, errors),) = _read_taxonomy_files(
+            logger, [taxonomy], yaml_rules, jobs, taxonomy_cache
         )
         if warnings:
             logger.warn(
@@ -539,9 +1060,13 @@ def read_taxonomy(logger, taxonomy, taxonomy_base, yaml_rules):
             logger.debug("Found new taxonomy files:")
             for e in updated_taxonomy_files:
                 logger.debug(f"* {e}")
-        for f in updated_taxonomy_files:
-            file_path = os.path.join(taxonomy, f)
-            data, warnings, errors = read_taxonomy_file(logger, file_path, yaml_rules)
+        for data, warnings, errors in _read_taxonomy_files(
+            logger,
+            [os.path.join(taxonomy, f) for f in updated_taxonomy_files],
+            yaml_rules,
+            jobs,
+            taxonomy_cache,
+        ):
             total_warnings += warnings
             total_errors += errors
             if data:
@@ -2,15 +2,25 @@
 
 # Standard
 from unittest import mock
+import socket
 import sys
+import threading
+import time
 
 # Third Party
 import pytest
 
 # Local
+from .openai_stub import StubModel, StubOpenAIServer
 from .taxonomy import MockTaxonomy
 
 
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path_factory, monkeypatch):
+    """Keep the caches of the commands under test out of the user's home"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path_factory.mktemp("cache")))
+
+
 @pytest.fixture
 def taxonomy_dir(tmp_path):
     with MockTaxonomy(tmp_path) as taxonomy:
@@ -31,3 +41,48 @@ def mock_mlx_package():
     }
     with mock.patch.dict(sys.modules, mlx_modules):
         yield
+
+
+@pytest.fixture
+def stub_server(request):
+    """Start a stub OpenAI-compatible server, parametrize to change its behavior"""
+    server = StubOpenAIServer(**getattr(request, "param", {}))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def serve_stub():
+    """Serve a StubModel like `ilab serve` serves llama.cpp"""
+    # pylint: disable=C0415
+    # First Party
+    from instructlab.server import RequestQueue, Server, server_config
+
+    servers = []
+
+    def start(max_queue_size, keep_alive_timeout=5, delay=0.2):
+        model = StubModel(delay)
+        if max_queue_size:
+            model.app.add_middleware(RequestQueue, max_queue_size=max_queue_size)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server = Server(
+            server_config(
+                model.app, "127.0.0.1", port, max_queue_size, keep_alive_timeout
+            )
+        )
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        servers.append((server, thread))
+        while not server.started:
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{port}", model
+
+    yield start
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join()
@@ -0,0 +1,128 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+import time
+
+# Third Party
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def chat_completion(body, content=None):
+    """Return the completion of a chat request, echoing the prompt by default."""
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body["model"],
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": content
+                    if content is not None
+                    else "echo: " + body["messages"][-1]["content"],
+                },
+            }
+        ],
+    }
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """Minimal OpenAI-compatible chat completions server.
+
+    It echoes the prompt back, unless ``response`` is given: a function called
+    with the request number to build the reply.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.2, status=200, response=None):
+        super().__init__(("127.0.0.1", 0), StubOpenAIHandler)
+        self.delay = delay
+        self.status = status
+        self.response = response
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            request_number = server.requests
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        if server.status != 200:
+            payload = {"error": {"message": "bad request", "type": "invalid"}}
+        else:
+            payload = chat_completion(
+                body,
+                server.response(request_number) if server.response else None,
+            )
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubModel:
+    """An app standing in for llama.cpp, each completion takes delay seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # the name and client port of each completed request
+        self.served = []
+        self.app = Starlette(
+            routes=[
+                Route("/", self.root),
+                Route("/v1/chat/completions", self.complete, methods=["POST"]),
+                Route("/v1/models", self.models),
+            ]
+        )
+
+    async def root(self, _request):
+        return JSONResponse({"message": "Hello"})
+
+    async def models(self, _request):
+        return JSONResponse({"object": "list", "data": []})
+
+    async def complete(self, request):
+        body = await request.json()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if "messages" in body:
+            # an OpenAI client's request, answered like StubOpenAIServer does
+            return JSONResponse(chat_completion(body))
+        self.served.append((body["name"], request.client.port))
+        return JSONResponse({"name": body["name"]})
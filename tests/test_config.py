@@ -41,6 +41,15 @@ class TestConfig:
         assert cfg.serve.gpu_layers == -1
         assert cfg.serve.host_port == "127.0.0.1:8000"
         assert cfg.serve.max_ctx_size == 4096
+        assert cfg.serve.max_queue_size == 16
+        assert cfg.serve.keep_alive_timeout == 5
+        assert cfg.serve.models == []
+        assert cfg.serve.max_loaded_models == 1
+        assert cfg.serve.max_loaded_size_mb is None
+        assert cfg.serve.prompt_cache is None
+        assert cfg.serve.prompt_cache_size_mb == 2048
+        assert cfg.serve.daemon is False
+        assert cfg.serve.daemon_idle_timeout == 600
 
     def test_default_config(self):
         cfg = config.get_default_config()
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from urllib.parse import urlparse
+import logging
+import os
+import threading
+import time
+
+# Third Party
+import httpx
+import pytest
+
+# First Party
+from instructlab import config
+from instructlab.daemon import (
+    DaemonRegistration,
+    daemon_dir,
+    daemon_key,
+    ensure_daemon,
+    read_pidfile,
+)
+from instructlab.server import (
+    Server,
+    ServerException,
+    server_config,
+    temp_server_kwargs,
+)
+
+# Local
+from .openai_stub import StubModel
+
+
+@pytest.fixture(name="serve_config")
+def fixture_serve_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"\0")
+    serve_config = config.get_default_config().serve
+    serve_config.model_path = str(model_path)
+    serve_config.daemon = True
+    return serve_config
+
+
+def _ensure_daemon(serve_config):
+    return ensure_daemon(
+        logging.getLogger(), serve_config, False, None, None, None, "merlinite", 60
+    )
+
+
+def test_daemon_key(serve_config):
+    key = daemon_key(temp_server_kwargs(serve_config, "merlinite"))
+    assert key == daemon_key(temp_server_kwargs(serve_config, "merlinite"))
+    assert key != daemon_key(temp_server_kwargs(serve_config, "mixtral"))
+    # a model file replaced at the same path gets another daemon
+    os.utime(serve_config.model_path, ns=(0, 0))
+    assert key != daemon_key(temp_server_kwargs(serve_config, "merlinite"))
+
+
+def test_daemon_registration(tmp_path):
+    pidfile = tmp_path / "daemon.json"
+    registration = DaemonRegistration(pidfile, "abc", "127.0.0.1")
+    registration.put(4321)
+    assert read_pidfile(pidfile) == {
+        "pid": os.getpid(),
+        "host": "127.0.0.1",
+        "port": 4321,
+        "model_hash": "abc",
+    }
+    registration.close()
+    assert not pidfile.exists()
+    # failures are left for the invocation starting the daemon to report
+    registration.put(ValueError("Model path does not exist"))
+    registration.close()
+    assert read_pidfile(pidfile)["error"] == "Model path does not exist"
+
+
+def test_ensure_daemon_attaches(serve_config, serve_stub):
+    base_url, _ = serve_stub(max_queue_size=0, delay=0)
+    port = urlparse(base_url).port
+    key = daemon_key(temp_server_kwargs(serve_config, "merlinite"))
+    daemon_dir().mkdir(parents=True)
+    DaemonRegistration(daemon_dir() / f"{key}.json", key, "127.0.0.1").put(port)
+    assert _ensure_daemon(serve_config) == f"{base_url}/v1"
+
+
+def test_ensure_daemon_fails(serve_config):
+    serve_config.model_path = "/nonexistent.gguf"
+    with pytest.raises(ServerException, match="Model path does not exist"):
+        _ensure_daemon(serve_config)
+    assert [p.suffix for p in sorted(daemon_dir().iterdir())] == [".lock", ".log"]
+
+
+def test_server_idle_timeout():
+    server = Server(server_config(StubModel(0).app, "127.0.0.1", 0), idle_timeout=0.5)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    start = time.monotonic()
+    for _ in range(3):
+        time.sleep(0.3)
+        httpx.get(f"http://127.0.0.1:{port}/")
+    # requests keep it running, it exits once they stop
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert time.monotonic() - start > 1.4
+    assert server.server_state.total_requests == 3
@@ -0,0 +1,229 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import dataclasses
+import json
+import os
+
+# Third Party
+import pytest
+
+# First Party
+from instructlab.generator.output import (
+    DocumentStore,
+    GeneratedDataWriter,
+    InstructionRecord,
+    read_jsonl,
+)
+from instructlab.generator.utils import GenerateException
+
+DATE_SUFFIX = "2024-05-01T10_00_00"
+
+
+def _instruction(n):
+    return InstructionRecord(
+        instruction=f"instruction {n}",
+        input="" if n % 2 else f"input {n}",
+        output=f"output {n}",
+        taxonomy_path="compositional_skills->test",
+        task_description="test",
+        document=None,
+    )
+
+
+def _tokens(n):
+    return ["instruction", str(n)]
+
+
+def _knowledge_instruction(n, document):
+    return dataclasses.replace(
+        _instruction(n), taxonomy_path="knowledge->test", document=document
+    )
+
+
+def test_instruction_record():
+    record = _instruction(2)
+    assert not hasattr(record, "__dict__")
+    assert InstructionRecord.from_dict(record.to_dict()) == record
+    # records read like the seed example dicts
+    assert record["input"] == record.input == "input 2"
+    assert record.get("document", []) is None
+    assert record.get("to_dict") is None
+    with pytest.raises(KeyError):
+        record["missing"]  # pylint: disable=pointless-statement
+
+
+def test_document_store():
+    store = DocumentStore()
+    ids = store.add(["chunk one", "chunk two", "chunk one"])
+    assert ids[0] == ids[2] != ids[1]
+    assert len(store) == 2
+    assert [store[i] for i in ids] == ["chunk one", "chunk two", "chunk one"]
+    # ids only depend on the content
+    assert DocumentStore().add(["chunk two"]) == ids[1:2]
+    assert "unknown" not in store
+
+
+class TestGeneratedDataWriter:
+    """Test collection for GeneratedDataWriter."""
+
+    def _writer(self, tmp_path):
+        writer = GeneratedDataWriter(tmp_path, "m", DATE_SUFFIX)
+        writer.open()
+        return writer
+
+    def test_commit_appends_round(self, tmp_path):
+        writer = self._writer(tmp_path)
+        writer.write_test([{"system": "s", "user": "u", "assistant": "a"}])
+        writer.add(_instruction(1), _tokens(1))
+        writer.add(_instruction(2), _tokens(2))
+        # nothing reaches the files before the end of the round
+        assert read_jsonl(writer.train_path) == []
+        writer.commit()
+        writer.add(_instruction(3), _tokens(3))
+        writer.commit()
+        writer.close()
+
+        train = read_jsonl(writer.train_path)
+        assert [t["user"] for t in train] == [
+            "instruction 1",
+            "instruction 2\ninput 2",
+            "instruction 3",
+        ]
+        records, tokens = writer.read_checkpoint(
+            os.path.getsize(writer.checkpoint_path)
+        )
+        assert records == [_instruction(n) for n in (1, 2, 3)]
+        assert tokens == [_tokens(n) for n in (1, 2, 3)]
+        assert len(read_jsonl(writer.test_path)) == 1
+        assert not os.path.exists(writer.output_path)
+        assert not os.path.exists(writer.manifest_path)
+
+    def test_uncommitted_round_is_not_written(self, tmp_path):
+        writer = self._writer(tmp_path)
+        writer.add(_instruction(1), _tokens(1))
+        writer.commit()
+        writer.add(_instruction(2), _tokens(2))
+        # simulate the process being killed mid-round
+        writer.close()
+        assert len(read_jsonl(writer.train_path)) == 1
+        assert read_jsonl(writer.checkpoint_path) == [
+            {"record": _instruction(1).to_dict(), "tokens": _tokens(1)}
+        ]
+
+    def test_resume_truncates_unfinished_round(self, tmp_path):
+        writer = self._writer(tmp_path)
+        writer.add(_instruction(1), _tokens(1))
+        writer.commit({"accepted": 1})
+        with open(writer.discarded_path, "a", encoding="utf-8") as f:
+            f.write("discarded line\n")
+        # the round is written, but the process dies before the manifest is
+        writer.add(_instruction(2), _tokens(2))
+        writer.commit()
+        writer.close()
+
+        manifest_path = GeneratedDataWriter.find_manifest(tmp_path, "m")
+        assert manifest_path == writer.manifest_path
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        assert manifest["accepted"] == 1
+        assert manifest["date_suffix"] == DATE_SUFFIX
+
+        resumed = GeneratedDataWriter(tmp_path, "m", manifest["date_suffix"])
+        records, tokens = resumed.read_checkpoint(manifest["offsets"]["checkpoint"])
+        assert records == [_instruction(1)]
+        assert tokens == [_tokens(1)]
+        resumed.open(manifest["offsets"])
+        resumed.add(_instruction(3), _tokens(3))
+        resumed.commit()
+        resumed.close()
+        assert [t["user"] for t in read_jsonl(resumed.train_path)] == [
+            "instruction 1",
+            "instruction 3",
+        ]
+        assert os.path.getsize(resumed.discarded_path) == 0
+
+    def test_documents_written_once(self, tmp_path):
+        writer = self._writer(tmp_path)
+        ids = writer.documents.add(["chunk one", "chunk two", "chunk three"])
+        writer.add(_knowledge_instruction(1, ids[:2]), _tokens(1))
+        writer.add(_knowledge_instruction(2, ids[:2]), _tokens(2))
+        writer.commit({})
+        writer.add(_knowledge_instruction(3, ids[1:]), _tokens(3))
+        writer.commit({})
+        writer.write_generated()
+        writer.close()
+
+        assert read_jsonl(writer.documents_path) == [
+            {"id": ids[0], "text": "chunk one"},
+            {"id": ids[1], "text": "chunk two"},
+            {"id": ids[2], "text": "chunk three"},
+        ]
+        with open(writer.output_path, encoding="utf-8") as f:
+            generated = json.load(f)
+        assert [g["document"] for g in generated] == [ids[:2], ids[:2], ids[1:]]
+
+    def test_resume_reads_documents(self, tmp_path):
+        writer = self._writer(tmp_path)
+        ids = writer.documents.add(["chunk one", "chunk two"])
+        writer.add(_knowledge_instruction(1, ids[:1]), _tokens(1))
+        writer.commit({})
+        # the round is written, but the process dies before the manifest is
+        writer.add(_knowledge_instruction(2, ids[1:]), _tokens(2))
+        writer.commit()
+        writer.close()
+        with open(writer.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        # e.g. resumed with another chunk size, the seeds have other chunks
+        resumed = GeneratedDataWriter(tmp_path, "m", DATE_SUFFIX)
+        resumed.open(manifest["offsets"])
+        assert len(resumed.documents) == 1
+        assert resumed.documents[ids[0]] == "chunk one"
+        resumed.documents.add(["chunk two"])
+        resumed.add(_knowledge_instruction(3, ids), _tokens(3))
+        resumed.commit()
+        resumed.close()
+        assert [d["id"] for d in read_jsonl(resumed.documents_path)] == ids
+
+    def test_resume_rejects_short_files(self, tmp_path):
+        writer = self._writer(tmp_path)
+        writer.add(_instruction(1), _tokens(1))
+        writer.commit({})
+        writer.close()
+        os.truncate(writer.train_path, 0)
+        with open(writer.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        with pytest.raises(GenerateException):
+            GeneratedDataWriter(tmp_path, "m", DATE_SUFFIX).open(manifest["offsets"])
+
+    def test_find_manifest(self, tmp_path):
+        for name in (
+            "manifest_m_2024-05-01T10_00_00.json",
+            "manifest_m_2024-05-02T09_00_00.json",
+            "manifest_m_7b_2024-06-01T09_00_00.json",
+            "manifest_m_2024-06-01T09_00_00.json.tmp",
+        ):
+            (tmp_path / name).touch()
+        assert GeneratedDataWriter.find_manifest(tmp_path, "m") == os.path.join(
+            tmp_path, "manifest_m_2024-05-02T09_00_00.json"
+        )
+        assert GeneratedDataWriter.find_manifest(tmp_path, "other") is None
+
+    def test_finalize(self, tmp_path):
+        writer = self._writer(tmp_path)
+        writer.add(_instruction(1), _tokens(1))
+        writer.commit({})
+        writer.add(_instruction(2), _tokens(2))
+        writer.finalize()
+        with open(writer.output_path, encoding="utf-8") as f:
+            assert json.load(f) == [
+                _instruction(1).to_dict(),
+                _instruction(2).to_dict(),
+            ]
+        assert not os.path.exists(writer.checkpoint_path)
+        assert not os.path.exists(writer.manifest_path)
+        assert sorted(os.listdir(tmp_path)) == [
+            f"generated_m_{DATE_SUFFIX}.json",
+            f"train_m_{DATE_SUFFIX}.jsonl",
+        ]
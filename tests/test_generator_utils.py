@@ -0,0 +1,110 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import time
+
+# Third Party
+import pytest
+
+# First Party
+from instructlab.generator import utils
+from instructlab.generator.utils import (
+    AsyncCompletionEngine,
+    GenerateException,
+    RequestPipeline,
+)
+
+
+def _complete(api_base, prompts, **kwargs):
+    return utils.openai_completion(
+        api_base=api_base,
+        tls_insecure=False,
+        tls_client_cert="",
+        tls_client_key="",
+        tls_client_passwd="",
+        prompts=prompts,
+        decoding_args=utils.OpenAIDecodingArguments(max_tokens=16),
+        model_name="stub-model",
+        **kwargs,
+    )
+
+
+class TestOpenAICompletion:
+    """Test collection for openai_completion and AsyncCompletionEngine."""
+
+    def test_all_prompts_sent_concurrently_in_order(self, stub_server):
+        prompts = [f"prompt {i}" for i in range(5)]
+        start = time.monotonic()
+        results = _complete(stub_server.api_base, prompts, batch_size=5)
+        elapsed = time.monotonic() - start
+        assert [r.message.content for r in results] == [f"echo: {p}" for p in prompts]
+        assert stub_server.requests == 5
+        assert stub_server.max_in_flight == 5
+        # sequential requests would take at least 5 * delay
+        assert elapsed < 5 * stub_server.delay
+
+    def test_engine_limits_in_flight_requests(self, stub_server):
+        prompts = [f"prompt {i}" for i in range(6)]
+        with AsyncCompletionEngine(stub_server.api_base, max_concurrency=2) as engine:
+            first = _complete(stub_server.api_base, prompts, engine=engine)
+            second = engine.submit(prompts[:2], model="stub-model").result()
+        assert [r.message.content for r in first] == [f"echo: {p}" for p in prompts]
+        assert [r.message.content for r in second] == [
+            "echo: prompt 0",
+            "echo: prompt 1",
+        ]
+        assert stub_server.max_in_flight == 2
+
+    def test_single_prompt(self, stub_server):
+        result = _complete(stub_server.api_base, "only prompt")
+        assert result.message.content == "echo: only prompt"
+
+    @pytest.mark.parametrize(
+        "stub_server", [{"delay": 0, "status": 400}], indirect=True
+    )
+    def test_server_error(self, stub_server):
+        with pytest.raises(GenerateException) as exc:
+            _complete(stub_server.api_base, ["prompt"])
+        assert "There was a problem connecting to the server" in str(exc.value)
+
+
+class TestRequestPipeline:
+    """Test collection for RequestPipeline."""
+
+    def test_results_in_order_with_bounded_depth(self, stub_server):
+        prepared = []
+
+        def prepare(request_idx):
+            prepared.append(request_idx)
+            return [f"prompt {request_idx}"], request_idx
+
+        with AsyncCompletionEngine(stub_server.api_base, max_concurrency=10) as engine:
+            pipeline = RequestPipeline(engine, prepare, depth=3, model="stub-model")
+            consumed = []
+            try:
+                for request_idx, context, results in pipeline:
+                    assert context == request_idx
+                    assert results[0].message.content == f"echo: prompt {request_idx}"
+                    consumed.append(request_idx)
+                    # slow consumer: the producer must not run ahead of the depth
+                    time.sleep(stub_server.delay)
+                    assert len(prepared) <= request_idx + 3
+                    if len(consumed) == 5:
+                        break
+            finally:
+                pipeline.close()
+        assert consumed == [1, 2, 3, 4, 5]
+        assert stub_server.max_in_flight <= 3
+
+    def test_prepare_error_is_raised(self, stub_server):
+        def prepare(request_idx):
+            if request_idx == 2:
+                raise GenerateException("not enough seed data")
+            return ["prompt"], None
+
+        with AsyncCompletionEngine(stub_server.api_base) as engine:
+            pipeline = RequestPipeline(engine, prepare, depth=2, model="stub-model")
+            with pytest.raises(GenerateException, match="not enough seed data"):
+                for _ in pipeline:
+                    pass
+            pipeline.close()
@@ -188,6 +188,29 @@ class TestLabDiff:
             assert result.output == ""
             assert result.exit_code == 0
 
+    @pytest.mark.parametrize("options", [[], ["--jobs", "2", "--no-cache"]])
+    def test_check_valid_yaml(self, options):
+        with open("tests/testdata/skill_valid_answer.yaml", "rb") as qnafile:
+            valid_yaml_file = "compositional_skills/qna_valid.yaml"
+            self.taxonomy.create_untracked(valid_yaml_file, qnafile.read())
+            runner = CliRunner()
+            result = runner.invoke(
+                lab.cli,
+                [
+                    "--config=DEFAULT",
+                    "check",
+                    "--taxonomy-base",
+                    TAXONOMY_BASE,
+                    "--taxonomy-path",
+                    self.taxonomy.root,
+                    *options,
+                ],
+            )
+            # `ilab diff --quiet`, with a deprecation warning
+            assert "Use `ilab diff --quiet` instead." in result.output
+            assert "is valid" not in result.output
+            assert result.exit_code == 0
+
     def test_diff_valid_yaml_quiet_file(self):
         with open("tests/testdata/skill_valid_answer.yaml", "rb") as qnafile:
             valid_yaml_file = "compositional_skills/qna_valid.yaml"
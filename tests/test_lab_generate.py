@@ -2,25 +2,49 @@
 # pylint: disable=duplicate-code
 
 # Standard
+from types import SimpleNamespace
 from unittest.mock import patch
 import fnmatch
+import glob
+import json
 import logging
 import os
 import pathlib
+import random
 
 # Third Party
 from click.testing import CliRunner
+import openai
 import pytest
 
 # First Party
 from instructlab import lab
-from instructlab.generator.generate_data import generate_data
+from instructlab.generator.generate_data import (
+    PromptEncoder,
+    _prompt_encoder,
+    encode_prompt,
+    encode_prompts,
+    generate_data,
+    post_process_gpt3_response,
+    post_process_results,
+)
+from instructlab.generator.output import (
+    DiscardLog,
+    DocumentStore,
+    InstructionRecord,
+    count_discards,
+    read_jsonl,
+)
+from instructlab.generator.similarity import RougeLScorer
 from instructlab.generator.utils import GenerateException
+from instructlab.utils import chunk_document
 
 # Local
 from .taxonomy import MockTaxonomy
 from .testdata import testdata
 
+GENERATE_DATA = "instructlab.generator.generate_data"
+
 
 class TestLabGenerate:
     """Test collection for `ilab generate` command."""
@@ -163,7 +187,13 @@ class TestLabGenerate:
 
     @patch(
         "instructlab.generator.generate_data.get_instructions_from_model",
-        return_value=(testdata.generate_data_return_value, 0),
+        return_value=(
+            [
+                InstructionRecord.from_dict(d)
+                for d in testdata.generate_data_return_value
+            ],
+            0,
+        ),
     )
     def test_generate_no_error(self, get_instructions_from_model):
         with open("tests/testdata/skill_valid_answer.yaml", "rb") as qnafile:
@@ -204,13 +234,25 @@ class TestLabGenerate:
 
     @patch(
         "instructlab.generator.generate_data.get_instructions_from_model",
-        return_value=(testdata.generate_data_return_value, 0),
+        return_value=(
+            [
+                InstructionRecord.from_dict(d)
+                for d in testdata.generate_data_return_value
+            ],
+            0,
+        ),
     )
     @patch(
         "instructlab.generator.generate_data.read_taxonomy",
         return_value=testdata.knowledge_seed_instruction,
     )
-    def test_knowledge_docs_no_error(self, read_taxonomy, get_instructions_from_model):
+    @patch(
+        "instructlab.generator.generate_data.chunk_document",
+        wraps=chunk_document,
+    )
+    def test_knowledge_docs_no_error(
+        self, chunk_document_mock, read_taxonomy, get_instructions_from_model
+    ):
         with open("tests/testdata/knowledge_valid.yaml", "rb") as qnafile:
             with CliRunner().isolated_filesystem():
                 mt = MockTaxonomy(pathlib.Path("taxonomy"))
@@ -237,6 +279,8 @@ class TestLabGenerate:
                 )
                 get_instructions_from_model.assert_called_once()
                 read_taxonomy.assert_called_once()
+                # the seed examples share their documents, chunked once
+                chunk_document_mock.assert_called_once()
                 expected_files = [
                     "generated_my-model*.json",
                     "train_my-model*.jsonl",
@@ -247,3 +291,334 @@ class TestLabGenerate:
                         fnmatch.fnmatch(f, pattern) for pattern in expected_files
                     )
                 mt.teardown()
+
+    @pytest.mark.parametrize(
+        "stub_server",
+        [
+            {
+                "delay": 0.05,
+                "response": lambda n: (
+                    f"** Instruction\nExplain the meaning of test number {n} to me.\n"
+                    f"** Input\n<noinput>\n** Output\nIt is number {n}.\n"
+                ),
+            }
+        ],
+        indirect=True,
+    )
+    @patch(
+        "instructlab.generator.generate_data.read_taxonomy",
+        return_value=testdata.knowledge_seed_instruction,
+    )
+    def test_generate_pipelined(self, read_taxonomy, stub_server):
+        with CliRunner().isolated_filesystem():
+            generate_data(
+                logger=logging.getLogger("test_logger"),
+                api_base=stub_server.api_base,
+                api_key="",
+                model_name="my-model",
+                model_family="merlinite",
+                num_cpus=1,
+                num_instructions_to_generate=12,
+                taxonomy=".",
+                taxonomy_base="main",
+                output_dir="generated",
+                prompt_file_path="prompt.txt",
+                rouge_threshold=1.0,
+                console_output=False,
+                chunk_word_count=1000,
+                server_ctx_size=4096,
+                tls_insecure=False,
+                request_batch_size=2,
+                pipeline_depth=3,
+            )
+            read_taxonomy.assert_called_once()
+            (output_file,) = glob.glob("generated/generated_my-model*.json")
+            with open(output_file, encoding="utf-8") as f:
+                generated = json.load(f)
+            assert len(generated) == 12
+            assert len({g["output"] for g in generated}) == 12
+            # several batches of 2 prompts were in flight, but never more than 3
+            assert 2 < stub_server.max_in_flight <= 6
+
+    @patch(
+        "instructlab.generator.generate_data.read_taxonomy",
+        return_value=testdata.knowledge_seed_instruction,
+    )
+    def test_generate_queueless_server(self, read_taxonomy, serve_stub):
+        # `ilab serve` without a request queue serves a single request at a
+        # time and rejects the others with 503
+        url, model = serve_stub(max_queue_size=0, delay=0.05)
+        statuses = []
+
+        async def record(response):
+            statuses.append(response.status_code)
+
+        def client(**kwargs):
+            kwargs["http_client"].event_hooks["response"].append(record)
+            return openai.AsyncOpenAI(**kwargs)
+
+        with (
+            CliRunner().isolated_filesystem(),
+            patch("instructlab.generator.utils.AsyncOpenAI", client),
+        ):
+            generate_data(
+                logger=logging.getLogger("test_logger"),
+                api_base=f"{url}/v1",
+                api_key="",
+                model_name="my-model",
+                model_family="merlinite",
+                num_cpus=1,
+                num_instructions_to_generate=4,
+                taxonomy=".",
+                taxonomy_base="main",
+                output_dir="generated",
+                prompt_file_path="prompt.txt",
+                rouge_threshold=1.0,
+                console_output=False,
+                chunk_word_count=1000,
+                server_ctx_size=4096,
+                tls_insecure=False,
+                request_batch_size=2,
+                pipeline_depth=2,
+                server_concurrency=1,
+            )
+            read_taxonomy.assert_called_once()
+            assert glob.glob("generated/generated_my-model*.json")
+            assert model.max_in_flight == 1
+            assert statuses and set(statuses) == {200}
+
+    @pytest.mark.parametrize(
+        "stub_server",
+        [
+            {
+                "delay": 0.01,
+                "response": lambda n: (
+                    f"** Instruction\nExplain the meaning of test number {n} to me.\n"
+                    f"** Input\n<noinput>\n** Output\nIt is number {n}.\n"
+                ),
+            }
+        ],
+        indirect=True,
+    )
+    @pytest.mark.parametrize("pipeline_depth", [1, 2])
+    def test_generate_resume(self, stub_server, pipeline_depth):
+        kwargs = {
+            "logger": logging.getLogger("test_logger"),
+            "api_base": stub_server.api_base,
+            "api_key": "",
+            "model_name": "my-model",
+            "model_family": "merlinite",
+            "num_cpus": 1,
+            "num_instructions_to_generate": 12,
+            "taxonomy": ".",
+            "taxonomy_base": "main",
+            "output_dir": "generated",
+            "prompt_file_path": "prompt.txt",
+            "rouge_threshold": 1.0,
+            "console_output": False,
+            "chunk_word_count": 1000,
+            "server_ctx_size": 4096,
+            "tls_insecure": False,
+            "request_batch_size": 2,
+            "pipeline_depth": pipeline_depth,
+        }
+
+        # the random state before and after sampling the prompts of each request
+        rng_states = []
+
+        def sampled(*args, **kw):
+            rng_states.append(random.getstate())
+            result = encode_prompts(*args, **kw)
+            rng_states.append(random.getstate())
+            return result
+
+        def interrupted(*args, **kw):
+            if interrupted.calls == 3:
+                raise GenerateException("preempted")
+            interrupted.calls += 1
+            return post_process_results(*args, **kw)
+
+        interrupted.calls = 0
+
+        seeds = testdata.knowledge_seed_instruction
+        with CliRunner().isolated_filesystem():
+            with patch(f"{GENERATE_DATA}.read_taxonomy", return_value=seeds):
+                with (
+                    patch(f"{GENERATE_DATA}.post_process_results", interrupted),
+                    patch(f"{GENERATE_DATA}.encode_prompts", sampled),
+                ):
+                    with pytest.raises(GenerateException):
+                        generate_data(**kwargs)
+            (manifest_file,) = glob.glob("generated/manifest_my-model*.json")
+            with open(manifest_file, encoding="utf-8") as f:
+                manifest = json.load(f)
+            assert manifest["accepted"] == 6
+            assert manifest["request_idx"] == 3
+            # the checkpoint has the random state after request 3, even if
+            # later requests were sampled already
+            version, internal_state, gauss_next = manifest["rng_state"]
+            assert (version, tuple(internal_state), gauss_next) == rng_states[5]
+            assert len(rng_states) >= 6 + 2 * (pipeline_depth - 1)
+            (output_file,) = glob.glob("generated/generated_my-model*.json")
+            with open(output_file, encoding="utf-8") as f:
+                interrupted_run = json.load(f)
+            assert len(interrupted_run) == 6
+
+            changed_seeds = [dict(seeds[0], output="changed")] + seeds[1:]
+            with patch(f"{GENERATE_DATA}.read_taxonomy", return_value=changed_seeds):
+                with pytest.raises(GenerateException, match="Cannot resume"):
+                    generate_data(resume=True, **kwargs)
+
+            # the output failing to reopen leaks neither the scorer nor an engine
+            with (
+                patch(f"{GENERATE_DATA}.read_taxonomy", return_value=seeds),
+                patch(
+                    f"{GENERATE_DATA}.GeneratedDataWriter.open",
+                    side_effect=GenerateException("truncated"),
+                ),
+                patch.object(
+                    RougeLScorer,
+                    "close",
+                    autospec=True,
+                    side_effect=RougeLScorer.close,
+                ) as close,
+                patch(f"{GENERATE_DATA}.utils.completion_engine") as engine,
+            ):
+                with pytest.raises(GenerateException, match="truncated"):
+                    generate_data(resume=True, **kwargs)
+                close.assert_called_once()
+                engine.assert_not_called()
+
+            requests = stub_server.requests
+            rng_states.clear()
+            with (
+                patch(f"{GENERATE_DATA}.read_taxonomy", return_value=seeds),
+                patch(f"{GENERATE_DATA}.encode_prompts", sampled),
+            ):
+                generate_data(resume=True, **kwargs)
+            # request 4 is sampled from where request 3 left the random state
+            assert rng_states[0] == (version, tuple(internal_state), gauss_next)
+            # the prompts of the 3 requests left, and of requests pipelined
+            # past the last one, which may have been sent
+            sent = stub_server.requests - requests
+            assert 6 <= sent <= 6 + 2 * (pipeline_depth - 1)
+            assert glob.glob("generated/generated_my-model*.json") == [output_file]
+            with open(output_file, encoding="utf-8") as f:
+                generated = json.load(f)
+            assert generated[:6] == interrupted_run
+            assert len({g["output"] for g in generated}) == 12
+            (train_file,) = glob.glob("generated/train_my-model*.jsonl")
+            with open(train_file, encoding="utf-8") as f:
+                assert len(f.readlines()) == 12
+            assert not glob.glob("generated/manifest_*")
+            assert not glob.glob("generated/generated_*.jsonl")
+            # the instructions refer to the chunks of the document by id,
+            # each written once
+            (documents_file,) = glob.glob("generated/documents_my-model*.jsonl")
+            documents = read_jsonl(documents_file)
+            assert len({d["id"] for d in documents}) == len(documents)
+            ids = {d["id"] for d in documents}
+            assert all(set(g["document"]) <= ids for g in generated)
+
+
+def test_post_process_gpt3_response(tmp_path):
+    content = "\n".join(
+        [
+            "** Instruction\nExplain how rivers shape valleys over time.",
+            "** Input\n<noinput>\n** Output\nBy erosion.",
+            "* Task 4",
+            "** Instruction\nDescribe the IMAGE of a river delta.",
+            "** Input\n<noinput>\n** Output\nA fan.",
+            "* Task 5",
+            "** Instruction\nToo short.\n** Input\n<noinput>\n** Output\nYes.",
+            "* Task 6",
+            "this task has no fields at all",
+            "* Task 7",
+            "** Instruction\nList the imagery used in the following poem.",
+            "** Input\nRoses are red.\n** Output\nColour.",
+        ]
+    )
+    response = SimpleNamespace(message=SimpleNamespace(content=content))
+    discard_log = DiscardLog(tmp_path / "discarded.jsonl")
+    discard_log.set_round(3, "compositional_skills->rivers")
+    instructions, discarded = post_process_gpt3_response(2, response, discard_log)
+
+    assert instructions == [
+        {
+            "instruction": "Explain how rivers shape valleys over time.",
+            "input": "",
+            "output": "By erosion.",
+        },
+        {
+            # denylisted words only match whole words
+            "instruction": "List the imagery used in the following poem.",
+            "input": "Roses are red.",
+            "output": "Colour.",
+        },
+    ]
+    assert discarded == 3
+    # discards are only written when the log is flushed
+    assert not os.path.exists(discard_log.path)
+    discard_log.flush()
+    records = read_jsonl(discard_log.path)
+    assert [r["reason"] for r in records] == ["denylist", "word_count", "format"]
+    assert {r["request_idx"] for r in records} == {3}
+    assert {r["taxonomy_path"] for r in records} == {"compositional_skills->rivers"}
+    assert records[0]["data"] == {
+        "instruction": "Describe the IMAGE of a river delta.",
+        "input": "",
+        "output": "A fan.",
+    }
+    assert records[2]["data"] == "\nthis task has no fields at all\n"
+    assert count_discards(discard_log.path) == {
+        "denylist": 1,
+        "word_count": 1,
+        "format": 1,
+    }
+
+
+def test_prompt_encoder():
+    template = "Tasks for {{taxonomy}} ({{task_description}}){% if document %}: {{document}}{% endif %}\n\n"
+    encoder = PromptEncoder(template)
+    seeds = [
+        {
+            "instruction": "Explain  the\n meaning of life:",
+            "input": "",
+            "output": "42",
+            "taxonomy_path": "knowledge->life",
+            "task_description": "Life",
+            "document": ["doc one"],
+        },
+        {
+            "instruction": "Summarize the text",
+            "input": "Some text",
+            "output": "A summary",
+            "taxonomy_path": "knowledge->life",
+            "task_description": "Life",
+            "document": ["doc one"],
+        },
+    ]
+    expected = (
+        "Tasks for knowledge->life (Life): doc one\n"
+        "* Task 1\n** Instruction\nExplain the meaning of life\n"
+        "** Input\n<noinput>\n** Output\n42\n"
+        "* Task 2\n** Instruction\nSummarize the text\n"
+        "** Input\nSome text\n** Output\nA summary\n"
+        "* Task 3\n"
+    )
+    assert encoder.encode(seeds) == expected
+    # the header and task blocks are reused from the cache
+    assert encoder.encode(seeds) == expected
+    assert len(encoder._headers) == 1
+    assert len(encoder._tasks) == 2
+    assert encode_prompt(seeds, template) == expected
+    # encode_prompt keeps an encoder, and its caches, per template
+    assert encode_prompt(seeds, template) == expected
+    assert _prompt_encoder.cache_info().hits >= 1
+    assert len(_prompt_encoder(template)._tasks) == 2
+
+    # with a document store, the documents are chunk ids
+    documents = DocumentStore()
+    chunk_ids = documents.add(["doc one"])
+    seeds = [dict(seed, document=chunk_ids) for seed in seeds]
+    assert PromptEncoder(template, documents).encode(seeds) == expected
@@ -0,0 +1,250 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from types import SimpleNamespace
+from unittest.mock import patch
+import asyncio
+import logging
+import queue
+import threading
+
+# Third Party
+from llama_cpp.llama_cache import LlamaDiskCache, LlamaRAMCache
+from llama_cpp.server.model import LlamaProxy
+from llama_cpp.server.settings import ModelSettings
+import httpx
+import numpy as np
+import pytest
+
+# First Party
+from instructlab.server import (
+    MIN_PROMPT_CACHE_PREFIX,
+    ModelPool,
+    PromptCache,
+    ServerException,
+    wait_for_server,
+)
+
+
+async def _staggered_requests(base_url, count, stagger=0.05):
+    """Send count requests from as many clients, stagger seconds apart."""
+
+    async def send(client, i):
+        await asyncio.sleep(i * stagger)
+        return await client.post("/v1/chat/completions", json={"name": str(i)})
+
+    clients = [httpx.AsyncClient(base_url=base_url) for _ in range(count)]
+    try:
+        return await asyncio.gather(
+            *(send(client, i) for i, client in enumerate(clients))
+        )
+    finally:
+        for client in clients:
+            await client.aclose()
+
+
+def test_request_queue_fifo(serve_stub):
+    base_url, model = serve_stub(max_queue_size=3)
+    responses = asyncio.run(_staggered_requests(base_url, 4))
+    assert [r.status_code for r in responses] == [200] * 4
+    assert [r.json()["name"] for r in responses] == ["0", "1", "2", "3"]
+    # the model serves one request at a time, in the order they arrived
+    assert model.max_in_flight == 1
+    assert [name for name, _ in model.served] == ["0", "1", "2", "3"]
+
+
+def test_request_queue_full(serve_stub):
+    base_url, model = serve_stub(max_queue_size=1)
+
+    async def requests():
+        queued = asyncio.ensure_future(_staggered_requests(base_url, 3))
+        await asyncio.sleep(0.15)
+        # requests outside the API don't wait for the model
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            root = await client.get("/")
+        return root, await queued
+
+    root, responses = asyncio.run(requests())
+    assert root.status_code == 200
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    rejected = responses[2]
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert rejected.json()["error"]["type"] == "server_busy"
+    assert [name for name, _ in model.served] == ["0", "1"]
+
+
+def test_keep_alive(serve_stub):
+    base_url, model = serve_stub(max_queue_size=2, delay=0)
+    with httpx.Client(base_url=base_url) as client:
+        for name in ("a", "b"):
+            client.post("/v1/chat/completions", json={"name": name})
+    # both requests were sent on the same connection
+    (_, port_a), (_, port_b) = model.served
+    assert port_a == port_b
+
+
+def _model_pool(tmp_path, sizes, families=None, **kwargs):
+    """A ModelPool of models of the given file sizes"""
+    models = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f"model-{i}.gguf"
+        path.write_bytes(b"\0" * size)
+        family = families[i] if families else "merlinite"
+        models.append((ModelSettings(model=str(path)), family))
+    return ModelPool(models, **kwargs)
+
+
+def _load(settings):
+    return SimpleNamespace(
+        model_path=settings.model,
+        chat_handler=None,
+        set_cache=lambda cache: None,
+    )
+
+
+@patch.object(LlamaProxy, "load_llama_from_model_settings", side_effect=_load)
+def test_model_pool_routing(load, tmp_path):
+    pool = _model_pool(tmp_path, [1, 1], families=["merlinite", "mixtral"])
+    default = str(tmp_path / "model-0.gguf")
+    trained = str(tmp_path / "model-1.gguf")
+    assert list(pool) == [default, trained]
+    assert pool().model_path == default
+    # requests pick a model by path or file name, or get the first one
+    assert pool(trained).model_path == trained
+    assert pool("model-1").model_path == trained
+    assert pool("merlinite-7b-lab-Q4_K_M").model_path == default
+    # each model family has its chat handler
+    assert pool(default).chat_handler is not None
+    assert pool(default).chat_handler is not pool(trained).chat_handler
+    # a single model is kept loaded by default
+    assert load.call_count == 4
+
+
+@patch.object(LlamaProxy, "load_llama_from_model_settings", side_effect=_load)
+def test_model_pool_lru(load, tmp_path):
+    pool = _model_pool(tmp_path, [1, 1, 1], max_loaded=2)
+    pool("model-0")
+    pool("model-1")
+    pool("model-0")
+    assert load.call_count == 2
+    # model-1 is the least recently used
+    pool("model-2")
+    pool("model-0")
+    assert load.call_count == 3
+    pool("model-1")
+    assert [c.args[0].model for c in load.call_args_list] == [
+        str(tmp_path / f"model-{i}.gguf") for i in (0, 1, 2, 1)
+    ]
+
+
+@patch.object(LlamaProxy, "load_llama_from_model_settings", side_effect=_load)
+def test_model_pool_size(load, tmp_path):
+    pool = _model_pool(tmp_path, [300, 500, 400], max_loaded=3, max_loaded_size=900)
+    # the first model is loaded already, like create_app leaves it
+    pool.adopt(SimpleNamespace(model_path="model-0", chat_handler=None))
+    pool("model-1")
+    assert load.call_count == 1
+    # model-2 fits once model-0 is unloaded
+    pool("model-2")
+    pool("model-1")
+    assert load.call_count == 2
+    # model-2 is unloaded to make room for model-0
+    pool("model-0")
+    pool("model-1")
+    assert load.call_count == 3
+    pool("model-2")
+    assert load.call_count == 4
+    assert list(pool._loaded) == [str(tmp_path / f"model-{i}.gguf") for i in (1, 2)]
+
+
+def _state(tokens, size=100):
+    """A stand-in for the llama.cpp state after evaluating tokens"""
+    return SimpleNamespace(input_ids=np.array(tokens), llama_state_size=size)
+
+
+def test_prompt_cache_ram():
+    cache = PromptCache(LlamaRAMCache(capacity_bytes=250))
+    system = list(range(MIN_PROMPT_CACHE_PREFIX))
+    with pytest.raises(KeyError):
+        cache[system + [1000]]
+    cache[system + [1000, 1001]] = _state(system + [1000, 1001])
+    # a prompt sharing the system prompt finds the state of the earlier one
+    assert cache[system + [2000]].input_ids[-1] == 1001
+    # a prompt sharing too few tokens with it doesn't
+    with pytest.raises(KeyError):
+        cache[system[:-1] + [3000]]
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"]) == (1, 2)
+    assert metrics["reused_tokens"] == MIN_PROMPT_CACHE_PREFIX
+    assert metrics["hit_rate"] == pytest.approx(1 / 3)
+    # states beyond the capacity evict the least recently used
+    cache[[1, 2]] = _state([1, 2])
+    cache[[3, 4]] = _state([3, 4])
+    metrics = cache.metrics()
+    assert (metrics["entries"], metrics["size_bytes"]) == (2, 200)
+    cache.clear()
+    assert cache.metrics()["entries"] == 0
+
+
+def test_prompt_cache_disk(tmp_path):
+    tokens = list(range(MIN_PROMPT_CACHE_PREFIX + 1))
+    cache = PromptCache(LlamaDiskCache(cache_dir=str(tmp_path)))
+    cache[tokens] = _state(tokens)
+    # the states outlive the server
+    cache = PromptCache(LlamaDiskCache(cache_dir=str(tmp_path)))
+    assert cache.metrics()["entries"] == 1
+    # a prompt sharing too few tokens with a state leaves it cached
+    with pytest.raises(KeyError):
+        cache[tokens[:2]]
+    # clearing only drops the states kept in RAM
+    cache.clear()
+    assert list(cache[tokens + [0]].input_ids) == tokens
+    metrics = cache.metrics()
+    assert (metrics["type"], metrics["hits"], metrics["misses"]) == ("disk", 1, 1)
+    # the state is handed out until the completion saves it again
+    assert metrics["entries"] == 0
+
+
+@patch.object(LlamaProxy, "load_llama_from_model_settings", side_effect=_load)
+def test_model_pool_prompt_cache(load, tmp_path):
+    caches = []
+    pool = _model_pool(tmp_path, [1, 1], prompt_cache="ram", prompt_cache_size=1000)
+    pool.adopt(SimpleNamespace(chat_handler=None, set_cache=caches.append))
+    load.side_effect = lambda settings: SimpleNamespace(
+        chat_handler=None, set_cache=caches.append
+    )
+    pool("model-1")
+    pool("model-0")
+    # each model keeps its cache, and its metrics, across loads
+    assert caches[0] is caches[2]
+    assert caches[0] is not caches[1]
+    assert caches[0].capacity_bytes == 1000
+    assert list(pool.prompt_cache_metrics()) == [
+        str(tmp_path / f"model-{i}.gguf") for i in (0, 1)
+    ]
+
+
+@patch("instructlab.server.STARTUP_PROGRESS_INTERVAL", 0.01)
+def test_wait_for_server(caplog):
+    server_queue = queue.Queue()
+    process = SimpleNamespace(is_alive=lambda: True, exitcode=None)
+    # the server reports its port once the model is loaded
+    timer = threading.Timer(0.1, server_queue.put, args=(4321,))
+    timer.start()
+    with caplog.at_level(logging.INFO):
+        port = wait_for_server(logging.getLogger(), process, server_queue, 5)
+    timer.join()
+    assert port == 4321
+    assert "Waiting for the server to load the model" in caplog.text
+
+    # or the exception it failed with
+    server_queue.put(ValueError("Model path does not exist"))
+    with pytest.raises(ValueError, match="Model path does not exist"):
+        wait_for_server(logging.getLogger(), process, server_queue, 5)
+
+    with pytest.raises(ServerException, match="not ready after 0.05 seconds"):
+        wait_for_server(logging.getLogger(), process, server_queue, 0.05)
+
+    process = SimpleNamespace(is_alive=lambda: False, exitcode=-9)
+    with pytest.raises(ServerException, match="exited with code -9"):
+        wait_for_server(logging.getLogger(), process, server_queue, 5)
@@ -0,0 +1,160 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from unittest.mock import patch
+import random
+
+# Third Party
+from rouge_score import rouge_scorer
+import pytest
+
+# First Party
+from instructlab.generator import similarity
+from instructlab.generator.similarity import (
+    OverlapIndex,
+    RougeLScorer,
+    TokenMatrix,
+    lcs_lengths,
+    lcs_scores,
+)
+
+WORDS = "what how why explain describe list write the a of to in is for cat dog tree river".split()
+
+
+def _instructions(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        for _ in range(count)
+    ]
+
+
+def _reference_filter(corpus, candidates, threshold):
+    """Accept/reject decisions as computed by the original per-candidate loop."""
+    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
+    corpus_tokens = [scorer._tokenizer.tokenize(inst) for inst in corpus]
+    decisions = []
+    for candidate in candidates:
+        tokens = scorer._tokenizer.tokenize(candidate)
+        scores = [
+            rouge_scorer._score_lcs(tokens, reference).fmeasure
+            for reference in corpus_tokens
+        ]
+        if max(scores) > threshold:
+            decisions.append(False)
+            continue
+        decisions.append(True)
+        corpus_tokens.append(tokens)
+    return decisions
+
+
+class TestRougeLScorer:
+    """Test collection for the generator's RougeLScorer."""
+
+    def test_max_scores_match_rouge_score(self):
+        corpus = _instructions(50)
+        candidates = _instructions(10, seed=7)
+        reference = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
+        with RougeLScorer(corpus, num_cpus=1) as scorer:
+            scores = scorer.max_scores([scorer.tokenize(c) for c in candidates])
+        for candidate, score in zip(candidates, scores):
+            assert score == max(
+                reference.score(candidate, inst)["rougeL"].fmeasure for inst in corpus
+            )
+
+    @pytest.mark.parametrize("use_index", [True, False])
+    @pytest.mark.parametrize("threshold", [0.0, 0.3, 0.5, 0.7, 0.9, 1.0])
+    def test_filter_matches_sequential_decisions(self, threshold, use_index):
+        corpus = _instructions(30)
+        candidates = _instructions(20, seed=3) + corpus[:2]
+        with RougeLScorer(corpus, num_cpus=1, use_index=use_index) as scorer:
+            kept = scorer.filter(candidates, threshold)
+            decisions = [tokens is not None for tokens in kept]
+            assert len(scorer) == len(corpus) + sum(decisions)
+            assert scorer.instruction_tokens[len(corpus) :] == [
+                tokens for tokens in kept if tokens is not None
+            ]
+        assert decisions == _reference_filter(corpus, candidates, threshold)
+
+    def test_filter_with_worker_pool(self):
+        corpus = _instructions(40)
+        candidates = _instructions(8, seed=5)
+        with patch.object(similarity, "MIN_INSTRUCTIONS_PER_WORKER", 10):
+            with RougeLScorer(corpus, num_cpus=2, use_index=False) as scorer:
+                kept = scorer.filter(candidates, 0.5)
+                assert scorer._pool is not None
+            assert scorer._pool is None
+        decisions = [tokens is not None for tokens in kept]
+        assert decisions == _reference_filter(corpus, candidates, 0.5)
+
+
+class TestLCSKernel:
+    """Test collection for the vectorized LCS kernel."""
+
+    def test_scores_match_rouge_score(self):
+        tokenizer = rouge_scorer.RougeScorer(["rougeL"])._tokenizer
+        corpus = _instructions(80) + ["", "cat", "cat cat cat dog the the"]
+        candidates = _instructions(20, seed=13) + ["", "cat dog cat", "zebra cat"]
+        matrix = TokenMatrix()
+        corpus_tokens = [tokenizer.tokenize(inst) for inst in corpus]
+        for tokens in corpus_tokens:
+            matrix.add(tokens)
+        assert len(matrix) == len(corpus)
+        assert list(matrix.lengths) == [len(tokens) for tokens in corpus_tokens]
+        for candidate in candidates:
+            tokens = tokenizer.tokenize(candidate)
+            precision, recall, fmeasure = lcs_scores(
+                matrix.encode(tokens), matrix.matrix, matrix.lengths
+            )
+            for i, reference in enumerate(corpus_tokens):
+                expected = rouge_scorer._score_lcs(tokens, reference)
+                # exact, not approximate, equality
+                assert precision[i] == expected.precision
+                assert recall[i] == expected.recall
+                assert fmeasure[i] == expected.fmeasure
+
+    def test_matrix_grows(self):
+        matrix = TokenMatrix()
+        for n in range(1, 40):
+            matrix.add(["word"] * n)
+        assert matrix.matrix.shape == (39, 39)
+        assert list(lcs_lengths(matrix.encode(["word"] * 5), matrix.matrix)) == [
+            min(n, 5) for n in range(1, 40)
+        ]
+        assert list(matrix.encode(["word", "unseen"])) == [0, similarity.UNKNOWN_ID]
+
+
+class TestOverlapIndex:
+    """Test collection for the OverlapIndex prefilter."""
+
+    def test_upper_bounds(self):
+        corpus = _instructions(60) + ["", "cat cat cat dog"]
+        candidates = _instructions(15, seed=11) + ["", "cat dog cat", "zebra"]
+        tokenizer = rouge_scorer.RougeScorer(["rougeL"])._tokenizer
+        corpus_tokens = [tokenizer.tokenize(inst) for inst in corpus]
+        matrix = TokenMatrix()
+        index = OverlapIndex()
+        for tokens in corpus_tokens:
+            index.add(matrix.add(tokens))
+        assert len(index) == len(corpus)
+        for candidate in candidates:
+            tokens = tokenizer.tokenize(candidate)
+            token_ids = matrix.encode(tokens)
+            bounds = index.upper_bounds(token_ids)
+            scores = [
+                rouge_scorer._score_lcs(tokens, reference).fmeasure
+                for reference in corpus_tokens
+            ]
+            for bound, score in zip(bounds, scores):
+                assert score <= bound + similarity.BOUND_TOLERANCE
+            for threshold in (0.2, 0.5, 0.8):
+                above = {i for i, score in enumerate(scores) if score > threshold}
+                assert above <= set(index.candidates(token_ids, threshold))
+
+    def test_identical_entries_are_candidates(self):
+        index = OverlapIndex()
+        index.add([0, 1, 0])
+        index.add([2])
+        assert list(index.upper_bounds([1, 0, 0])) == [1.0, 0.0]
+        assert list(index.candidates([1, 0, 0], 1.0)) == [0]
+        assert list(index.upper_bounds([similarity.UNKNOWN_ID, 5])) == [0.0, 0.0]
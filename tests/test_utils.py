@@ -1,16 +1,23 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import time
 
 # Third Party
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 import git
 import pytest
 import yaml
 
 # First Party
 from instructlab import utils
+from instructlab.taxonomy_cache import TaxonomyCache
 
 # Local
 from .testdata import testdata
@@ -57,18 +64,489 @@ class TestUtils:
         for chunk in chunks:
             assert len(chunk) <= max_chars
 
-    @patch(
-        "instructlab.utils.git_clone_checkout",
-        return_value=Mock(spec=git.Repo, working_dir="tests/testdata/temp_repo"),
-    )
-    def test_get_document(self, git_clone_checkout):
+    def test_chunk_docs_token_counter(self):
+        def count_words(text):
+            return len(text.split())
+
+        chunk_words = 50
+        chunks = utils.chunk_document(
+            documents=testdata.documents,
+            chunk_word_count=chunk_words,
+            server_ctx_size=4096,
+            token_counter=count_words,
+        )
+        assert len(chunks) > len(testdata.documents)
+        max_tokens = utils.num_tokens_from_words(chunk_words)
+        for chunk in chunks:
+            assert count_words(chunk) <= max_tokens
+
+    def test_chunk_docs_whole(self):
+        words = "river mountain valley ocean forest desert island canyon glacier meadow"
+        words = words.split()
+        paragraphs = [
+            " ".join(f"{words[(i + j) % 10]}{i}" for j in range(4 + i % 3))
+            for i in range(12)
+        ]
+        document = "".join(p + "\n\n" for p in paragraphs)
+        chunks = utils.chunk_document(
+            documents=[document, paragraphs[0]],
+            chunk_word_count=30,
+            server_ctx_size=4096,
+        )
+        # documents are split as a whole, the chunks overlapping all along
+        expected = [
+            "\n\n".join(paragraphs[i:j])
+            for i, j in [(0, 4), (2, 5), (3, 6), (4, 7), (5, 8), (6, 9), (7, 10)]
+            + [(8, 11), (9, 12)]
+        ]
+        assert chunks == expected + [paragraphs[0]]
+
+        # however large, like langchain splits them
+        chunk_words = 100
+        splitter = RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", " "],
+            chunk_size=utils.num_chars_from_tokens(
+                utils.num_tokens_from_words(chunk_words)
+            ),
+            chunk_overlap=utils.DEFAULT_CHUNK_OVERLAP,
+        )
+        document = "".join(
+            f"Paragraph {i} " + "word " * (i % 50) + ("\n\n" if i % 3 else "\n")
+            for i in range(10000)
+        )
+        assert utils.chunk_document(
+            documents=[document], chunk_word_count=chunk_words, server_ctx_size=4096
+        ) == [d.page_content for d in splitter.create_documents([document])]
+
+    def test_get_document(self, tmp_path):
+        docs_repo = _docs_repo(tmp_path / "docs_repo")
         with open(
             "tests/testdata/knowledge_valid.yaml", "r", encoding="utf-8"
         ) as qnafile:
-            documents = utils.get_documents(
-                source=yaml.safe_load(qnafile).get("document"),
-                skip_checkout=True,
-                logger=logging.getLogger("_test_"),
+            source = yaml.safe_load(qnafile).get("document")
+        source.update(repo=docs_repo.working_dir, commit=docs_repo.head.commit.hexsha)
+        documents = utils.get_documents(
+            source=source,
+            logger=logging.getLogger("_test_"),
+        )
+        assert len(documents) == 2
+
+    def test_get_documents_mirror(self, tmp_path):
+        docs_repo = _docs_repo(tmp_path / "docs_repo")
+        first = docs_repo.head.commit.hexsha
+        (tmp_path / "docs_repo/docs/new.md").write_text("new", encoding="utf-8")
+        docs_repo.index.add(["docs/new.md"])
+        second = docs_repo.index.commit("Add a document").hexsha
+        repo_url = f"file://{docs_repo.working_dir}"
+        logger = logging.getLogger("_test_")
+
+        def get_documents(commit, patterns):
+            return utils.get_documents(
+                logger, {"repo": repo_url, "commit": commit, "patterns": patterns}
+            )
+
+        utils._read_documents.cache_clear()
+        with patch(
+            "instructlab.utils._fetch_commit", wraps=utils._fetch_commit
+        ) as fetch_commit:
+            assert get_documents(first, ["docs/*.md"]) == ["skill"]
+            assert get_documents(first, ["docs/*.md"]) == ["skill"]
+            assert fetch_commit.call_count == 1
+        assert get_documents(second[:7], ["*.md", "docs/*.md"]) == [
+            "knowledge\n",
+            "new",
+            "skill",
+        ]
+        # commits are read from the mirror once fetched
+        shutil.rmtree(docs_repo.working_dir)
+        utils._read_documents.cache_clear()
+        assert get_documents(first, ["docs/*.md", "*.txt"]) == ["skill"]
+        with pytest.raises(SystemExit, match="Couldn't find knowledge documents"):
+            get_documents(first, ["*.txt"])
+
+    def test_get_documents_refs(self, tmp_path):
+        docs_repo = _docs_repo(tmp_path / "docs_repo")
+        branch = docs_repo.active_branch.name
+        logger = logging.getLogger("_test_")
+
+        def get_documents(repo, commit):
+            utils._read_documents.cache_clear()
+            return utils.get_documents(
+                logger, {"repo": repo, "commit": commit, "patterns": ["docs/*.md"]}
+            )
+
+        assert get_documents(docs_repo.working_dir, branch) == ["skill"]
+        (tmp_path / "docs_repo/docs/new.md").write_text("new", encoding="utf-8")
+        docs_repo.index.add(["docs/new.md"])
+        docs_repo.index.commit("Add a document")
+        # a branch resolves to where it is now, not where it was last fetched
+        assert get_documents(docs_repo.working_dir, branch) == ["new", "skill"]
+
+        # fetching a full hash into a new mirror fetches the history before it,
+        # which later abbreviated hashes resolve to
+        history_repo = _docs_repo(tmp_path / "history_repo")
+        first = history_repo.head.commit.hexsha
+        (tmp_path / "history_repo/docs/new.md").write_text("new", encoding="utf-8")
+        history_repo.index.add(["docs/new.md"])
+        history_repo.index.commit("Add a document")
+        latest = history_repo.head.commit.hexsha
+        assert get_documents(history_repo.working_dir, latest) == ["new", "skill"]
+        assert get_documents(history_repo.working_dir, first[:7]) == ["skill"]
+
+        # fetching another repository removes the mirrors unused for long
+        mirror_path = utils._mirror_path(docs_repo.working_dir)
+        old = time.time() - utils.MIRROR_MAX_AGE - 1
+        os.utime(f"{mirror_path}.lock", (old, old))
+        other_repo = _docs_repo(tmp_path / "other_repo")
+        assert get_documents(other_repo.working_dir, branch) == ["skill"]
+        assert not mirror_path.exists()
+        assert utils._mirror_path(other_repo.working_dir).exists()
+
+    def test_lint_yaml_files(self, tmp_path):
+        valid = tmp_path / "valid" / "qna.yaml"
+        invalid = tmp_path / "invalid" / "qna.yaml"
+        for path, source in (
+            (valid, "tests/testdata/skill_valid_answer.yaml"),
+            (invalid, "tests/testdata/invalid_yaml.yaml"),
+        ):
+            path.parent.mkdir()
+            path.write_bytes(pathlib.Path(source).read_bytes())
+        logger = logging.getLogger("_test_")
+
+        with patch(
+            "instructlab.utils.subprocess.check_output",
+            wraps=subprocess.check_output,
+        ) as check_output:
+            problems = utils.lint_yaml_files(logger, [valid, invalid])
+            check_output.assert_called_once()
+        assert problems[valid] == []
+        assert len(problems[invalid]) == 1
+        assert "line too long" in problems[invalid][0]
+        # the batch reports the same problems as linting each file on its own
+        with patch("instructlab.utils.YAMLLINT_BATCH_SIZE", 1):
+            assert utils.lint_yaml_files(logger, [valid, invalid]) == problems
+
+        with patch(
+            "instructlab.utils.subprocess.check_output",
+            wraps=subprocess.check_output,
+        ) as check_output:
+            data, warnings, errors = utils.read_taxonomy_file(
+                logger, str(invalid), lint_problems=problems
             )
-            git_clone_checkout.assert_called_once()
-            assert len(documents) == 2
+            check_output.assert_not_called()
+        assert (data, warnings, errors) == (None, 0, 1)
+
+        # yamllint failing without reporting problems fails every file
+        rules = tmp_path / "rules.yaml"
+        rules.write_text("rules: {line-length: {max: not-a-number}}\n")
+        problems = utils.lint_yaml_files(logger, [valid, invalid], str(rules))
+        for path in (valid, invalid):
+            assert len(problems[path]) == 1
+            assert problems[path][0].startswith("yamllint failed: ")
+        data, warnings, errors = utils.read_taxonomy_file(
+            logger, str(valid), lint_problems=problems
+        )
+        assert (data, warnings, errors) == (None, 0, 1)
+
+    @pytest.mark.parametrize("jobs", [2, 3])
+    def test_read_taxonomy_jobs(self, taxonomy_dir, caplog, jobs):
+        for i, source in enumerate(
+            [
+                "skill_valid_answer.yaml",
+                "invalid_yaml.yaml",
+                "skill_valid_answer.yaml",
+                "skill_incomplete.yaml",
+                "skill_valid_answer.yaml",
+            ]
+        ):
+            taxonomy_dir.create_untracked(
+                f"compositional_skills/skill{i}/qna.yaml",
+                pathlib.Path("tests/testdata", source).read_bytes(),
+            )
+        logger = logging.getLogger("_test_read_taxonomy_")
+        logger.setLevel(logging.INFO)
+
+        def read(jobs):
+            caplog.clear()
+            with pytest.raises(SystemExit, match="2 taxonomy files with errors"):
+                utils.read_taxonomy(logger, taxonomy_dir.root, "main", None, jobs)
+            return [(r.levelno, r.getMessage()) for r in caplog.records]
+
+        serial = read(1)
+        assert any("skill1/qna.yaml" in message for _, message in serial)
+        assert any("skill3/qna.yaml" in message for _, message in serial)
+        # the same messages, in the same order
+        assert read(jobs) == serial
+
+    def test_read_taxonomy_jobs_data(self, taxonomy_dir):
+        for i in range(4):
+            taxonomy_dir.create_untracked(
+                f"compositional_skills/skill{i}/qna.yaml",
+                pathlib.Path("tests/testdata/skill_valid_answer.yaml").read_bytes(),
+            )
+        logger = logging.getLogger("_test_read_taxonomy_")
+        serial = utils.read_taxonomy(logger, taxonomy_dir.root, "main", None)
+        assert len(serial) == 4 * 5
+        assert utils.read_taxonomy(logger, taxonomy_dir.root, "main", None, 2) == serial
+
+    def test_read_taxonomy_cache(self, taxonomy_dir, caplog, monkeypatch, tmp_path):
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+        for i, source in enumerate(
+            ["skill_valid_answer.yaml", "skill_incomplete.yaml"]
+        ):
+            taxonomy_dir.create_untracked(
+                f"compositional_skills/skill{i}/qna.yaml",
+                pathlib.Path("tests/testdata", source).read_bytes(),
+            )
+        logger = logging.getLogger("_test_read_taxonomy_")
+        logger.setLevel(logging.INFO)
+
+        def read(yaml_rules=None):
+            caplog.clear()
+            with patch(
+                "instructlab.utils.read_taxonomy_file", wraps=utils.read_taxonomy_file
+            ) as read_taxonomy_file:
+                with pytest.raises(SystemExit, match="1 taxonomy files with errors"):
+                    utils.read_taxonomy(
+                        logger, taxonomy_dir.root, "main", yaml_rules, use_cache=True
+                    )
+            messages = [(r.levelno, r.getMessage()) for r in caplog.records]
+            return read_taxonomy_file.call_count, messages
+
+        calls, messages = read()
+        assert calls == 2
+        assert any("skill1/qna.yaml" in message for _, message in messages)
+        # cached results are reported the same way
+        assert read() == (0, messages)
+        # changing the content, or the rules, misses the cache
+        taxonomy_dir.create_untracked(
+            "compositional_skills/skill0/qna.yaml",
+            b"# edited\n"
+            + pathlib.Path("tests/testdata/skill_valid_answer.yaml").read_bytes(),
+        )
+        assert read()[0] == 1
+        rules = tmp_path / "rules.yaml"
+        rules.write_text("extends: relaxed\n", encoding="utf-8")
+        assert read(str(rules))[0] == 2
+
+    def test_taxonomy_cache_prune(self, tmp_path):
+        cache = TaxonomyCache("rules", cache_dir=tmp_path, max_entries=2)
+        files = []
+        for i in range(3):
+            files.append(tmp_path / f"qna{i}.yaml")
+            files[i].write_text(f"version: {i}\n", encoding="utf-8")
+        keys = [cache.key(f) for f in files]
+        assert len(set(keys)) == 3
+        for i, key in enumerate(keys):
+            cache.put(key, [None, i, 0], [])
+            os.utime(tmp_path / f"{key}.json", (i, i))
+        # reading an entry makes it the most recently used
+        assert cache.get(keys[0]) == ((None, 0, 0), [])
+        cache.prune()
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) == ((None, 2, 0), [])
+        assert len(list(tmp_path.glob("*.json"))) == 2
+
+
+def _docs_repo(path):
+    """Create a repository of knowledge documents."""
+    repo = git.Repo.init(path)
+    (path / "docs").mkdir()
+    (path / "docs/skill.md").write_text("skill", encoding="utf-8")
+    (path / "docs/.hidden.md").write_text("hidden", encoding="utf-8")
+    (path / "knowledge.md").write_text("knowledge\r\n", encoding="utf-8")
+    (path / "notes.txt").write_text("notes", encoding="utf-8")
+    repo.index.add(["docs/skill.md", "docs/.hidden.md", "knowledge.md", "notes.txt"])
+    repo.index.commit("Add documents")
+    return repo
+
+
+def _schema_mutations(contents):
+    """Yield the document and variants of it that break it in different ways."""
+    yield contents
+    yield {**contents, "version": 1}
+    yield {**contents, "version": "2"}
+    yield {**contents, "unknown": "field"}
+    for key, value in contents.items():
+        yield {k: v for k, v in contents.items() if k != key}
+        # get_version() only handles ints and strings
+        wrongs = (
+            ("", True) if key == "version" else ("", 1, True, None, [], {}, [value])
+        )
+        for wrong in wrongs:
+            yield {**contents, key: wrong}
+    examples = contents["seed_examples"]
+    yield {**contents, "seed_examples": examples[:-1]}
+    yield {**contents, "seed_examples": examples + examples[:1]}
+    for key in examples[0]:
+        for wrong in ("", 1, None, {k: 1 for k in examples[0]}):
+            yield {
+                **contents,
+                "seed_examples": [{**examples[0], key: wrong}] + examples[1:],
+            }
+    yield {**contents, "seed_examples": [{**examples[0], "extra": "x"}] + examples[1:]}
+    if "document" in contents:
+        document = contents["document"]
+        for key in document:
+            yield {
+                **contents,
+                "document": {k: v for k, v in document.items() if k != key},
+            }
+            yield {**contents, "document": {**document, key: [""]}}
+        yield {**contents, "document": {**document, "patterns": ["*.md", "*.md"]}}
+
+
+@pytest.mark.parametrize(
+    "source, taxonomy_path",
+    [
+        ("skill_valid_answer.yaml", "compositional_skills/skill/qna.yaml"),
+        ("skill_invalid_answer.yaml", "compositional_skills/skill/qna.yaml"),
+        ("skill_incomplete.yaml", "compositional_skills/skill/qna.yaml"),
+        ("knowledge_valid.yaml", "knowledge/topic/qna.yaml"),
+        ("skill_valid_answer.yaml", "skill/qna.yaml"),
+    ],
+)
+def test_validate_yaml_fast_path(caplog, source, taxonomy_path):
+    pytest.importorskip("fastjsonschema")
+    with open(pathlib.Path("tests/testdata", source), encoding="utf-8") as f:
+        contents = yaml.safe_load(f)
+    logger = logging.getLogger("_test_validate_yaml_")
+
+    def validate(fast):
+        results = []
+        utils._schema_validators.cache_clear()
+        with patch(
+            "instructlab.utils._fast_validator",
+            wraps=utils._fast_validator if fast else lambda *args: None,
+        ):
+            for document in _schema_mutations(contents):
+                caplog.clear()
+                errors = utils.validate_yaml(
+                    logger, document, pathlib.Path(taxonomy_path)
+                )
+                results.append((errors, caplog.messages))
+            assert utils._schema_validators(2, "knowledge")[1] is not None or not fast
+        utils._schema_validators.cache_clear()
+        return results
+
+    results = validate(fast=True)
+    assert results == validate(fast=False)
+    assert any(errors for errors, _ in results)
+
+
+def test_get_taxonomy_diff_merged_base(taxonomy_dir):
+    repo = git.Repo(taxonomy_dir.root)
+    taxonomy_dir.add_tracked("compositional_skills/base/qna.yaml")
+    base_commit = repo.head.commit.hexsha
+    repo.git.checkout("-b", "feature")
+    taxonomy_dir.add_tracked("compositional_skills/feature/qna.yaml")
+    repo.git.checkout("main")
+    taxonomy_dir.add_tracked("compositional_skills/main/qna.yaml")
+    repo.git.checkout("feature")
+    # merge main, GitPython commits don't need a git identity
+    repo.git.checkout("main", "--", "compositional_skills/main/qna.yaml")
+    repo.index.add(["compositional_skills/main/qna.yaml"])
+    repo.index.commit(
+        "Merge main", parent_commits=(repo.head.commit, repo.commit("main"))
+    )
+    taxonomy_dir.add_tracked("compositional_skills/removed/qna.yaml")
+    taxonomy_dir.remove_file("compositional_skills/removed/qna.yaml")
+    taxonomy_dir.create_untracked("compositional_skills/new/qna.yaml")
+    taxonomy_dir.create_untracked("other/qna.yaml", b"not taxonomy")
+    repo.git.update_ref("refs/remotes/origin/main", "main")
+    repo.git.symbolic_ref("refs/remotes/origin/HEAD", "refs/remotes/origin/main")
+
+    # the diff starts where HEAD's first-parent history joins the base branch,
+    # so it includes what merging the base branch brought in
+    expected = {
+        "compositional_skills/feature/qna.yaml",
+        "compositional_skills/main/qna.yaml",
+        "compositional_skills/new/qna.yaml",
+    }
+    for base in ["main", "origin/main", base_commit]:
+        assert set(utils.get_taxonomy_diff(taxonomy_dir.root, base)) == expected
+    with pytest.raises(SystemExit, match="base branch"):
+        utils.get_taxonomy_diff(taxonomy_dir.root, "origin/missing")
+
+
+def test_read_taxonomy_prefetch_documents(taxonomy_dir, tmp_path, caplog):
+    docs_repo = _docs_repo(tmp_path / "docs_repo")
+    knowledge = (
+        pathlib.Path("tests/testdata/knowledge_valid.yaml").read_text(encoding="utf-8")
+        + "\n"
+    )
+    knowledge = knowledge.replace(
+        "https://github.com/example-org/example-repo", docs_repo.working_dir
+    )
+    valid = knowledge.replace("a0c3c8e", docs_repo.head.commit.hexsha)
+    missing = knowledge.replace("a0c3c8e", "deadbeef" * 5)
+    for i, contents in enumerate([valid, missing, valid]):
+        taxonomy_dir.create_untracked(
+            f"knowledge/topic{i}/qna.yaml", contents.encode("utf-8")
+        )
+    logger = logging.getLogger("_test_read_taxonomy_")
+
+    with patch(
+        "instructlab.utils._fetch_commit", wraps=utils._fetch_commit
+    ) as fetch_commit:
+        with pytest.raises(SystemExit, match="1 taxonomy files with errors"):
+            utils.read_taxonomy(logger, taxonomy_dir.root, "main", None)
+    # each source is fetched once up front, then read from the mirror
+    prefetched = {call.args for call in fetch_commit.call_args_list[:2]}
+    assert prefetched == {
+        (docs_repo.working_dir, docs_repo.head.commit.hexsha),
+        (docs_repo.working_dir, "deadbeef" * 5),
+    }
+    errors = [r.getMessage() for r in caplog.records if r.levelno == logging.ERROR]
+    assert len(errors) == 1
+    assert errors[0].startswith(
+        f"Cannot fetch the documents of {docs_repo.working_dir}"
+    )
+    assert "knowledge/topic1/qna.yaml" in errors[0]
+
+
+def test_read_taxonomy_cache_documents(taxonomy_dir, tmp_path):
+    docs_repo = _docs_repo(tmp_path / "docs_repo")
+    branch = docs_repo.active_branch.name
+    knowledge = (
+        pathlib.Path("tests/testdata/knowledge_valid.yaml").read_text(encoding="utf-8")
+        + "\n"
+    )
+    knowledge = knowledge.replace(
+        "https://github.com/example-org/example-repo", docs_repo.working_dir
+    )
+    for name, commit in (
+        ("pinned", docs_repo.head.commit.hexsha),
+        ("branch", branch),
+        ("abbreviated", docs_repo.head.commit.hexsha[:7]),
+    ):
+        taxonomy_dir.create_untracked(
+            f"knowledge/{name}/qna.yaml",
+            knowledge.replace("a0c3c8e", commit).encode("utf-8"),
+        )
+    logger = logging.getLogger("_test_read_taxonomy_")
+
+    def read():
+        utils._read_documents.cache_clear()
+        with patch(
+            "instructlab.utils.read_taxonomy_file", wraps=utils.read_taxonomy_file
+        ) as read_taxonomy_file:
+            seeds = utils.read_taxonomy(
+                logger, taxonomy_dir.root, "main", None, use_cache=True
+            )
+        documents = {
+            seed["taxonomy_path"].split("->")[-1]: seed["document"] for seed in seeds
+        }
+        return read_taxonomy_file.call_count, documents
+
+    calls, documents = read()
+    assert calls == 3
+    assert documents["branch"] == documents["pinned"]
+    # only the file pinned to a full hash is cached
+    (tmp_path / "docs_repo/docs/new.md").write_text("new", encoding="utf-8")
+    docs_repo.index.add(["docs/new.md"])
+    docs_repo.index.commit("Add a document")
+    calls, moved = read()
+    assert calls == 2
+    assert moved["pinned"] == documents["pinned"]
+    assert moved["branch"] != documents["branch"]